@@ -0,0 +1,75 @@
+"""Summarise the FHE profiles written by the task binaries when `FHE_PROFILING=true`.
+
+Usage: python aggregate_profiles.py [PROFILE_DIR] [--csv OUTPUT_CSV]
+
+Each profile (`<uid>.<task_name>.<task_id>.profile.json`) holds the number of FHE operations
+per type and bit width and the duration of each named phase of one run. This script reports,
+per task and input size, the average operation counts and phase durations across all runs.
+"""
+
+import argparse
+import json
+
+from pathlib import Path
+
+import pandas as pd
+
+pd.set_option("display.max_columns", None)
+pd.set_option("display.width", 0)
+
+# Metadata entries holding the input size of a run, depending on the task
+INPUT_SIZE_KEYS = ["num_ciphertexts", "num_records", "num_ads"]
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("profile_dir", nargs="?", default="uploaded_files", help="Directory containing `*.profile.json` files.")
+parser.add_argument("--csv", default=None, help="Optional path where the per-run operation counts are saved.")
+args = parser.parse_args()
+
+operations, phases = [], []
+profile_paths = sorted(Path(args.profile_dir).glob("*.profile.json"))
+
+for path in profile_paths:
+    try:
+        profile = json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"⚠️ Skipping unreadable profile `{path}`: {e}")
+        continue
+
+    metadata = profile.get("metadata", {})
+    input_size = next((metadata[key] for key in INPUT_SIZE_KEYS if key in metadata), None)
+    run = {"run": path.name, "task_name": profile["task_name"], "input_size": input_size}
+
+    for op in profile.get("operations", []):
+        operations.append({**run, "operation": f"{op['op']}_{op['bits']}bits", "count": op["count"]})
+    for phase in profile.get("phases", []):
+        phases.append({**run, "phase": phase["name"], "seconds": phase["seconds"]})
+
+if not profile_paths:
+    print(f"No profile found in `{args.profile_dir}`. Make sure `FHE_PROFILING=true` is set.")
+    raise SystemExit(1)
+
+print(f"Loaded {len(profile_paths)} profiles from `{args.profile_dir}`.\n")
+
+if phases:
+    df_phases = pd.DataFrame(phases)
+    grouped = (
+        df_phases.groupby(["task_name", "input_size", "phase"], dropna=False)["seconds"]
+        .agg(["count", "mean", "std", "min", "max"])
+        .round(3)
+    )
+    print(f"Phase durations (s):\n{grouped}\n")
+
+if operations:
+    df_ops = pd.DataFrame(operations)
+    grouped = (
+        df_ops.groupby(["task_name", "input_size", "operation"], dropna=False)["count"]
+        .mean()
+        .unstack("operation")
+        .fillna(0)
+        .astype(int)
+    )
+    print(f"FHE operations per run:\n{grouped}\n")
+
+    if args.csv:
+        df_ops.to_csv(args.csv, sep=";", index=False)
+        print(f"Saved per-run operation counts in `{args.csv}`.")
@@ -18,8 +18,12 @@ echo "=============="
 for task in $TASKS; do
     cd "/build/$TASKS_DIR/$task"
 
+    # Shared Rust crate (no binary), built as a path dependency of the tasks
+    if [ -f "Cargo.toml" ] && ! grep -q '^\[\[bin\]\]' Cargo.toml; then
+        echo "Shared Rust crate: $task"
+
     # Rust task
-    if [ -f "Cargo.toml" ]; then
+    elif [ -f "Cargo.toml" ]; then
 
         echo "Building Rust task: $task"
 
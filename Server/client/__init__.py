@@ -0,0 +1,13 @@
+"""Asynchronous Python client of the FHE server (see `client/api.py`, and `python -m client --help`)."""
+
+from .api import (
+    ClientError,
+    FHEClient,
+    InvalidInputError,
+    OverloadedError,
+    Task,
+    TaskFailedError,
+    TaskNotReadyError,
+    TaskResult,
+    TimingHook,
+)
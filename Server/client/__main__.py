@@ -0,0 +1,67 @@
+"""Runs tasks on the server with a key and an encrypted input, and reports the time of each phase.
+
+Usage:
+    python -m client TASK_NAME KEY_FILE INPUT_FILE [--repeat 10] [--concurrency 10] [--url URL] [--output-dir DIR]
+
+The key is uploaded once, and its input submitted `--repeat` times. The results are saved in
+`--output-dir`, the streamed outputs as `<task_id>.<filename>` and the JSON ones as `<task_id>.json`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from collections import defaultdict
+from pathlib import Path
+
+from .api import FHEClient, TaskResult
+
+
+def save_result(result: TaskResult, output_dir: Path) -> Path:
+    if result.content is not None:
+        path = output_dir / f"{result.task.task_id}.{result.filename or 'output'}"
+        path.write_bytes(result.content)
+    else:
+        path = output_dir / f"{result.task.task_id}.json"
+        path.write_text(json.dumps(result.body), encoding="utf-8")
+    return path
+
+
+async def main(args) -> None:
+    timings = defaultdict(list)
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    async with FHEClient(args.url, hooks=[lambda phase, seconds, _: timings[phase].append(seconds)]) as client:
+        start = time.monotonic()
+        uid = await client.add_key(args.task_name, args.key)
+        print(f"🔐 Key uploaded, UID `{uid}`")
+
+        tasks = await client.start_tasks([(uid, args.task_name, args.input)] * args.repeat, args.concurrency)
+        started = [task for task in tasks if not isinstance(task, Exception)]
+        for error in (task for task in tasks if isinstance(task, Exception)):
+            print(f"❌ Submission rejected: {error}")
+
+        for result in await client.wait_for_results(started, concurrency=args.concurrency):
+            if isinstance(result, Exception):
+                print(f"❌ {result}")
+            else:
+                print(f"🎉 Task `{result.task.task_id}` completed, result saved in `{save_result(result, output_dir)}`")
+
+    print(f"\n{len(started)}/{args.repeat} tasks in {time.monotonic() - start:.1f}s")
+    for phase, values in timings.items():
+        print(f"{phase:>10}: mean {sum(values) / len(values):.2f}s, max {max(values):.2f}s ({len(values)} samples)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("task_name")
+    parser.add_argument("key", help="Server key file.")
+    parser.add_argument("input", help="Encrypted input file.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of tasks to run with the input.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Maximum number of concurrent requests.")
+    parser.add_argument("--url", default=os.environ.get("URL", "https://api.zama.ai"), help="Server URL, with its port.")
+    parser.add_argument("--output-dir", default="client_results", help="Directory of the results.")
+    asyncio.run(main(parser.parse_args()))
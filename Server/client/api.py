@@ -0,0 +1,501 @@
+"""Asynchronous client of the FHE server.
+
+One `FHEClient` holds a pool of keep-alive connections, shared by all its requests:
+
+    async with FHEClient("https://api.example.com:443") as client:
+        uid = await client.add_key("weight_stats", "alice.serverKey")
+        task = await client.start_task(uid, "weight_stats", "alice.weight_stats.input.fheencrypted")
+        result = await client.wait_for_result(task)
+
+Keys and inputs given as paths are streamed from disk. Uploads are retried on connection errors
+and 5xx responses, with an `Idempotency-Key` so that a retry never stores a key or starts a task
+twice. `upload_key` sends large keys in chunks, and resumes a failed upload where it stopped.
+Completion is tracked by polling `/get_task_status` with a backoff guided by the estimated
+finish time of the task. Timing hooks receive the duration of each phase of a task.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import random
+import tarfile
+import time
+import uuid
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import aiohttp
+
+# A key or an input: its content, or the path of a file streamed from disk
+Payload = Union[bytes, str, Path]
+# Called with the phase (`add_key`, `start_task`, `queued`, `processing`, `get_result`, or
+# `get_result_batch` for a whole batch), its duration in seconds, and the task (task_name, uid,
+# task_id, bytes)
+TimingHook = Callable[[str, float, Dict], None]
+
+COMPLETED_STATUSES = ["success", "completed"]
+FAILED_STATUSES = ["failure", "error", "revoked", "timeout"]
+# A task prefetched by a worker, but not started yet, is briefly `unknown` to the server
+UNKNOWN_GRACE_SECONDS = 30
+RETRIED_STATUS_CODES = [500, 502, 503, 504]
+# Tasks per request to the batch endpoints (`BATCH_MAX_TASKS` of the server)
+BATCH_SIZE = 100
+
+
+class ClientError(Exception):
+    """Raised when the server rejects a request.
+
+    `uid` is set when the key uploaded with rejected tasks (`submit`) was stored anyway, so that
+    the tasks can be retried with it.
+    """
+
+    def __init__(self, status: int, detail: str, retry_after: Optional[float] = None, uid: Optional[str] = None):
+        super().__init__(f"{status}: {detail}")
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+        self.uid = uid
+
+
+class OverloadedError(ClientError):
+    """Raised when the server is too busy to admit a task (429). `retry_after` is in seconds."""
+
+
+class InvalidInputError(ClientError):
+    """Raised when the encrypted input does not match the task or the key (422)."""
+
+
+class TaskNotReadyError(Exception):
+    """Raised when the result of a task that has not completed is requested."""
+
+
+class TaskFailedError(Exception):
+    """Raised when a task ends without a result (failure, timeout, revoked or lost)."""
+
+    def __init__(self, task: "Task", status: str, details: str = ""):
+        super().__init__(f"Task `{task.task_id}` ended with status `{status}`: {details}")
+        self.task = task
+        self.status = status
+        self.details = details
+
+
+@dataclass
+class Task:
+    """A submitted task."""
+
+    uid: str
+    task_name: str
+    task_id: str
+    input_bytes: Optional[int] = None
+    submitted_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+
+
+@dataclass
+class TaskResult:
+    """The result of a completed task: `content` for the streamed tasks, `body` for the JSON ones.
+
+    Results fetched in batch (`get_results`) also have the raw output files in `outputs`, by key
+    for the JSON tasks and under `output` for the streamed ones.
+    """
+
+    task: Task
+    status: str
+    content: Optional[bytes] = None
+    body: Optional[Dict] = None
+    filename: Optional[str] = None
+    stderr: str = ""
+    outputs: Dict[str, bytes] = field(default_factory=dict)
+
+
+def payload_size(payload: Payload) -> int:
+    return len(payload) if isinstance(payload, bytes) else Path(payload).stat().st_size
+
+
+class FHEClient:
+    """Asynchronous client of the FHE server, to be used as an async context manager.
+
+    Args:
+        url (str): The URL of the server, with its port.
+        max_connections (int): The size of the connection pool.
+        retries (int): The number of retries of a request failing with a connection error or a
+            5xx response, with exponential backoff.
+        overload_retries (int): The number of retries of a submission rejected with a 429, after
+            its `Retry-After` delay. By default, `OverloadedError` is raised at once.
+        request_timeout (float): The timeout of each request, in seconds.
+        min_poll_interval (float): The shortest delay between two status checks, in seconds.
+        max_poll_interval (float): The longest delay between two status checks, in seconds.
+        hooks (Sequence[TimingHook]): Called with the duration of each phase of a task.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_connections: int = 100,
+        retries: int = 3,
+        overload_retries: int = 0,
+        request_timeout: float = 300,
+        min_poll_interval: float = 0.5,
+        max_poll_interval: float = 10,
+        hooks: Sequence[TimingHook] = (),
+    ):
+        self.url = url.rstrip("/")
+        self.max_connections = max_connections
+        self.retries = retries
+        self.overload_retries = overload_retries
+        self.request_timeout = request_timeout
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.hooks = list(hooks)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "FHEClient":
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.request_timeout))
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+
+    def emit(self, phase: str, seconds: float, **info) -> None:
+        for hook in self.hooks:
+            hook(phase, seconds, info)
+
+    async def request(self, method: str, endpoint: str, form: Optional[Callable[[], Tuple[aiohttp.FormData, List]]] = None,
+                      idempotency_key: Optional[str] = None, **kwargs) -> Tuple[int, Mapping, bytes]:
+        """Sends a request, retried on connection errors and 5xx responses, and returns its status, headers and body.
+
+        `form` builds the multipart body of each attempt, and returns the files it opened. Other
+        bodies are given as `data`.
+
+        Raises:
+            ClientError: If the server rejects the request, or after the last retry.
+        """
+        headers = {**kwargs.pop("headers", {}), **({"Idempotency-Key": idempotency_key} if idempotency_key else {})}
+        raw_data = kwargs.pop("data", None)
+        overload_retries = self.overload_retries
+        attempt = 0
+        while True:
+            data, opened_files = form() if form else (raw_data, [])
+            try:
+                async with self.session.request(method, f"{self.url}/{endpoint}", data=data, headers=headers, **kwargs) as response:
+                    body = await response.read()
+                    if response.status < 400:
+                        return response.status, response.headers.copy(), body
+                    error = self.error_of(response, body)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = ClientError(0, f"{type(e).__name__}: {e}")
+            finally:
+                for file in opened_files:
+                    file.close()
+
+            if isinstance(error, OverloadedError) and overload_retries > 0:
+                overload_retries -= 1
+                await asyncio.sleep(error.retry_after or self.min_poll_interval)
+                continue
+            # 409: the previous attempt with the same idempotency key is still in progress
+            if error.status == 409 and idempotency_key and attempt < self.retries:
+                attempt += 1
+                await asyncio.sleep(error.retry_after or self.min_poll_interval)
+                continue
+            if (error.status == 0 or error.status in RETRIED_STATUS_CODES) and attempt < self.retries:
+                attempt += 1
+                await asyncio.sleep(min(30, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            raise error
+
+    @staticmethod
+    def error_of(response: aiohttp.ClientResponse, body: bytes) -> ClientError:
+        try:
+            detail = str(json.loads(body).get("detail", body[:200]))
+        except Exception:
+            detail = body[:200].decode("utf-8", errors="replace")
+        retry_after = response.headers.get("Retry-After")
+        error_class = {429: OverloadedError, 422: InvalidInputError}.get(response.status, ClientError)
+        return error_class(response.status, detail, float(retry_after) if retry_after else None, response.headers.get("uid"))
+
+    @staticmethod
+    def multipart(fields: List[Tuple[str, str]], files: List[Tuple[str, Payload]]) -> Callable[[], Tuple[aiohttp.FormData, List]]:
+        """Builds the multipart body of an upload, streaming the payloads given as paths."""
+        def build():
+            data = aiohttp.FormData()
+            for name, value in fields:
+                data.add_field(name, value)
+            opened_files = []
+            for name, payload in files:
+                if isinstance(payload, bytes):
+                    data.add_field(name, payload, filename=name, content_type="application/octet-stream")
+                else:
+                    opened_files.append(open(payload, "rb"))
+                    data.add_field(name, opened_files[-1], filename=Path(payload).name, content_type="application/octet-stream")
+            return data, opened_files
+        return build
+
+    async def add_key(self, task_name: str, key: Payload) -> str:
+        """Uploads a server key and returns its UID."""
+        start = time.monotonic()
+        _, _, body = await self.request(
+            "POST", "add_key", form=self.multipart([("task_name", task_name)], [("key", key)]), idempotency_key=str(uuid.uuid4()),
+        )
+        uid = json.loads(body)["uid"]
+        self.emit("add_key", time.monotonic() - start, task_name=task_name, uid=uid, task_id=None, bytes=payload_size(key))
+        return uid
+
+    async def upload_key(self, task_name: str, key: Payload) -> str:
+        """Uploads a server key in chunks, resuming after failures, and returns its UID.
+
+        Unlike `add_key`, a failed chunk only costs its own retry: the upload resumes from the
+        bytes received by the server. It gives up after `retries` failures in a row.
+        """
+        start = time.monotonic()
+        size = payload_size(key)
+        _, _, body = await self.request("POST", "start_key_upload", data={"task_name": task_name, "size": str(size)})
+        session = json.loads(body)
+        upload_id, offset, chunk_bytes = session["upload_id"], session["offset"], session["chunk_bytes"]
+
+        failures = 0
+        while offset < size:
+            if isinstance(key, bytes):
+                chunk = key[offset:offset + chunk_bytes]
+            else:
+                with open(key, "rb") as f:
+                    f.seek(offset)
+                    chunk = f.read(chunk_bytes)
+            try:
+                _, _, body = await self.request(
+                    "POST", "upload_key_chunk", data=chunk, params={"upload_id": upload_id, "offset": offset},
+                    headers={"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest()},
+                )
+                offset, failures = json.loads(body)["offset"], 0
+            except ClientError as e:
+                # 409: the chunk was already received (a lost response) or the session moved on
+                if e.status not in [0, 409, 422] + RETRIED_STATUS_CODES or failures >= self.retries:
+                    raise
+                failures += 1
+                _, _, body = await self.request("GET", "get_key_upload_status", params={"upload_id": upload_id})
+                offset = json.loads(body)["offset"]
+
+        _, _, body = await self.request("POST", "finish_key_upload", data={"upload_id": upload_id})
+        uid = json.loads(body)["uid"]
+        self.emit("add_key", time.monotonic() - start, task_name=task_name, uid=uid, task_id=None, bytes=size)
+        return uid
+
+    async def start_task(self, uid: str, task_name: str, encrypted_input: Payload) -> Task:
+        """Uploads an encrypted input and starts its task.
+
+        Raises:
+            OverloadedError: If the server is too busy to admit the task (after `overload_retries`).
+            InvalidInputError: If the input does not match the task or the key.
+        """
+        start = time.monotonic()
+        input_bytes = payload_size(encrypted_input)
+        _, _, body = await self.request(
+            "POST", "start_task", form=self.multipart([("uid", uid), ("task_name", task_name)], [("encrypted_input", encrypted_input)]),
+            idempotency_key=str(uuid.uuid4()),
+        )
+        task = Task(uid, task_name, json.loads(body)["task_id"], input_bytes)
+        self.emit("start_task", time.monotonic() - start, task_name=task_name, uid=uid, task_id=task.task_id, bytes=input_bytes)
+        return task
+
+    async def get_status(self, task: Task) -> Dict:
+        """Returns the status of a task, as returned by `/get_task_status`."""
+        _, _, body = await self.request("GET", "get_task_status", params={"task_id": task.task_id, "uid": task.uid})
+        return json.loads(body)
+
+    async def cancel(self, task: Task) -> Dict:
+        _, _, body = await self.request("POST", "cancel_task", params={"task_id": task.task_id, "uid": task.uid})
+        return json.loads(body)
+
+    async def wait(self, task: Task, timeout: Optional[float] = None) -> Dict:
+        """Polls the status of a task until it completes, and returns its last status.
+
+        The delay between two checks grows exponentially, between `min_poll_interval` and
+        `max_poll_interval`, but not past the estimated finish time of the task, when the server
+        provides one.
+
+        Raises:
+            TaskFailedError: If the task ends without a result.
+            asyncio.TimeoutError: If the task has not completed after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        unknown_since = None
+        delay = self.min_poll_interval / 2
+        while True:
+            status = await self.get_status(task)
+            state = status.get("status")
+            if state in COMPLETED_STATUSES:
+                return status
+            if state in FAILED_STATUSES:
+                raise TaskFailedError(task, state, status.get("details", ""))
+            if state == "unknown":
+                unknown_since = unknown_since or time.monotonic()
+                if time.monotonic() - unknown_since > UNKNOWN_GRACE_SECONDS:
+                    raise TaskFailedError(task, state, status.get("details", ""))
+            else:
+                unknown_since = None
+            if state == "started" and task.started_at is None:
+                task.started_at = time.monotonic()
+
+            delay = delay * 2
+            if status.get("estimated_finish_seconds") is not None:
+                delay = min(delay, status["estimated_finish_seconds"])
+            delay = min(self.max_poll_interval, max(self.min_poll_interval, delay))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise asyncio.TimeoutError(f"Task `{task.task_id}` has not completed after {timeout}s.")
+            await asyncio.sleep(delay)
+
+    async def get_result(self, task: Task) -> TaskResult:
+        """Downloads the result of a completed task.
+
+        Raises:
+            TaskNotReadyError: If the task has not completed yet.
+            TaskFailedError: If the task ended without a result.
+        """
+        start = time.monotonic()
+        params = {"task_id": task.task_id, "uid": task.uid, "task_name": task.task_name}
+        _, headers, body = await self.request("GET", "get_task_result", params=params)
+        status = headers.get("status", "success")
+        if headers.get("Content-Type", "").startswith("application/json"):
+            json_body = json.loads(body)
+            status = json_body.get("status", status)
+            if status in FAILED_STATUSES:
+                raise TaskFailedError(task, status, json_body.get("details", ""))
+            if status not in COMPLETED_STATUSES:
+                raise TaskNotReadyError(f"Task `{task.task_id}` is still `{status}`.")
+            result = TaskResult(task, status, body=json_body, stderr=json_body.get("stderr", ""))
+        else:
+            filename = headers.get("Content-Disposition", "").partition("filename=")[2] or None
+            result = TaskResult(task, status, content=body, filename=filename, stderr=headers.get("stderr", ""))
+        self.emit("get_result", time.monotonic() - start, task_name=task.task_name, uid=task.uid, task_id=task.task_id, bytes=len(body))
+        return result
+
+    async def wait_for_result(self, task: Task, timeout: Optional[float] = None) -> TaskResult:
+        """Waits for a task to complete and downloads its result."""
+        await self.wait(task, timeout)
+        completed = time.monotonic()
+        info = {"task_name": task.task_name, "uid": task.uid, "task_id": task.task_id, "bytes": task.input_bytes}
+        # Observed by polling, so precise to the polling interval; a task may also start and
+        # complete between two checks, without being seen queued, and is then processing from its
+        # submission
+        processing_from = task.submitted_at
+        if task.started_at is not None:
+            self.emit("queued", task.started_at - task.submitted_at, **info)
+            processing_from = task.started_at
+        self.emit("processing", completed - processing_from, **info)
+        return await self.get_result(task)
+
+    async def submit(self, inputs: Sequence[Tuple[str, Payload]], key: Optional[Payload] = None, uid: Optional[str] = None) -> List[Task]:
+        """Starts several tasks on one key, given as (task_name, input) pairs, in a single request.
+
+        The key is either the `uid` of a stored key, or the `key` itself, which is then uploaded
+        with the inputs, saving the round trip of `add_key`. Each task can appear once.
+
+        Returns:
+            List[Task]: The started tasks, in order.
+
+        Raises:
+            OverloadedError: If the server is too busy to admit one of the tasks.
+            InvalidInputError: If one of the inputs does not match its task or the key.
+            In both cases, none of the tasks is started, and the error has the `uid` of an uploaded key.
+        """
+        start = time.monotonic()
+        fields = [("task_name", task_name) for task_name, _ in inputs] + ([("uid", uid)] if uid else [])
+        files = [("encrypted_input", encrypted_input) for _, encrypted_input in inputs] + ([("key", key)] if key is not None else [])
+        _, _, body = await self.request("POST", "start_task", form=self.multipart(fields, files), idempotency_key=str(uuid.uuid4()))
+        response = json.loads(body)
+
+        tasks = [
+            Task(response["uid"], task_name, task_id, payload_size(encrypted_input))
+            for (task_name, encrypted_input), task_id in zip(inputs, response["task_ids"])
+        ]
+        total_bytes = sum(payload_size(payload) for _, payload in files)
+        self.emit("start_task", time.monotonic() - start, task_name=",".join(task.task_name for task in tasks), uid=response["uid"],
+                  task_id=",".join(task.task_id for task in tasks), bytes=total_bytes)
+        return tasks
+
+    async def run(self, task_name: str, key: Payload, encrypted_input: Payload, timeout: Optional[float] = None) -> TaskResult:
+        """Uploads a key with an input, in one request, and returns the result of the task."""
+        tasks = await self.submit([(task_name, encrypted_input)], key=key)
+        return await self.wait_for_result(tasks[0], timeout)
+
+    async def gather(self, coroutines: Iterable, concurrency: int) -> List:
+        """Runs coroutines with at most `concurrency` at a time, and returns their results or exceptions, in order."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines), return_exceptions=True)
+
+    async def start_tasks(self, submissions: Iterable[Tuple[str, str, Payload]], concurrency: Optional[int] = None) -> List:
+        """Starts a batch of tasks, given as (uid, task_name, input) tuples.
+
+        Returns:
+            List: The `Task` of each submission, or the exception that rejected it, in order.
+        """
+        return await self.gather(
+            (self.start_task(uid, task_name, encrypted_input) for uid, task_name, encrypted_input in submissions),
+            concurrency or self.max_connections,
+        )
+
+    async def batch(self, tasks: Iterable[Task], fetch, concurrency: Optional[int]) -> List:
+        """Calls `fetch` on chunks of `BATCH_SIZE` tasks, and returns the flattened results, or the
+        exception raised by the chunk of each task, in order."""
+        tasks = list(tasks)
+        chunks = [tasks[i:i + BATCH_SIZE] for i in range(0, len(tasks), BATCH_SIZE)]
+        results = []
+        for chunk, chunk_results in zip(chunks, await self.gather((fetch(chunk) for chunk in chunks), concurrency or self.max_connections)):
+            results += [chunk_results] * len(chunk) if isinstance(chunk_results, Exception) else chunk_results
+        return results
+
+    async def get_statuses(self, tasks: Iterable[Task], concurrency: Optional[int] = None) -> List:
+        """Returns the status of each task, or the exception raised while fetching it, in order.
+
+        Uses one `/get_task_status_batch` request per `BATCH_SIZE` tasks.
+        """
+        async def fetch(chunk: List[Task]) -> List[Dict]:
+            body = {"tasks": [{"task_id": task.task_id, "uid": task.uid} for task in chunk]}
+            _, _, response = await self.request("POST", "get_task_status_batch", json=body)
+            return json.loads(response)["tasks"]
+
+        return await self.batch(tasks, fetch, concurrency)
+
+    async def get_results(self, tasks: Iterable[Task], concurrency: Optional[int] = None) -> List:
+        """Downloads the results of many tasks, with one `/get_task_result_batch` request per `BATCH_SIZE` tasks.
+
+        Returns:
+            List: The `TaskResult` of each task, or a `TaskNotReadyError` or `TaskFailedError`, in order.
+        """
+        async def fetch(chunk: List[Task]) -> List:
+            start = time.monotonic()
+            body = {"tasks": [{"task_id": task.task_id, "uid": task.uid, "task_name": task.task_name} for task in chunk]}
+            _, _, archive = await self.request("POST", "get_task_result_batch", json=body)
+            with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+                manifest = json.load(tar.extractfile("manifest.json"))["tasks"]
+                members = {member.name: tar.extractfile(member).read() for member in tar.getmembers() if member.name != "manifest.json"}
+
+            results = []
+            for task, entry in zip(chunk, manifest):
+                status = entry["status"]
+                if status in FAILED_STATUSES:
+                    results.append(TaskFailedError(task, status, entry.get("details", "")))
+                elif status not in COMPLETED_STATUSES:
+                    results.append(TaskNotReadyError(f"Task `{task.task_id}` is still `{status}`."))
+                else:
+                    outputs = {key: members[name] for key, name in entry["files"].items()}
+                    results.append(TaskResult(
+                        task, status, content=outputs.get("output"), body=entry, filename=Path(entry["files"].get("output", "")).name or None,
+                        stderr=entry.get("stderr", ""), outputs=outputs,
+                    ))
+            self.emit("get_result_batch", time.monotonic() - start, task_name=None, uid=None, task_id=None, bytes=len(archive))
+            return results
+
+        return await self.batch(tasks, fetch, concurrency)
+
+    async def wait_for_results(self, tasks: Iterable[Task], timeout: Optional[float] = None, concurrency: Optional[int] = None) -> List:
+        """Waits for a batch of tasks, and returns the `TaskResult` of each task, or its exception, in order."""
+        return await self.gather((self.wait_for_result(task, timeout) for task in tasks), concurrency or self.max_connections)
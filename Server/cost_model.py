@@ -0,0 +1,301 @@
+"""Online model of the task execution times, shared by the Celery workers and the API server.
+
+Workers record the execution time of every completed task in the Redis backend data-base, per
+task type and per input size bucket. The server combines these estimates with the content of the
+`usecases` queues and the tasks currently running to predict when a task will start and finish.
+"""
+
+import ast
+import json
+import os
+import time
+
+from typing import Dict, List, Optional
+
+from key_cache import KEY_WARMUP_TASK_NAME
+from routing import usecase_queue_names
+from utils import format_input_filename, logger, use_cases
+from worker_registry import USECASE_QUEUE, registered_workers
+
+# Redis hashes holding the running estimate (`mean` in seconds and `count`) of each task, overall
+# and per input size bucket, and the lists of the most recent execution times per bucket
+COST_KEY_TEMPLATE = "task_cost:{}"
+BUCKET_COST_KEY_TEMPLATE = "task_cost:{}:{}"
+SAMPLES_KEY_TEMPLATE = "task_cost_samples:{}:{}"
+
+# Header of the Celery messages of `run_binary_task` holding the size of the encrypted input, set by
+# `/start_task`, so that the server never has to look for the input file of a queued task
+INPUT_SIZE_HEADER = "input_size"
+
+# Redis hash of the tasks currently executed by a worker, by task ID
+RUNNING_TASKS_KEY = "running_tasks"
+# Entries left behind by a crashed worker are ignored after this delay, in seconds
+RUNNING_TASK_MAX_AGE = 24 * 60 * 60
+
+# Weight of the latest execution time in the exponentially weighted mean
+COST_MODEL_EWMA_ALPHA = float(os.getenv("COST_MODEL_EWMA_ALPHA", "0.2"))
+
+# Number of recent execution times kept per bucket to compute quantiles
+COST_MODEL_SAMPLES = int(os.getenv("COST_MODEL_SAMPLES", "100"))
+
+# Execution time assumed for tasks that have never been run
+DEFAULT_TASK_SECONDS = float(os.getenv("ADMISSION_DEFAULT_TASK_SECONDS", "60"))
+
+# Number of tasks of the `usecases` queue that can run at the same time, assumed while no live
+# `usecases` worker is registered (see `worker_capacity`)
+DEFAULT_WORKER_CAPACITY = max(
+    1,
+    int(os.getenv("CELERY_WORKER_COUNT_USECASE_QUEUE", "1"))
+    * int(os.getenv("CELERY_WORKER_CONCURRENCY_USECASE_QUEUE", "1")),
+)
+
+# Atomic EWMA update, since several workers may complete the same task type concurrently
+_EWMA_UPDATE_SCRIPT = """
+local x = tonumber(ARGV[1])
+local alpha = tonumber(ARGV[2])
+local mean = tonumber(redis.call('HGET', KEYS[1], 'mean'))
+if mean then
+    mean = mean + alpha * (x - mean)
+else
+    mean = x
+end
+redis.call('HSET', KEYS[1], 'mean', tostring(mean))
+redis.call('HINCRBY', KEYS[1], 'count', 1)
+return tostring(mean)
+"""
+
+
+def size_bucket(input_size: Optional[int]) -> Optional[int]:
+    """Maps an input size in bytes to its power-of-two bucket.
+
+    For a given task, the size of the encrypted input grows linearly with the number of
+    ciphertexts, so inputs of the same bucket have comparable execution times.
+    """
+    if input_size is None:
+        return None
+    return int(input_size).bit_length()
+
+
+def input_size_of(uid: str, task_name: str) -> Optional[int]:
+    """Returns the size in bytes of the encrypted input of a task, if it exists on this host (i.e.
+    on the worker that fetched it)."""
+    try:
+        return format_input_filename(uid, task_name).stat().st_size
+    except Exception:
+        return None
+
+
+def record_execution_time(redis_client, task_name: str, execution_time: float, input_size: Optional[int] = None) -> None:
+    """Updates the execution time estimates of a task with a new measurement.
+
+    Args:
+        redis_client: The Redis backend data-base.
+        task_name (str): The name of the completed task.
+        execution_time (float): Its execution time in seconds.
+        input_size (Optional[int]): The size of its encrypted input in bytes, if known.
+    """
+    mean = redis_client.eval(_EWMA_UPDATE_SCRIPT, 1, COST_KEY_TEMPLATE.format(task_name), execution_time, COST_MODEL_EWMA_ALPHA)
+
+    bucket = size_bucket(input_size)
+    if bucket is not None:
+        redis_client.eval(_EWMA_UPDATE_SCRIPT, 1, BUCKET_COST_KEY_TEMPLATE.format(task_name, bucket), execution_time, COST_MODEL_EWMA_ALPHA)
+        samples_key = SAMPLES_KEY_TEMPLATE.format(task_name, bucket)
+        pipe = redis_client.pipeline()
+        pipe.lpush(samples_key, execution_time)
+        pipe.ltrim(samples_key, 0, COST_MODEL_SAMPLES - 1)
+        pipe.execute()
+
+    logger.debug(f"📈 Cost model for `{task_name}` (bucket=`{bucket}`) updated with `{execution_time:.2f}`s → mean=`{float(mean):.2f}`s")
+
+
+def expected_execution_time(redis_client, task_name: str, input_size: Optional[int] = None) -> float:
+    """Returns the expected execution time of a task, in seconds.
+
+    Uses the estimate of the task's input size bucket if there is one, then the estimate over all
+    sizes. For a task that has never been run, falls back to the `admission.expected_seconds` of
+    its configuration, then to `ADMISSION_DEFAULT_TASK_SECONDS`.
+    """
+    bucket = size_bucket(input_size)
+    if bucket is not None:
+        mean = redis_client.hget(BUCKET_COST_KEY_TEMPLATE.format(task_name, bucket), "mean")
+        if mean is not None:
+            return float(mean)
+    mean = redis_client.hget(COST_KEY_TEMPLATE.format(task_name), "mean")
+    if mean is not None:
+        return float(mean)
+    admission_config = use_cases.get(task_name, {}).get("admission", {})
+    return float(admission_config.get("expected_seconds", DEFAULT_TASK_SECONDS))
+
+
+def quantile(sorted_values: List[float], q: float) -> float:
+    """Returns the `q`-quantile of sorted values, with linear interpolation."""
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def mark_task_started(redis_client, task_id: str, task_name: str, input_size: Optional[int]) -> None:
+    """Registers a task as running, so that its remaining time can be estimated."""
+    entry = {
+        "task_name": task_name,
+        "started_at": time.time(),
+        "expected_seconds": expected_execution_time(redis_client, task_name, input_size),
+    }
+    redis_client.hset(RUNNING_TASKS_KEY, task_id, json.dumps(entry))
+
+
+def mark_task_finished(redis_client, task_id: str) -> None:
+    redis_client.hdel(RUNNING_TASKS_KEY, task_id)
+
+
+def running_tasks(redis_client) -> Dict[str, Dict]:
+    """Returns the running tasks by task ID, with their expected remaining time in seconds.
+
+    A task running for longer than expected is assumed to be about to finish.
+    """
+    now = time.time()
+    tasks = {}
+    for task_id, raw in redis_client.hgetall(RUNNING_TASKS_KEY).items():
+        entry = json.loads(raw)
+        elapsed = now - entry["started_at"]
+        if elapsed > RUNNING_TASK_MAX_AGE:
+            redis_client.hdel(RUNNING_TASKS_KEY, task_id)
+            continue
+        entry["remaining_seconds"] = max(0.0, entry["expected_seconds"] - elapsed)
+        tasks[task_id] = entry
+    return tasks
+
+
+def parse_queue_message(message: Dict) -> Dict:
+    """Extracts the task ID, UID, task name and input size of a Celery message of the `usecases` queue.
+
+    `run_binary_task` is called with `(binary, uid, task_name)`, and `warm_key` with
+    `(binary, uid)`, which the message exposes through its `argsrepr` header. The input size is
+    in the `INPUT_SIZE_HEADER` header.
+    """
+    headers = message["headers"]
+    task = {"task_id": headers["id"], "uid": None, "task_name": None, "input_size": headers.get(INPUT_SIZE_HEADER)}
+    try:
+        args = ast.literal_eval(headers["argsrepr"])
+        task["uid"] = args[1]
+        task["task_name"] = KEY_WARMUP_TASK_NAME if headers.get("task") == "tasks.warm_key" else args[2]
+    except Exception:
+        pass
+    return task
+
+
+def queued_tasks(redis_broker) -> List[Dict]:
+    """Returns the tasks waiting in the shared and per-worker `usecases` queues, oldest first.
+
+    Messages are pushed at the head of a queue and consumed from its tail.
+    """
+    tasks = []
+    for queue in usecase_queue_names(redis_broker):
+        for message in reversed(redis_broker.lrange(queue, 0, -1)):
+            tasks.append({**parse_queue_message(json.loads(message)), "queue": queue})
+    return tasks
+
+
+def worker_capacity(redis_broker) -> int:
+    """Returns the number of tasks of the `usecases` queues that the live workers can run at the same time.
+
+    Sums the concurrency of the live workers of the registry that consume the shared `usecases`
+    queue, so that the estimate follows the workers as they are scaled, restarted or lost.
+    Falls back to `DEFAULT_WORKER_CAPACITY` when no such worker is registered.
+    """
+    try:
+        workers = registered_workers(redis_broker)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to read the worker registry, assuming `{DEFAULT_WORKER_CAPACITY}` execution slot(s): {e}")
+        return DEFAULT_WORKER_CAPACITY
+    capacity = sum(entry["concurrency"] for entry in workers.values() if entry["alive"] and USECASE_QUEUE in entry["queues"])
+    return capacity or DEFAULT_WORKER_CAPACITY
+
+
+def queue_snapshot(redis_broker, redis_backend) -> Dict:
+    """Estimates when each queued task will start and finish.
+
+    Tasks are served in order by the execution slots of the live workers (`worker_capacity`). The work ahead of a queued
+    task (the remaining time of the running tasks and the expected time of the tasks queued
+    before it) is assumed to be evenly shared between the slots.
+
+    Returns:
+        Dict: The worker capacity, the running tasks, the queued tasks with their estimated
+            start and finish (in seconds from now), and the predicted wait of a new task.
+    """
+    capacity = worker_capacity(redis_broker)
+    running = running_tasks(redis_backend)
+    work_ahead = sum(task["remaining_seconds"] for task in running.values())
+
+    estimates: Dict = {}
+    queue = queued_tasks(redis_broker)
+    for position, task in enumerate(queue):
+        input_size = task.pop("input_size")
+        cache_key = (task["task_name"], size_bucket(input_size))
+        if cache_key not in estimates:
+            estimates[cache_key] = expected_execution_time(redis_backend, task["task_name"], input_size)
+
+        estimated_start = work_ahead / capacity
+        task.update(
+            {
+                "position": position + 1,
+                "expected_execution_seconds": round(estimates[cache_key], 2),
+                "estimated_start_seconds": round(estimated_start, 2),
+                "estimated_finish_seconds": round(estimated_start + estimates[cache_key], 2),
+            }
+        )
+        task.pop("uid")
+        work_ahead += estimates[cache_key]
+
+    return {
+        "worker_capacity": capacity,
+        "running_tasks": [{"task_id": task_id, **task} for task_id, task in running.items()],
+        "queued_tasks": queue,
+        "predicted_wait_seconds": round(work_ahead / capacity, 2),
+    }
+
+
+def predict_queue_wait(redis_broker, redis_backend) -> Dict:
+    """Predicts how long a task submitted now would wait before a worker picks it up.
+
+    Returns:
+        Dict: The number of queued tasks and the predicted wait in seconds.
+    """
+    snapshot = queue_snapshot(redis_broker, redis_backend)
+    return {"queued_tasks": len(snapshot["queued_tasks"]), "predicted_wait_seconds": snapshot["predicted_wait_seconds"]}
+
+
+def cost_model_stats(redis_client) -> Dict[str, Dict]:
+    """Returns the execution time estimates of every task, overall and per input size bucket.
+
+    Buckets are reported by their upper input size in bytes (`2 ** bucket`), with the mean and
+    the 50th and 90th percentiles of the recent execution times.
+    """
+    stats: Dict[str, Dict] = {}
+    for key in redis_client.scan_iter(COST_KEY_TEMPLATE.format("*")):
+        parts = key.split(":")
+        task_name = parts[1]
+        model = redis_client.hgetall(key)
+        entry = stats.setdefault(task_name, {"mean_seconds": None, "count": 0, "buckets": []})
+
+        if len(parts) == 2:
+            entry["mean_seconds"] = round(float(model["mean"]), 2)
+            entry["count"] = int(model["count"])
+            continue
+
+        bucket = int(parts[2])
+        samples = sorted(float(s) for s in redis_client.lrange(SAMPLES_KEY_TEMPLATE.format(task_name, bucket), 0, -1))
+        entry["buckets"].append(
+            {
+                "max_input_bytes": 2 ** bucket,
+                "mean_seconds": round(float(model["mean"]), 2),
+                "count": int(model["count"]),
+                "p50_seconds": round(quantile(samples, 0.5), 2) if samples else None,
+                "p90_seconds": round(quantile(samples, 0.9), 2) if samples else None,
+            }
+        )
+
+    for entry in stats.values():
+        entry["buckets"].sort(key=lambda b: b["max_input_bytes"])
+    return stats
@@ -0,0 +1,146 @@
+"""CPU budget shared by the task binaries of all the workers of the host.
+
+Every tfhe binary sizes its rayon pool to all the cores of the host, so concurrent tasks
+oversubscribe the CPU. Instead, each task is allocated a disjoint set of cores, which it is
+pinned to (`sched_setaffinity`) and sizes its thread pools to (`RAYON_NUM_THREADS`,
+`OMP_NUM_THREADS`). Allocations are coordinated in the Redis broker data-base, since the workers
+of several containers share the same host cores. Each machine has its own allocations, under its
+`CPU_BUDGET_HOST`, which the containers of a machine share.
+
+The number of threads of a task depends on the load: with an empty queue, a task gets as many
+free cores as its type can use (lowest latency). When tasks are waiting, the cores are split
+between the running and the queued tasks (highest throughput), within the `cpu.min_threads` and
+`cpu.max_threads` bounds of the task in `tasks.yaml`.
+"""
+
+import json
+import os
+import time
+
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from cost_model import worker_capacity
+from utils import logger, use_cases
+
+# Enables the CPU budget, otherwise binaries run unpinned with their default thread pools
+CPU_BUDGET = os.getenv("CPU_BUDGET", "false").lower() == "true"
+
+# Cores of the host available to the task binaries (all the cores of the container by default)
+AVAILABLE_CORES = sorted(os.sched_getaffinity(0))[: int(os.getenv("CPU_BUDGET_CORES", "0")) or None]
+CPU_BUDGET_CORES = len(AVAILABLE_CORES)
+
+# Name of the machine whose cores are budgeted. It must be the same for all the containers of a
+# machine, and differ between machines (unlike the hostname, which is per container)
+CPU_BUDGET_HOST = os.getenv("CPU_BUDGET_HOST", "default")
+
+# Redis hash of the cores of the machine allocated to each running task, by task ID
+ALLOCATIONS_KEY = f"cpu_allocations:{CPU_BUDGET_HOST}"
+ALLOCATIONS_LOCK = f"cpu_allocations_lock:{CPU_BUDGET_HOST}"
+# Allocations left behind by a crashed worker are released after this delay, in seconds
+ALLOCATION_MAX_AGE = 24 * 60 * 60
+
+
+def thread_bounds(task_name: str) -> Tuple[int, int]:
+    """Returns the (min, max) number of threads of a task, from its `cpu` configuration."""
+    cpu_config = use_cases.get(task_name, {}).get("cpu", {})
+    max_threads = min(int(cpu_config.get("max_threads", CPU_BUDGET_CORES)), CPU_BUDGET_CORES)
+    min_threads = max(1, min(int(cpu_config.get("min_threads", 1)), max_threads))
+    return min_threads, max_threads
+
+
+def choose_num_threads(task_name: str, num_free_cores: int, num_running: int, queue_depth: int, capacity: int) -> int:
+    """Chooses how many threads a task gets, given the current load.
+
+    Args:
+        task_name (str): The name of the task to start.
+        num_free_cores (int): The number of cores not allocated to running tasks.
+        num_running (int): The number of tasks already running.
+        queue_depth (int): The number of tasks waiting in the queue.
+        capacity (int): The number of tasks the workers can run at the same time.
+
+    Returns:
+        int: The number of threads, between the task's bounds.
+    """
+    min_threads, max_threads = thread_bounds(task_name)
+    if queue_depth > 0:
+        # Share the cores with the tasks that will start next, up to the number of execution slots
+        share = CPU_BUDGET_CORES // max(1, min(num_running + 1 + queue_depth, capacity))
+    else:
+        share = num_free_cores
+    return max(min_threads, min(max_threads, share))
+
+
+class CpuAllocation:
+    """Allocates a disjoint set of cores to a task for the duration of its execution.
+
+    Usage:
+        with CpuAllocation(redis_bd_broker, task_id, task_name, queue_depth) as allocation:
+            subprocess.run(..., env=allocation.env(os.environ), preexec_fn=allocation.pin)
+    """
+
+    def __init__(self, redis_client, task_id: str, task_name: str, queue_depth: int = 0):
+        self.redis = redis_client
+        self.task_id = task_id
+        self.task_name = task_name
+        self.queue_depth = queue_depth
+        self.cores: List[int] = []
+
+    def _allocations(self) -> List[List[int]]:
+        """Returns the cores allocated to each running task."""
+        now = time.time()
+        allocations = []
+        for task_id, raw in self.redis.hgetall(ALLOCATIONS_KEY).items():
+            allocation = json.loads(raw)
+            if now - allocation["allocated_at"] > ALLOCATION_MAX_AGE:
+                self.redis.hdel(ALLOCATIONS_KEY, task_id)
+                continue
+            allocations.append(allocation["cores"])
+        return allocations
+
+    def acquire(self) -> "CpuAllocation":
+        capacity = worker_capacity(self.redis)
+        with self.redis.lock(ALLOCATIONS_LOCK, timeout=10, blocking_timeout=10):
+            allocations = self._allocations()
+            num_running = len(allocations)
+            load = Counter(core for cores in allocations for core in cores)
+            free_cores = [core for core in AVAILABLE_CORES if core not in load]
+            num_threads = choose_num_threads(self.task_name, len(free_cores), num_running, self.queue_depth, capacity)
+
+            # If the free cores do not reach the task's minimum, share the least loaded ones
+            self.cores = free_cores[:num_threads]
+            if len(self.cores) < num_threads:
+                busy_cores = sorted(load, key=lambda core: load[core])
+                self.cores += busy_cores[: num_threads - len(self.cores)]
+
+            entry = {"task_name": self.task_name, "cores": self.cores, "allocated_at": time.time()}
+            self.redis.hset(ALLOCATIONS_KEY, self.task_id, json.dumps(entry))
+
+        logger.info(
+            f"🧮 CPU budget: `{self.task_name}` gets `{len(self.cores)}` thread(s) on cores `{self.cores}` "
+            f"(`{len(free_cores)}` free core(s), `{num_running}` running task(s), queue depth `{self.queue_depth}`)"
+        )
+        return self
+
+    def env(self, base_env: Optional[dict] = None) -> dict:
+        """Returns the environment of the binary, with its thread pools sized to its cores."""
+        env = dict(base_env or {})
+        env["RAYON_NUM_THREADS"] = str(len(self.cores))
+        env["OMP_NUM_THREADS"] = str(len(self.cores))
+        return env
+
+    def pin(self) -> None:
+        """Pins the calling process to the allocated cores (used as `preexec_fn`)."""
+        os.sched_setaffinity(0, self.cores)
+
+    def release(self) -> None:
+        try:
+            self.redis.hdel(ALLOCATIONS_KEY, self.task_id)
+        except Exception as e:
+            logger.warning(f"⚠️ CPU budget: failed to release the cores of task `{self.task_id}`: {e}")
+
+    def __enter__(self) -> "CpuAllocation":
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
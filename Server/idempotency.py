@@ -0,0 +1,123 @@
+"""Replay of the responses of retried requests, identified by an `Idempotency-Key` header.
+
+A client that retries `/add_key` or `/start_task` after a lost response (timeout, dropped
+connection) sends the same `Idempotency-Key` as the first attempt. If that attempt succeeded,
+the server returns its response again instead of storing a new key or starting the task twice.
+
+A request reserves its key (`SET NX`) before doing any work, with a hash of its content: a retry
+that arrives while the first attempt is still in flight is rejected with 409 and a `Retry-After`,
+and a key reused with a different request is rejected with 422. Responses are kept in the Redis
+backend for `IDEMPOTENCY_TTL_SECONDS`, per endpoint and key. A failed request releases its key,
+so that it can be retried; the reservation of a request that died mid-way expires after
+`IDEMPOTENCY_PENDING_TTL_SECONDS`.
+"""
+
+import hashlib
+import json
+import os
+
+from typing import Dict, List, Optional
+
+from fastapi import Header, HTTPException, UploadFile
+
+from utils import logger
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_PENDING_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_PENDING_TTL_SECONDS", "600"))
+IDEMPOTENCY_KEY_TEMPLATE = "idempotency:{}:{}"
+# Longer keys are rejected, to bound the size of the Redis keys
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+# Suggested delay before retrying a request whose first attempt is still in flight
+IDEMPOTENCY_RETRY_AFTER_SECONDS = 5
+
+PENDING = "pending"
+DONE = "done"
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+async def get_idempotency_key(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """Retrieve the optional `Idempotency-Key` header, rejecting keys that are too long."""
+    if idempotency_key is not None and len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"`Idempotency-Key` is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters.")
+    return idempotency_key or None
+
+
+async def request_hash(idempotency_key: Optional[str], fields: Dict, files: List[Optional[UploadFile]]) -> Optional[str]:
+    """Returns the SHA-256 of the form fields and the uploaded files of a request, which are
+    rewound afterwards. Only computed for the requests with an idempotency key."""
+    if not idempotency_key:
+        return None
+    digest = hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8"))
+    for file in files:
+        if file is None:
+            digest.update(b"\0")
+            continue
+        while chunk := await file.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+        await file.seek(0)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def reserve_request(redis_backend, endpoint: str, idempotency_key: Optional[str], request_hash: Optional[str]) -> Optional[Dict]:
+    """Reserves the idempotency key of a new request, or returns the response of the previous
+    request with the same key.
+
+    Returns:
+        Optional[Dict]: The response to replay, or `None` if the request must be processed.
+
+    Raises:
+        HTTPException: Raised with status code 409 if the previous request with the same key is
+            still in flight, with a `Retry-After` header.
+        HTTPException: Raised with status code 422 if the key was used for a different request.
+    """
+    if not idempotency_key:
+        return None
+    key = IDEMPOTENCY_KEY_TEMPLATE.format(endpoint, idempotency_key)
+    pending = json.dumps({"status": PENDING, "request_hash": request_hash})
+    try:
+        # The previous entry may expire between the two calls
+        for _ in range(3):
+            if redis_backend.set(key, pending, nx=True, ex=IDEMPOTENCY_PENDING_TTL_SECONDS):
+                return None
+            raw = redis_backend.get(key)
+            if raw is not None:
+                break
+        else:
+            return None
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to reserve the idempotency key of `/{endpoint}`: {e}")
+        return None
+
+    entry = json.loads(raw)
+    if entry["request_hash"] != request_hash:
+        raise HTTPException(status_code=422, detail=f"❌ `Idempotency-Key` `{idempotency_key}` was already used for a different request to `/{endpoint}`.")
+    if entry["status"] == PENDING:
+        raise HTTPException(
+            status_code=409,
+            detail=f"❌ A request to `/{endpoint}` with `Idempotency-Key` `{idempotency_key}` is still in progress, retry later.",
+            headers={"Retry-After": str(IDEMPOTENCY_RETRY_AFTER_SECONDS)},
+        )
+    return entry["response"]
+
+
+def store_response(redis_backend, endpoint: str, idempotency_key: Optional[str], request_hash: Optional[str], response: Dict) -> None:
+    """Records the response of a successful request, to be returned to its retries."""
+    if not idempotency_key:
+        return
+    entry = {"status": DONE, "request_hash": request_hash, "response": response}
+    try:
+        redis_backend.set(IDEMPOTENCY_KEY_TEMPLATE.format(endpoint, idempotency_key), json.dumps(entry), ex=IDEMPOTENCY_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to record the idempotency key of `/{endpoint}`: {e}")
+
+
+def release_request(redis_backend, endpoint: str, idempotency_key: Optional[str]) -> None:
+    """Releases the key of a failed request, so that it can be retried."""
+    if not idempotency_key:
+        return
+    try:
+        redis_backend.delete(IDEMPOTENCY_KEY_TEMPLATE.format(endpoint, idempotency_key))
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to release the idempotency key of `/{endpoint}`: {e}")
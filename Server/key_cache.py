@@ -0,0 +1,69 @@
+"""Worker-local cache of decompressed server keys.
+
+When `KEY_CACHE_DIR` is set, the Rust task binaries save the decompressed server key of each UID
+in this directory on first use (`<uid>.serverKey.decompressed`), and deserialize it directly on
+the next tasks of the same UID instead of decompressing it again. With `KEY_WARMUP`, `/add_key`
+enqueues a warm-up job that fills the cache while the client is still encrypting its input. The
+worker keeps the cache under `KEY_CACHE_MAX_BYTES`, evicting the least recently used keys.
+"""
+
+import os
+
+from pathlib import Path
+from typing import List, Optional
+
+from utils import logger
+
+KEY_CACHE_DIR = os.getenv("KEY_CACHE_DIR", "")
+KEY_CACHE_MAX_BYTES = int(os.getenv("KEY_CACHE_MAX_BYTES", str(8 * 1024 ** 3)))
+
+CACHED_KEY_SUFFIX = ".serverKey.decompressed"
+
+# Name of the warm-up jobs enqueued by `/add_key` in the cost model
+KEY_WARMUP_TASK_NAME = "key_warmup"
+# Soft and hard time limits of a warm-up job (see time_limits.py): a stopped warm-up only leaves
+# the key to be decompressed by the task itself
+KEY_WARMUP_SOFT_TIME_LIMIT_SECONDS = float(os.getenv("KEY_WARMUP_TIME_LIMIT_SECONDS", "300"))
+KEY_WARMUP_HARD_TIME_LIMIT_SECONDS = KEY_WARMUP_SOFT_TIME_LIMIT_SECONDS + 30
+
+
+def cached_key_path(uid: str) -> Optional[Path]:
+    if not KEY_CACHE_DIR:
+        return None
+    return Path(KEY_CACHE_DIR) / f"{uid}{CACHED_KEY_SUFFIX}"
+
+
+def cached_uids() -> List[str]:
+    """Returns the UIDs whose decompressed key is in the cache, most recently used first."""
+    if not KEY_CACHE_DIR or not Path(KEY_CACHE_DIR).is_dir():
+        return []
+    paths = sorted(Path(KEY_CACHE_DIR).glob(f"*{CACHED_KEY_SUFFIX}"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [p.name[: -len(CACHED_KEY_SUFFIX)] for p in paths]
+
+
+def remove_partial_cached_key(uid: str) -> None:
+    """Removes the temporary file of a decompression that was stopped before completing."""
+    if KEY_CACHE_DIR:
+        for path in Path(KEY_CACHE_DIR).glob(f"{uid}{CACHED_KEY_SUFFIX}.*.tmp"):
+            path.unlink(missing_ok=True)
+
+
+def touch_cached_key(uid: str) -> None:
+    """Marks the key of `uid` as recently used."""
+    path = cached_key_path(uid)
+    if path is not None and path.exists():
+        os.utime(path)
+
+
+def evict_key_cache() -> None:
+    """Removes the least recently used keys until the cache fits in `KEY_CACHE_MAX_BYTES`."""
+    if not KEY_CACHE_DIR or not Path(KEY_CACHE_DIR).is_dir():
+        return
+    paths = sorted(Path(KEY_CACHE_DIR).glob(f"*{CACHED_KEY_SUFFIX}"), key=lambda p: p.stat().st_mtime)
+    total_size = sum(p.stat().st_size for p in paths)
+    for path in paths:
+        if total_size <= KEY_CACHE_MAX_BYTES:
+            break
+        total_size -= path.stat().st_size
+        path.unlink(missing_ok=True)
+        logger.info(f"🗑️ Evicted the cached key `{path.name}` from the key cache.")
@@ -0,0 +1,221 @@
+"""Resumable uploads of server keys, sent in chunks.
+
+A client on a flaky connection opens an upload session with `/start_key_upload`, then sends the
+key in chunks to `/upload_key_chunk`, each with its offset and SHA-256. After a failure, it asks
+`/get_key_upload_status` for the number of bytes received, and resumes from there instead of
+sending the whole key again. `/finish_key_upload` moves the complete key into the key store
+under a new UID, as `/add_key` does.
+
+The partial key is written next to the stored keys (`<upload_id>.serverKey.part`), and the state
+of the session is kept in the Redis backend. A session expires `KEY_UPLOAD_TTL_SECONDS` after
+its last chunk; the partial keys left by expired sessions are deleted when a new upload starts.
+The partial key stays on the API host that received the first chunk, so with several API hosts,
+the requests of a session must reach the same host; only the finished key goes to the artifact
+store (see storage.py).
+"""
+
+import hashlib
+import os
+import time
+import uuid
+
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+from utils import FILES_FOLDER, artifact_store, get_id_prefix, logger, secure_path
+
+KEY_UPLOAD_CHUNK_BYTES = int(os.getenv("KEY_UPLOAD_CHUNK_BYTES", str(4 * 1024 * 1024)))
+KEY_UPLOAD_MAX_BYTES = int(os.getenv("KEY_UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+KEY_UPLOAD_TTL_SECONDS = int(os.getenv("KEY_UPLOAD_TTL_SECONDS", "3600"))
+KEY_UPLOAD_KEY_TEMPLATE = "key_upload:{}"
+KEY_UPLOAD_LOCK_TEMPLATE = "key_upload_lock:{}"
+PARTIAL_KEY_SUFFIX = ".serverKey.part"
+# Expired partial keys are looked for at most this often
+KEY_UPLOAD_SWEEP_SECONDS = 300
+
+_last_sweep = 0.0
+
+
+def partial_key_path(upload_id: str) -> Path:
+    return secure_path(FILES_FOLDER, f"{upload_id}{PARTIAL_KEY_SUFFIX}")
+
+
+def sweep_expired_uploads() -> None:
+    """Deletes the partial keys of the sessions that expired, at most every `KEY_UPLOAD_SWEEP_SECONDS`.
+
+    Each chunk refreshes both the session and the modification time of its partial key, so a
+    partial key untouched for `KEY_UPLOAD_TTL_SECONDS` belongs to an expired session.
+    """
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < KEY_UPLOAD_SWEEP_SECONDS:
+        return
+    _last_sweep = now
+
+    for path in FILES_FOLDER.glob(f"*{PARTIAL_KEY_SUFFIX}"):
+        try:
+            if now - path.stat().st_mtime > KEY_UPLOAD_TTL_SECONDS:
+                path.unlink()
+                logger.info(f"🧹 Deleted the partial key of an expired upload: `{path.name}`")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to delete the partial key `{path.name}`: {e}")
+
+
+def start_upload(redis_backend, task_name: str, size: int) -> Dict:
+    """Opens an upload session for a key of `size` bytes.
+
+    Returns:
+        Dict: The `upload_id` of the session, the `offset` to send the first chunk at and the
+            maximum size of a chunk, `chunk_bytes`.
+    """
+    if not 0 < size <= KEY_UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=400, detail=f"❌ The key size must be between 1 and {KEY_UPLOAD_MAX_BYTES} bytes, got `{size}`.")
+    sweep_expired_uploads()
+
+    upload_id = str(uuid.uuid4())
+    partial_key_path(upload_id).touch()
+    key = KEY_UPLOAD_KEY_TEMPLATE.format(upload_id)
+    pipe = redis_backend.pipeline()
+    pipe.hset(key, mapping={"task_name": task_name, "size": size, "offset": 0})
+    pipe.expire(key, KEY_UPLOAD_TTL_SECONDS)
+    pipe.execute()
+    logger.info(f"📤 Key upload `{get_id_prefix(upload_id)}` started for `{task_name}` ({size} bytes).")
+    return {"upload_id": upload_id, "offset": 0, "chunk_bytes": KEY_UPLOAD_CHUNK_BYTES}
+
+
+def upload_state(redis_backend, upload_id: str) -> Dict:
+    """Returns the state of an upload session: its `task_name`, `size`, received `offset`, and
+    the `uid` of the key once finished.
+
+    Raises:
+        HTTPException: Raised with status code 404 if the session does not exist or has expired.
+    """
+    session = redis_backend.hgetall(KEY_UPLOAD_KEY_TEMPLATE.format(upload_id))
+    if not session:
+        raise HTTPException(status_code=404, detail=f"❌ Key upload `{upload_id}` not found or expired.")
+    return {
+        "upload_id": upload_id,
+        "task_name": session["task_name"],
+        "size": int(session["size"]),
+        "offset": int(session["offset"]),
+        "uid": session.get("uid"),
+    }
+
+
+def _session_lock(redis_backend, upload_id: str):
+    """Serializes the writes to a session, which concurrent retries of a chunk could interleave."""
+    lock = redis_backend.lock(KEY_UPLOAD_LOCK_TEMPLATE.format(upload_id), timeout=60)
+    if not lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail=f"❌ Key upload `{upload_id}` is busy with another request, retry later.")
+    return lock
+
+
+def _offset_conflict(upload_id: str, message: str, offset: int) -> HTTPException:
+    return HTTPException(status_code=409, detail=f"❌ Key upload `{upload_id}`: {message}", headers={"Upload-Offset": str(offset)})
+
+
+def write_chunk(redis_backend, upload_id: str, offset: int, data: bytes, checksum: str) -> Dict:
+    """Writes a chunk of the key at `offset`, if it is intact and follows the received bytes.
+
+    A chunk is only accepted at the current offset of the session: a chunk that was already
+    received (a retry whose first response was lost) or that would leave a gap is rejected with
+    the current offset in the `Upload-Offset` header, for the client to resume from.
+
+    Returns:
+        Dict: The new `offset` of the session and the `size` of the key.
+
+    Raises:
+        HTTPException: Raised with status code 400 if the chunk is empty, too large or goes past the key size.
+        HTTPException: Raised with status code 404 if the session does not exist.
+        HTTPException: Raised with status code 409 if the offset is not the one expected, or the session is finished.
+        HTTPException: Raised with status code 422 if the SHA-256 of the chunk does not match `checksum`.
+    """
+    if not 0 < len(data) <= KEY_UPLOAD_CHUNK_BYTES:
+        raise HTTPException(status_code=400, detail=f"❌ A chunk must hold between 1 and {KEY_UPLOAD_CHUNK_BYTES} bytes, got `{len(data)}`.")
+    if hashlib.sha256(data).hexdigest() != checksum.lower():
+        raise HTTPException(status_code=422, detail=f"❌ Key upload `{upload_id}`: the chunk at offset {offset} does not match its checksum.")
+
+    lock = _session_lock(redis_backend, upload_id)
+    try:
+        state = upload_state(redis_backend, upload_id)
+        if state["uid"]:
+            raise _offset_conflict(upload_id, "the upload is already finished.", state["offset"])
+        if offset != state["offset"]:
+            raise _offset_conflict(upload_id, f"expected a chunk at offset {state['offset']}, got {offset}.", state["offset"])
+        if offset + len(data) > state["size"]:
+            raise HTTPException(status_code=400, detail=f"❌ Key upload `{upload_id}`: the chunk goes past the key size ({state['size']} bytes).")
+
+        # Overwrites the tail left by a chunk that failed while being written
+        with open(partial_key_path(upload_id), "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+        key = KEY_UPLOAD_KEY_TEMPLATE.format(upload_id)
+        pipe = redis_backend.pipeline()
+        pipe.hset(key, "offset", offset + len(data))
+        pipe.expire(key, KEY_UPLOAD_TTL_SECONDS)
+        pipe.execute()
+    finally:
+        lock.release()
+    return {"offset": offset + len(data), "size": state["size"]}
+
+
+def finish_upload(redis_backend, upload_id: str, validate_key: Callable[[str, str, Path], None]) -> Tuple[str, str, int, bool]:
+    """Moves a complete key into the key store, under a new UID, once validated.
+
+    Finishing an upload again returns the same UID, so that a finish whose response was lost
+    can be retried. The key is validated before the session is marked as finished, and an
+    invalid key ends the session. It is published to the artifact store after the session is
+    marked as finished, and again by a retry if it is missing there.
+
+    Args:
+        redis_backend: The Redis client of the sessions.
+        upload_id (str): The ID of the upload session.
+        validate_key (Callable[[str, str, Path], None]): Checks the key stored under a UID for a
+            task, and deletes it and raises an `HTTPException` if it is invalid.
+
+    Returns:
+        Tuple[str, str, int, bool]: The UID of the key, its task name, its size in bytes, and
+            whether the key was stored by this call.
+
+    Raises:
+        HTTPException: Raised with status code 404 if the session does not exist.
+        HTTPException: Raised with status code 409 if the key is not complete, with the received
+            offset in the `Upload-Offset` header.
+        HTTPException: Raised by `validate_key` if the key is invalid.
+    """
+    lock = _session_lock(redis_backend, upload_id)
+    try:
+        state = upload_state(redis_backend, upload_id)
+        if state["uid"]:
+            key_path = secure_path(FILES_FOLDER, f"{state['uid']}.serverKey")
+            if not artifact_store.exists(key_path):
+                artifact_store.publish(key_path)
+            return state["uid"], state["task_name"], state["size"], False
+        if state["offset"] != state["size"]:
+            raise _offset_conflict(upload_id, f"received {state['offset']} of {state['size']} bytes.", state["offset"])
+
+        uid = str(uuid.uuid4())
+        key_path = secure_path(FILES_FOLDER, f"{uid}.serverKey")
+        os.replace(partial_key_path(upload_id), key_path)
+        key = KEY_UPLOAD_KEY_TEMPLATE.format(upload_id)
+        try:
+            validate_key(uid, state["task_name"], key_path)
+        except HTTPException:
+            redis_backend.delete(key)
+            raise
+        pipe = redis_backend.pipeline()
+        pipe.hset(key, "uid", uid)
+        pipe.expire(key, KEY_UPLOAD_TTL_SECONDS)
+        pipe.execute()
+    finally:
+        lock.release()
+    # Outside of the lock, which a large key could outlast
+    artifact_store.publish(key_path)
+    logger.info(f"🔐 Key upload `{get_id_prefix(upload_id)}` finished ({state['size']} bytes). Assigned UID: `{uid}`")
+    return uid, state["task_name"], state["size"], True
@@ -0,0 +1,120 @@
+"""Leases of the running Celery tasks, renewed by a heartbeat.
+
+With `task_acks_late=True`, the Redis transport redelivers a message that has not been
+acknowledged within `visibility_timeout` seconds, even if a worker is still running its task.
+While a task runs, a heartbeat thread keeps its message reserved, by refreshing its timestamp in
+the `unacked_index` of the broker, and renews a lease key. A task is therefore only redelivered
+once its worker has stopped heartbeating (i.e. died), and a redelivered copy of a task whose
+lease is still alive is detected as a duplicate.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+from typing import Optional
+
+from utils import task_logger
+
+# Seconds before an unacknowledged message (or an expired lease) is considered abandoned
+VISIBILITY_TIMEOUT = int(os.getenv("TASK_VISIBILITY_TIMEOUT_SECONDS", "60"))
+# The lease is renewed several times per visibility timeout, to tolerate a missed heartbeat
+LEASE_HEARTBEAT_SECONDS = max(1, VISIBILITY_TIMEOUT // 4)
+
+LEASE_KEY_TEMPLATE = "task_lease:{}"
+
+# Keys used by the kombu Redis transport to track unacknowledged messages
+UNACKED_KEY = "unacked"
+UNACKED_INDEX_KEY = "unacked_index"
+
+# Only the owner of a lease may renew or release it
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class DuplicateTaskError(Exception):
+    """Raised when a task is delivered while another worker holds a live lease on it."""
+
+
+def find_delivery_tag(redis_broker, task_id: str) -> Optional[str]:
+    """Returns the delivery tag of the unacknowledged message of a task, if any."""
+    for delivery_tag, raw in redis_broker.hscan_iter(UNACKED_KEY):
+        try:
+            message = json.loads(raw)[0]
+        except Exception:
+            continue
+        if message.get("headers", {}).get("id") == task_id:
+            return delivery_tag
+    return None
+
+
+class TaskLease:
+    """Holds the lease of a task while it runs, and keeps its message reserved.
+
+    Usage:
+        with TaskLease(redis_bd_broker, task_id):
+            ...
+
+    Raises:
+        DuplicateTaskError: Raised on entry if another worker holds a live lease on the task.
+    """
+
+    def __init__(self, redis_broker, task_id: str):
+        self.redis = redis_broker
+        self.task_id = task_id
+        self.key = LEASE_KEY_TEMPLATE.format(task_id)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.delivery_tag: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name=f"lease-{task_id}", daemon=True)
+
+    def _acquire(self) -> bool:
+        return bool(self.redis.set(self.key, self.owner, nx=True, ex=VISIBILITY_TIMEOUT))
+
+    def __enter__(self) -> "TaskLease":
+        if not self._acquire():
+            # A live holder renews its lease every `LEASE_HEARTBEAT_SECONDS`. A lease about to
+            # expire belongs to a dead worker, whose message and lease time out together.
+            ttl = self.redis.ttl(self.key)
+            if 0 <= ttl <= LEASE_HEARTBEAT_SECONDS:
+                time.sleep(ttl + 1)
+            if not self._acquire():
+                holder = self.redis.get(self.key)
+                raise DuplicateTaskError(f"Task `{self.task_id}` is already running on `{holder}`.")
+
+        self.delivery_tag = find_delivery_tag(self.redis, self.task_id)
+        if self.delivery_tag is None:
+            task_logger.warning(f"⚠️ LEASE: No unacknowledged message found for task `{self.task_id}`, only the lease will be renewed.")
+        self._thread.start()
+        return self
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(LEASE_HEARTBEAT_SECONDS):
+            try:
+                if not self.redis.eval(_RENEW_SCRIPT, 1, self.key, self.owner, VISIBILITY_TIMEOUT):
+                    task_logger.warning(f"⚠️ LEASE: Lost the lease of task `{self.task_id}`, it may be executed twice.")
+                if self.delivery_tag is not None:
+                    # Pushes back the moment the broker considers the message abandoned
+                    self.redis.zadd(UNACKED_INDEX_KEY, {self.delivery_tag: time.time()}, xx=True)
+            except Exception as e:
+                task_logger.warning(f"⚠️ LEASE: Failed to renew the lease of task `{self.task_id}`: {e}")
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.redis.eval(_RELEASE_SCRIPT, 1, self.key, self.owner)
+        except Exception as e:
+            task_logger.warning(f"⚠️ LEASE: Failed to release the lease of task `{self.task_id}`: {e}")
@@ -0,0 +1,77 @@
+"""Summarise the resource usage of the task binaries recorded by the workers.
+
+Usage: python resource_report.py [SERVER_URL] [--cores N] [--memory-gb M] [--csv OUTPUT_CSV]
+
+Every run records its CPU time, peak memory (RSS) and disk I/O in Redis (see
+`resource_usage.py`). This script fetches the most recent runs from `/resource_stats`, and
+reports, per task and input size, the average and 90th percentile usage. Given the cores and
+memory of a worker host, it also suggests how many runs of each task fit on it concurrently.
+"""
+
+import argparse
+import math
+import os
+
+import pandas as pd
+import requests
+
+pd.set_option("display.max_columns", None)
+pd.set_option("display.width", 0)
+
+DEFAULT_URL = f"{os.getenv('URL', 'http://localhost')}:{os.getenv('FASTAPI_HOST_PORT_HTTP', '82')}"
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("url", nargs="?", default=DEFAULT_URL, help="URL of the server.")
+parser.add_argument("--cores", type=int, default=os.cpu_count(), help="Number of cores of a worker host.")
+parser.add_argument("--memory-gb", type=float, default=None, help="Memory of a worker host, in GB.")
+parser.add_argument("--csv", default=None, help="Optional path where the per-run usage is saved.")
+args = parser.parse_args()
+
+response = requests.get(f"{args.url}/resource_stats", params={"with_samples": True})
+response.raise_for_status()
+stats = response.json()
+
+runs = [{"task_name": task_name, **sample} for task_name, entry in stats.items() for sample in entry.get("samples", [])]
+if not runs:
+    print(f"No resource usage recorded on `{args.url}` yet.")
+    raise SystemExit(1)
+
+df = pd.DataFrame(runs)
+df["input_mb"] = df["input_bytes"] / 1024 ** 2
+df["peak_rss_mb"] = df["peak_rss_bytes"] / 1024 ** 2
+df["disk_mb"] = (df["disk_read_bytes"] + df["disk_write_bytes"]) / 1024 ** 2
+# Same power-of-two buckets as the cost model
+df["input_bucket_mb"] = [2 ** math.ceil(math.log2(size)) / 1024 ** 2 if size > 0 else 0 for size in df["input_bytes"]]
+
+print(f"Loaded {len(df)} runs of {df['task_name'].nunique()} task(s) from `{args.url}`.\n")
+
+grouped = (
+    df.groupby(["task_name", "input_bucket_mb"])
+    .agg(
+        runs=("wall_seconds", "count"),
+        wall_s=("wall_seconds", "mean"),
+        cpu_s=("cpu_seconds", "mean"),
+        cpu_s_p90=("cpu_seconds", lambda s: s.quantile(0.9)),
+        cores_used=("cpu_utilization", "mean"),
+        peak_rss_mb=("peak_rss_mb", "mean"),
+        peak_rss_mb_max=("peak_rss_mb", "max"),
+        disk_mb=("disk_mb", "mean"),
+    )
+    .round(2)
+)
+print(f"Resource usage per task and input size:\n{grouped}\n")
+
+# A run needs `cores_used` cores and `peak_rss_mb_max` of memory
+fits = pd.DataFrame(index=grouped.index)
+fits["by_cpu"] = (args.cores / grouped["cores_used"].clip(lower=1)).apply(math.floor)
+if args.memory_gb:
+    fits["by_memory"] = (args.memory_gb * 1024 / grouped["peak_rss_mb_max"].clip(lower=1)).apply(math.floor)
+    fits["concurrency"] = fits[["by_cpu", "by_memory"]].min(axis=1)
+else:
+    fits["concurrency"] = fits["by_cpu"]
+memory = f" and {args.memory_gb} GB" if args.memory_gb else ""
+print(f"Concurrent runs per worker host with {args.cores} cores{memory}:\n{fits}\n")
+
+if args.csv:
+    df.to_csv(args.csv, sep=";", index=False)
+    print(f"Saved per-run resource usage in `{args.csv}`.")
@@ -0,0 +1,132 @@
+"""Resource usage of the task binaries: CPU time, peak memory and I/O of every run.
+
+The worker reaps each binary with `wait4`, which returns its resource usage (including the
+threads and the processes it waited for). Every run is recorded in the Redis backend data-base,
+per task type and input size bucket (see `cost_model.size_bucket`), as aggregates and as a list
+of the most recent runs, for capacity planning (see `resource_report.py`).
+"""
+
+import json
+import os
+import resource
+
+from typing import Dict, List, Optional
+
+from cost_model import size_bucket
+from utils import format_output_filename, use_cases
+
+# Redis hashes of the aggregated usage per task and input size bucket, and lists of the most
+# recent runs per task
+RESOURCES_KEY_TEMPLATE = "task_resources:{}:{}"
+RESOURCE_SAMPLES_KEY_TEMPLATE = "task_resource_samples:{}"
+RESOURCE_SAMPLES = int(os.getenv("RESOURCE_SAMPLES", "500"))
+
+# Size of the blocks counted by `ru_inblock` and `ru_oublock`
+BLOCK_SIZE = 512
+
+# Atomic update of the sums and of the maximum peak memory
+_AGGREGATE_SCRIPT = """
+for i = 1, #ARGV - 1, 2 do
+    redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+local peak = tonumber(ARGV[#ARGV])
+local max_peak = tonumber(redis.call('HGET', KEYS[1], 'max_peak_rss_bytes'))
+if not max_peak or peak > max_peak then
+    redis.call('HSET', KEYS[1], 'max_peak_rss_bytes', peak)
+end
+return 1
+"""
+
+# Usage entries summed per bucket, and averaged over its runs in `resource_stats`
+_SUMMED_FIELDS = [
+    "wall_seconds",
+    "cpu_seconds",
+    "peak_rss_bytes",
+    "disk_read_bytes",
+    "disk_write_bytes",
+    "input_bytes",
+    "output_bytes",
+]
+
+
+def output_size_of(uid: str, task_name: str) -> int:
+    """Returns the total size in bytes of the outputs written by a task."""
+    total = 0
+    for output_file in use_cases.get(task_name, {}).get("output_files", []):
+        try:
+            total += format_output_filename(output_file["filename"], uid).stat().st_size
+        except (OSError, KeyError):
+            pass
+    return total
+
+
+def usage_from_rusage(rusage: resource.struct_rusage, wall_seconds: float, input_size: Optional[int], output_size: int) -> Dict:
+    """Summarises the resource usage of one run.
+
+    `cpu_utilization` is the average number of busy cores over the run. Disk I/O only counts
+    the blocks that missed the page cache, while `input_bytes` and `output_bytes` give the
+    amount of encrypted data the run consumed and produced.
+    """
+    cpu_seconds = rusage.ru_utime + rusage.ru_stime
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_user_seconds": round(rusage.ru_utime, 3),
+        "cpu_system_seconds": round(rusage.ru_stime, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "cpu_utilization": round(cpu_seconds / wall_seconds, 2) if wall_seconds > 0 else None,
+        # `ru_maxrss` is in kilobytes on Linux
+        "peak_rss_bytes": rusage.ru_maxrss * 1024,
+        "disk_read_bytes": rusage.ru_inblock * BLOCK_SIZE,
+        "disk_write_bytes": rusage.ru_oublock * BLOCK_SIZE,
+        "input_bytes": input_size or 0,
+        "output_bytes": output_size,
+        "voluntary_context_switches": rusage.ru_nvcsw,
+        "involuntary_context_switches": rusage.ru_nivcsw,
+    }
+
+
+def record_resource_usage(redis_client, task_name: str, input_size: Optional[int], usage: Dict) -> None:
+    """Adds the resource usage of a run to the aggregates of its task and input size bucket."""
+    bucket = size_bucket(input_size)
+    args: List = ["count", 1]
+    for field in _SUMMED_FIELDS:
+        args += [f"sum_{field}", usage[field]]
+    args.append(usage["peak_rss_bytes"])
+    redis_client.eval(_AGGREGATE_SCRIPT, 1, RESOURCES_KEY_TEMPLATE.format(task_name, bucket), *args)
+
+    samples_key = RESOURCE_SAMPLES_KEY_TEMPLATE.format(task_name)
+    pipe = redis_client.pipeline()
+    pipe.lpush(samples_key, json.dumps(usage))
+    pipe.ltrim(samples_key, 0, RESOURCE_SAMPLES - 1)
+    pipe.execute()
+
+
+def resource_stats(redis_client, with_samples: bool = False) -> Dict[str, Dict]:
+    """Returns the average resource usage of every task, per input size bucket.
+
+    Buckets are reported by their upper input size in bytes (`2 ** bucket`). With
+    `with_samples`, the most recent runs of each task are included as well.
+    """
+    stats: Dict[str, Dict] = {}
+    for key in redis_client.scan_iter(RESOURCES_KEY_TEMPLATE.format("*", "*")):
+        _, task_name, bucket = key.split(":")
+        aggregates = redis_client.hgetall(key)
+        count = float(aggregates["count"])
+        entry = {
+            "max_input_bytes": 2 ** int(bucket) if bucket != "None" else None,
+            "count": int(count),
+            "max_peak_rss_bytes": int(float(aggregates["max_peak_rss_bytes"])),
+        }
+        for field in _SUMMED_FIELDS:
+            entry[f"mean_{field}"] = round(float(aggregates[f"sum_{field}"]) / count, 3)
+        entry["mean_cpu_utilization"] = (
+            round(entry["mean_cpu_seconds"] / entry["mean_wall_seconds"], 2) if entry["mean_wall_seconds"] > 0 else None
+        )
+        stats.setdefault(task_name, {"buckets": []})["buckets"].append(entry)
+
+    for task_name, entry in stats.items():
+        entry["buckets"].sort(key=lambda b: b["max_input_bytes"] or 0)
+        if with_samples:
+            samples = redis_client.lrange(RESOURCE_SAMPLES_KEY_TEMPLATE.format(task_name), 0, -1)
+            entry["samples"] = [json.loads(sample) for sample in samples]
+    return stats
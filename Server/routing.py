@@ -0,0 +1,96 @@
+"""Key-affinity routing of the `usecases` tasks.
+
+Each `usecases` worker container keeps a local cache of decompressed server keys (`KEY_CACHE_DIR`),
+and consumes a dedicated queue, `usecases.<hostname>`, on top of the shared `usecases` queue. Under
+Docker the hostname is the container ID, so each replica of the service is a routing target of its own.
+Workers publish their queues and key-cache contents to the worker registry (`worker_registry.py`).
+`/start_task` sends the tasks of a UID to the queue of the host chosen by consistent hashing of the
+UID over the live hosts, so that they find its key already decompressed. Adding or removing a host
+only moves the UIDs of its neighbours on the ring.
+
+A task falls back to the shared queue when no host is alive, or when the queue of the chosen host
+is already full. The workers move the tasks of the queues of the dead hosts back to the shared queue.
+"""
+
+import bisect
+import hashlib
+import os
+
+from typing import Dict, List, Optional
+
+from utils import logger
+from worker_registry import (
+    USECASE_QUEUE,
+    WORKER_QUEUE_TEMPLATE,
+    WORKER_QUEUES_KEY,
+    is_worker_queue,
+    worker_queue,
+    worker_states,
+)
+
+# Routes the tasks of a UID to the worker host that has its key cached
+KEY_AFFINITY_ROUTING = os.getenv("KEY_AFFINITY_ROUTING", "false").lower() == "true"
+
+# Number of points of each host on the hash ring, to spread the UIDs evenly
+VIRTUAL_NODES = 64
+
+# A host whose queue holds this many tasks is overloaded, and new tasks go to the shared queue
+ROUTING_MAX_QUEUED = int(os.getenv("ROUTING_MAX_QUEUED", "2"))
+
+
+def usecase_queue_names(redis_broker) -> List[str]:
+    """Returns the shared queue and the own queues of the workers, including those not yet swept."""
+    return [USECASE_QUEUE] + sorted(redis_broker.hkeys(WORKER_QUEUES_KEY))
+
+
+def worker_hosts(workers: Dict[str, Dict]) -> Dict[str, int]:
+    """Returns the concurrency of each live worker host that has its own queue, by hostname."""
+    hosts = {}
+    for entry in workers.values():
+        for queue in entry["queues"]:
+            if is_worker_queue(queue):
+                hostname = queue[len(WORKER_QUEUE_TEMPLATE.format("")) :]
+                hosts[hostname] = hosts.get(hostname, 0) + entry["concurrency"]
+    return hosts
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing of UIDs over worker hosts."""
+
+    def __init__(self, hostnames: List[str]):
+        points = sorted((_hash(f"{hostname}#{i}"), hostname) for hostname in hostnames for i in range(VIRTUAL_NODES))
+        self._keys = [point for point, _ in points]
+        self._hostnames = [hostname for _, hostname in points]
+
+    def lookup(self, uid: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(uid)) % len(self._keys)
+        return self._hostnames[index]
+
+
+def route_task(redis_broker, uid: str) -> str:
+    """Chooses the queue of a new task of `uid`.
+
+    Returns:
+        str: The queue of the host chosen for the UID, or the shared queue if routing is disabled,
+            no host is alive, or the chosen host is overloaded.
+    """
+    if not KEY_AFFINITY_ROUTING:
+        return USECASE_QUEUE
+
+    hosts = worker_hosts(worker_states(redis_broker))
+    ring = HashRing(list(hosts))
+    hostname = ring.lookup(uid)
+    if hostname is None:
+        return USECASE_QUEUE
+
+    queue = worker_queue(hostname)
+    if redis_broker.llen(queue) >= ROUTING_MAX_QUEUED * max(1, hosts[hostname]):
+        logger.info(f"🔀 Worker host `{hostname}` is overloaded, sending the task to the shared queue.")
+        return USECASE_QUEUE
+    return queue
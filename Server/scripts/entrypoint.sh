@@ -4,6 +4,13 @@ set -x # Debug mode
 # Start the appropriate service based on RUN_TYPE
 case "$RUN_TYPE" in
     fastapi)
+        # Each of the `FASTAPI_WORKERS` Uvicorn processes connects to Redis and Celery on its own. The
+        # processes share their state through Redis, and must hash the trace identically (see submission_trace.py).
+        # The salt is not echoed by the debug mode.
+        { set +x; } 2>/dev/null
+        export TRACE_SALT="${TRACE_SALT:-$(head -c 16 /dev/urandom | od -An -tx1 | tr -d ' \n')}"
+        set -x
+
         if [[ $USE_TLS == true || $MODE == PROD ]]; then
             # Check if the certificates exist
             if [ ! -e "$CONTAINER_CERTS_PATH/$CERT_FILE_NAME" ] || [ ! -e "$CONTAINER_CERTS_PATH/$PRIVKEY_FILE_NAME" ]; then
@@ -14,18 +21,19 @@ case "$RUN_TYPE" in
 
             # Start FastAPI in HTTPS mode
             export PORT=$FASTAPI_CONTAINER_PORT_HTTPS
-            echo "🚀 [MODE=$MODE | USE_TLS=$USE_TLS] Starting Uvicorn Python server in HTTPS mode... for $MODE environment with PORT:$PORT"
+            echo "🚀 [MODE=$MODE | USE_TLS=$USE_TLS] Starting Uvicorn Python server in HTTPS mode... for $MODE environment with PORT:$PORT and ${FASTAPI_WORKERS:-1} worker(s)"
             exec uvicorn server:app \
                 --host 0.0.0.0 \
                 --port "$PORT" \
+                --workers "${FASTAPI_WORKERS:-1}" \
                 --ssl-keyfile "$CONTAINER_CERTS_PATH/$PRIVKEY_FILE_NAME" \
                 --ssl-certfile "$CONTAINER_CERTS_PATH/$CERT_FILE_NAME"
         else
             # Start FastAPI in HTTP mode
             export PORT=$FASTAPI_CONTAINER_PORT_HTTP
             echo "⚠️ Warning: Starting FastAPI in HTTP mode; this mode should only be used in a development environment."
-            echo "🚀 [MODE=$MODE | USE_TLS=$USE_TLS] Starting Uvicorn Python server in HTTP mode... for $MODE environment with PORT:$PORT, with log-level=$FASTAPI_LOGLEVEL"
-            exec uvicorn server:app --host 0.0.0.0 --port "$PORT" --log-level "$FASTAPI_LOGLEVEL"
+            echo "🚀 [MODE=$MODE | USE_TLS=$USE_TLS] Starting Uvicorn Python server in HTTP mode... for $MODE environment with PORT:$PORT and ${FASTAPI_WORKERS:-1} worker(s), with log-level=$FASTAPI_LOGLEVEL"
+            exec uvicorn server:app --host 0.0.0.0 --port "$PORT" --workers "${FASTAPI_WORKERS:-1}" --log-level "$FASTAPI_LOGLEVEL"
         fi
         ;;
 
@@ -38,6 +46,15 @@ case "$RUN_TYPE" in
             --concurrency="$CELERY_WORKER_CONCURRENCY_USECASE_QUEUE"
         ;;
 
+    prepare)
+        # Start Celery worker for the input preparation of queued tasks
+        echo "🚀 Starting Celery Worker for input preparation..."
+        exec celery -A task_executor.celery_app worker \
+            --loglevel="$CELERY_LOGLEVEL" \
+            --queues="prepare" \
+            --concurrency="$CELERY_WORKER_CONCURRENCY_PREPARE_QUEUE"
+        ;;
+
     ads)
         # Start Celery worker for ads queue
         echo "🚀 Starting Celery Worker for ads... with loglevel=$CELERY_LOGLEVEL"
@@ -27,6 +27,9 @@ pip install pytest
 pip install pytest-rerunfailures
 pip install pandas
 pip install matplotlib
+pip install aiohttp
+pip install "fakeredis[lua]"
+pip install "moto[server]"
 
 # Check for C compiler (cc)
 if ! command -v cc >/dev/null 2>&1; then
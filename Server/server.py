@@ -5,28 +5,48 @@ We use Celery for asynchronous processing (polling approach).
 Routes:
     - /logs
     - /add_key
+    - /start_key_upload
+    - /upload_key_chunk
+    - /get_key_upload_status
+    - /finish_key_upload
     - /get_use_cases
     - /start_task  
     - /get_task_status
+    - /get_task_status_batch
     - /get_task_result
+    - /get_task_result_batch
     - /cancel_task
     - /list_current_tasks
+    - /list_workers
+    - /queue_stats
+    - /resource_stats
+    - /admin/profile_task
+    - /admin/flamegraph
 """
+import asyncio
 import base64
 import datetime
 import io
+import math
+import tarfile
+import subprocess
 import time
 import uuid
 
+from functools import partial
 from glob import glob
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 
 from celery.result import AsyncResult
 from fastapi import (
+    Body,
     Depends,
     FastAPI,
     Form,
+    Header,
     HTTPException,
+    Query,
+    Request,
     Response,
     UploadFile,
 )
@@ -35,6 +55,15 @@ import json
 
 from utils import * 
 from task_executor import *
+from cost_model import INPUT_SIZE_HEADER, cost_model_stats, predict_queue_wait, queue_snapshot, queued_tasks, running_tasks
+from idempotency import get_idempotency_key, release_request, request_hash, reserve_request, store_response
+from key_upload import KEY_UPLOAD_CHUNK_BYTES, finish_upload, start_upload, upload_state, write_chunk
+from resource_usage import resource_stats
+from routing import route_task, usecase_queue_names
+from submission_trace import record_trace_event
+from task_profiler import PROFILE_TARGETS, PROFILER_MAX_SECONDS, flamegraph_state, task_process
+from time_limits import celery_time_limits, timeout_stats
+from worker_registry import worker_states
 
 # Instanciate FastAPI app
 app = FastAPI()
@@ -49,6 +78,7 @@ NON_CANCELLABLE_STATUSES: List = [
     "revoked",
     "unknown",
     "error",
+    "timeout",
 ]
 
 
@@ -84,12 +114,25 @@ STATUS_TEMPLATES = {
         "logger_msg": "❌ [task_id=`{}` - uid=`{}`] failed. Consider restarting it.",
 
     },
+    "timeout": {
+        "status": "timeout",
+        "details": "The task exceeded its time limit and was stopped.",
+        "worker": None,
+        "logger_msg": "⏱️ [task_id=`{}` - uid=`{}`] exceeded its time limit and was stopped.",
+    },
     "reserved": {
         "status": "reserved",
         "details": "This task will start soon.",
         "worker": "TBD",
         "logger_msg": "📦 [task_id=`{}` - uid=`{}`] is reserved and will start soon.",
     },
+    # Retried while another task of the UID updates its state (see `acquire_state_lock`)
+    "retry": {
+        "status": "reserved",
+        "details": "This task waits for the previous task of its UID to finish, and will start soon.",
+        "worker": "TBD",
+        "logger_msg": "📦 [task_id=`{}` - uid=`{}`] waits for the previous task of its UID, and will start soon.",
+    },
     "unknown": {
         "status": "unknown",
         "details": "Task may not exist, you may need to restart it.",
@@ -136,19 +179,68 @@ STATUS_TEMPLATES = {
 
 
 @app.post("/add_key")
-async def add_key(key: UploadFile = Form(...), task_name=Depends(get_task_name)) -> Dict:
+async def add_key(
+    key: UploadFile = Form(...),
+    task_name=Depends(get_task_name),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
+) -> Dict:
     """Save the evaluation key on the server side.
 
     Args:
         key (UploadFile): The evaluation key.
         task_name (str): The name of the task.
+        idempotency_key (Optional[str]): The `Idempotency-Key` header of a request that may be
+            retried. A retry of a stored key returns the same UID (see `idempotency.py`).
 
     Returns:
         Dict[str, str]
             - uid: a unique identifier.
+
+    Raises:
+        HTTPException: Raised with status code 409 if a request with the same idempotency key is
+            still in progress.
+        HTTPException: Raised with status code 422 if the key cannot be loaded by the task, or if
+            the idempotency key was used for a different request.
+        HTTPException: Raised with status code 500 if the key cannot be stored.
+    """
+    content_hash = await request_hash(idempotency_key, {"task_name": task_name}, [key])
+    previous_response = reserve_request(redis_bd_backend, "add_key", idempotency_key, content_hash)
+    if previous_response is not None:
+        logger.info("🔁 Retried key upload, returning UID `%s`", get_id_prefix(previous_response["uid"]))
+        return previous_response
+
+    task_logger.debug(f"ADD_KEY: Entered for task_name={task_name}.")
+    try:
+        uid, file_size = await store_key(key, task_name)
+    except BaseException:
+        release_request(redis_bd_backend, "add_key", idempotency_key)
+        raise
+
+    record_trace_event("add_key", uid, task_name=task_name, key_bytes=file_size)
+
+    if KEY_WARMUP:
+        schedule_key_warmup(uid, task_name)
+
+    store_response(redis_bd_backend, "add_key", idempotency_key, content_hash, {"uid": uid})
+    return {"uid": uid}
+
+
+async def store_key(key: UploadFile, task_name: str) -> Tuple[str, int]:
+    """Stores an uploaded server key under a new UID, once validated for `task_name`.
+
+    Args:
+        key (UploadFile): The evaluation key.
+        task_name (str): The name of the task the key is uploaded for.
+
+    Returns:
+        Tuple[str, int]: The UID of the key and its size in bytes.
+
+    Raises:
+        HTTPException: Raised with status code 422 if the key is invalid.
+        HTTPException: Raised with status code 500 if the key cannot be stored.
     """
     uid = str(uuid.uuid4())
-    task_logger.debug(f"ADD_KEY: Entered for task_name={task_name}. Assigned potential UID: {uid}")
+    task_logger.debug(f"ADD_KEY: Assigned potential UID: {uid}")
 
     try:
         task_logger.debug(f"ADD_KEY: Attempting to read key for UID {uid} from upload.")
@@ -159,13 +251,135 @@ async def add_key(key: UploadFile = Form(...), task_name=Depends(get_task_name))
         with open(file_path, "wb") as f:
             f.write(file_content)
         file_size = file_path.stat().st_size
+        await asyncio.to_thread(validate_key, uid, task_name, file_path)
+        # Make the key available to the workers on other hosts (see storage.py)
+        await asyncio.to_thread(artifact_store.publish, file_path)
         logger.info("🔐 Successfully received new key upload: `%s` (Size: `%s` bytes). Assigned UID: `%s`", file_path, file_size, uid)
         task_logger.debug(f"ADD_KEY: Completed for UID {uid}.")
+    except HTTPException:
+        raise
     except Exception as e:
         error_message = f"❌ ADD_KEY: Failed to store the server key for UID {uid}: `{e}`"
         task_logger.error(error_message)
         raise HTTPException(status_code=500, detail=error_message)
 
+    return uid, file_size
+
+
+def schedule_key_warmup(uid: str, task_name: str) -> None:
+    """Enqueues the decompression of a new key into the worker key cache.
+
+    The warm-up runs while the client encrypts and uploads its input, on the queue that the first
+    task of the UID will be routed to, so that this task finds the key already decompressed. It is
+    only enqueued for the tasks with `key_warmup` in `tasks.yaml`, and is skipped when the queue
+    already holds `KEY_WARMUP_MAX_QUEUED` tasks, so that it never delays real work under load.
+    Failures are only logged: the task then loads the key itself.
+
+    Args:
+        uid (str): The unique key identifier.
+        task_name (str): The name of the task the key was uploaded for.
+    """
+    if not use_cases[task_name].get("key_warmup", False):
+        return
+    try:
+        queue = route_task(redis_bd_broker, uid)
+        queue_length = redis_bd_broker.llen(queue)
+        if queue_length >= KEY_WARMUP_MAX_QUEUED:
+            logger.info(f"🔥 Key warm-up skipped for UID=`{get_id_prefix(uid)}`: `{queue_length}` task(s) already queued in `{queue}`.")
+            return
+        warm_key.apply_async(args=[use_cases[task_name]["binary"], uid], queue=queue)
+        logger.info(f"🔥 Key warm-up enqueued for UID=`{get_id_prefix(uid)}` in `{queue}`.")
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to enqueue the key warm-up for UID=`{get_id_prefix(uid)}`: {e}")
+
+
+@app.post("/start_key_upload")
+def start_key_upload(size: int = Form(...), task_name=Depends(get_task_name)) -> Dict:
+    """Opens a resumable upload of an evaluation key, to be sent in chunks (see `key_upload.py`).
+
+    Args:
+        size (int): The size of the key in bytes.
+        task_name (str): The name of the task.
+
+    Returns:
+        Dict: The `upload_id` of the session, the `offset` of the first chunk and the maximum
+            size of a chunk, `chunk_bytes`.
+
+    Raises:
+        HTTPException: Raised with status code 400 if the task name or the size is invalid.
+    """
+    if task_name not in use_cases:
+        error_message = f"❌ START_KEY_UPLOAD: Invalid task name: `{task_name}`"
+        task_logger.error(error_message)
+        raise HTTPException(status_code=400, detail=error_message)
+    return start_upload(redis_bd_backend, task_name, size)
+
+
+@app.post("/upload_key_chunk")
+async def upload_key_chunk(
+    request: Request,
+    upload_id: str = Query(...),
+    offset: int = Query(...),
+    checksum: str = Header(..., alias="X-Chunk-SHA256"),
+) -> Dict:
+    """Appends a chunk of a key, sent as the raw request body, to its upload session.
+
+    Args:
+        request (Request): The request, whose body is the chunk.
+        upload_id (str): The upload session.
+        offset (int): The offset of the chunk in the key, which must be the number of bytes received.
+        checksum (str): The hexadecimal SHA-256 of the chunk, in the `X-Chunk-SHA256` header.
+
+    Returns:
+        Dict: The new `offset` of the session and the `size` of the key.
+
+    Raises:
+        HTTPException: Raised with status code 400 if the chunk is empty or too large.
+        HTTPException: Raised with status code 404 if the session does not exist or has expired.
+        HTTPException: Raised with status code 409 if `offset` is not the number of bytes received,
+            which is returned in the `Upload-Offset` header.
+        HTTPException: Raised with status code 422 if the chunk does not match its checksum.
+    """
+    chunk = bytearray()
+    async for data in request.stream():
+        chunk += data
+        if len(chunk) > KEY_UPLOAD_CHUNK_BYTES:
+            raise HTTPException(status_code=400, detail=f"❌ UPLOAD_KEY_CHUNK: A chunk must hold at most {KEY_UPLOAD_CHUNK_BYTES} bytes.")
+    return await asyncio.to_thread(write_chunk, redis_bd_backend, upload_id, offset, bytes(chunk), checksum)
+
+
+@app.get("/get_key_upload_status")
+def get_key_upload_status(upload_id: str = Query(...)) -> Dict:
+    """Returns the number of bytes received by an upload session (`offset`), to resume it from.
+
+    Raises:
+        HTTPException: Raised with status code 404 if the session does not exist or has expired.
+    """
+    state = upload_state(redis_bd_backend, upload_id)
+    return {"upload_id": upload_id, "offset": state["offset"], "size": state["size"], "finished": state["uid"] is not None}
+
+
+@app.post("/finish_key_upload")
+def finish_key_upload(upload_id: str = Form(...)) -> Dict:
+    """Stores the key of a complete upload session under a new UID, as `/add_key` does.
+
+    A retried call returns the same UID.
+
+    Returns:
+        Dict[str, str]
+            - uid: a unique identifier.
+
+    Raises:
+        HTTPException: Raised with status code 404 if the session does not exist or has expired.
+        HTTPException: Raised with status code 409 if the key is not complete.
+        HTTPException: Raised with status code 422 if the key cannot be loaded by the task, which
+            also ends the session.
+    """
+    uid, task_name, key_size, stored = finish_upload(redis_bd_backend, upload_id, validate_key)
+    if stored:
+        record_trace_event("add_key", uid, task_name=task_name, key_bytes=key_size)
+        if KEY_WARMUP:
+            schedule_key_warmup(uid, task_name)
     return {"uid": uid}
 
 
@@ -181,81 +395,372 @@ def get_use_cases() -> Dict:
     return {"Use-cases": use_cases_list}
 
 
-@app.post("/start_task")
-async def start_task(
-    uid: str = Form(...),
-    task_name: str = Form(...),
-    encrypted_input: UploadFile = Form(...)
-) -> JSONResponse:
-    """Starts a Celery task by processing an encrypted input file.
+def check_admission(uid: str, task_name: str) -> None:
+    """Rejects a new task if the `usecases` queue is too deep to start it within its budget.
+
+    The budget is `ADMISSION_MAX_WAIT_SECONDS`, unless the task sets its own limits in the
+    `admission` section of `tasks.yaml` (`max_wait_seconds`, `max_queued`), so that cheap tasks
+    can still be admitted under load. A budget of `0` disables the check.
 
     Args:
         uid (str): The unique key identifier.
         task_name (str): The name of the task to be executed.
-        encrypted_input (UploadFile): The encrypted input file.
-
-    Returns:
-        JSONResponse: A JSON object containing the `task_id` if the task starts successfully.
 
     Raises:
-        HTTPException: Raised with status code 400 if the `task_name` is invalid.
-        HTTPException: Raised with status code 500 if saving the file or starting the task fails.
+        HTTPException: Raised with status code 429, and a `Retry-After` header, if the predicted
+            waiting time or the number of queued tasks exceeds the task's limits.
     """
-    task_logger.debug(f"START_TASK: Entered for UID={get_id_prefix(uid)}, task_name={task_name}")
-    if task_name not in use_cases:
-        error_message = f"❌ START_TASK: Invalid task name: `{task_name}` for UID={get_id_prefix(uid)}"
-        task_logger.error(error_message)
-        raise HTTPException(status_code=400, detail=error_message)
+    admission_config = use_cases[task_name].get("admission", {})
+    max_wait_seconds = float(admission_config.get("max_wait_seconds", ADMISSION_MAX_WAIT_SECONDS))
+    max_queued = admission_config.get("max_queued")
+
+    if max_wait_seconds <= 0 and max_queued is None:
+        return
 
     try:
-        key_path = secure_path(FILES_FOLDER, f"{uid}.serverKey")
-        if not key_path.is_file():
-            error_message = f"❌ START_TASK: Key file `{key_path}` not found for UID={get_id_prefix(uid)}"
-            task_logger.error(error_message)
-            raise HTTPException(status_code=404, detail=error_message)
-    except HTTPException as e:
-        raise e
+        queue = predict_queue_wait(redis_bd_broker, redis_bd_backend)
     except Exception as e:
-        error_message = f"❌ START_TASK: Invalid path for UID={get_id_prefix(uid)}: {e}"
-        task_logger.error(error_message)
-        raise HTTPException(status_code=400, detail=error_message)
+        # Admission control must not make the service unavailable
+        task_logger.warning(f"⚠️ START_TASK: Failed to predict the queue wait, admitting the task: {e}")
+        return
+
+    predicted_wait = queue["predicted_wait_seconds"]
+    over_wait = max_wait_seconds > 0 and predicted_wait > max_wait_seconds
+    over_queued = max_queued is not None and queue["queued_tasks"] >= int(max_queued)
+
+    if not (over_wait or over_queued):
+        return
+
+    # Time until enough queued work has drained for the task to fit within its budget
+    retry_after = max(1, math.ceil(predicted_wait - max(max_wait_seconds, 0)))
+    error_message = (
+        f"🚦 START_TASK: Server overloaded, `{task_name}` rejected for UID={get_id_prefix(uid)}: "
+        f"`{queue['queued_tasks']}` queued task(s), predicted wait `{predicted_wait:.0f}`s. "
+        f"Retry in `{retry_after}`s."
+    )
+    task_logger.warning(error_message)
+    raise HTTPException(status_code=429, detail=error_message, headers={"Retry-After": str(retry_after)})
+
+
+# Exit code of a task binary run with `--validate` or `--validate-key` on an input or a key it
+# cannot process
+INVALID_INPUT_EXIT_CODE = 2
+
+# Redis hash of the outcome of the validation of each uploaded key, by UID: `valid`, or
+# `unchecked` if the validation could not run
+KEY_VALIDATION_KEY = "key_validation"
+
+
+def validate_key(uid: str, task_name: str, key_path: Path) -> None:
+    """Rejects an uploaded server key that the task binary cannot load, before it is published.
 
-    binary = use_cases[task_name]["binary"]
-    input_file_path = format_input_filename(uid, task_name)
-    task_logger.debug(f"START_TASK: Input file path for UID={get_id_prefix(uid)}, task_name={task_name}: `{input_file_path}`")
+    The binary is run with `--validate-key`, which deserializes the compressed key without
+    decompressing it. This runs once per key, on the API host that received it, and its outcome is
+    recorded in `KEY_VALIDATION_KEY`; `/start_task` then only checks the inputs. An invalid key is
+    deleted. If the validation itself fails (e.g. times out), the key is accepted and the worker
+    reports any error.
 
+    Args:
+        uid (str): The unique key identifier.
+        task_name (str): The name of the task the key was uploaded for.
+        key_path (Path): The saved server key.
+
+    Raises:
+        HTTPException: Raised with status code 422 if the key is invalid.
+    """
+    if not INPUT_VALIDATION or not use_cases[task_name].get("validate", False):
+        return
+
+    commandline = [f"./{use_cases[task_name]['binary']}", uid, "--validate-key"]
+    start_time = time.time()
     try:
-        task_logger.debug(f"START_TASK: Attempting to read encrypted_input for UID={get_id_prefix(uid)}, task_name={task_name}.")
-        file_content = await encrypted_input.read()
-        task_logger.debug(f"START_TASK: Successfully read encrypted_input (size: {len(file_content)}) for UID={get_id_prefix(uid)}, task_name={task_name}.")
-        with open(input_file_path, "wb") as f:
-            f.write(file_content)
-        file_size = input_file_path.stat().st_size
-        task_logger.debug(f"START_TASK: Saved encrypted input to `{input_file_path}` (Size: `{file_size}` bytes) for UID={get_id_prefix(uid)}, task_name={task_name}.")
+        result = subprocess.run(commandline, capture_output=True, text=True, timeout=INPUT_VALIDATION_TIMEOUT_SECONDS)
     except Exception as e:
-        error_message = f"❌ START_TASK: Failed to save input file `{input_file_path}` for UID={get_id_prefix(uid)}: {e}."
+        logger.warning(f"⚠️ ADD_KEY: Could not validate the key of UID={get_id_prefix(uid)} for `{task_name}`, accepting it: {e}")
+        redis_bd_backend.hset(KEY_VALIDATION_KEY, uid, "unchecked")
+        return
+
+    if result.returncode == INVALID_INPUT_EXIT_CODE:
+        key_path.unlink(missing_ok=True)
+        error_message = f"❌ ADD_KEY: Invalid server key for `{task_name}` (UID={get_id_prefix(uid)}): {result.stderr.strip()}"
         task_logger.error(error_message)
-        raise HTTPException(status_code=500, detail=error_message)
+        raise HTTPException(status_code=422, detail=error_message)
+    if result.returncode != 0:
+        logger.warning(f"⚠️ ADD_KEY: Validation of the key of UID={get_id_prefix(uid)} crashed, accepting it: `{result.stderr.strip()}`")
+        redis_bd_backend.hset(KEY_VALIDATION_KEY, uid, "unchecked")
+        return
+    redis_bd_backend.hset(KEY_VALIDATION_KEY, uid, "valid")
+    task_logger.debug(f"ADD_KEY: Validated the key of UID={get_id_prefix(uid)} in {time.time() - start_time:.2f}s.")
+
+
+async def validate_input(uid: str, task_name: str, binary: str, input_file_path: Path) -> None:
+    """Rejects an encrypted input that the task binary cannot process, before it is queued.
+
+    The binary is run with `--validate`, which checks the framing of the input and the number of
+    ciphertexts against the task's schema, without expanding it or loading the key, which was
+    validated once when it was uploaded (see `validate_key`). Only tasks with `validate` in
+    `tasks.yaml` are checked. If the validation itself fails (e.g. times out), the task is
+    accepted and the worker reports any error.
+
+    Args:
+        uid (str): The unique key identifier.
+        task_name (str): The name of the task to be executed.
+        binary (str): The binary of the task.
+        input_file_path (Path): The saved encrypted input.
+
+    Raises:
+        HTTPException: Raised with status code 422 if the input is invalid.
+    """
+    if not INPUT_VALIDATION or not use_cases[task_name].get("validate", False):
+        return
 
+    commandline = [f"./{binary}", uid, *use_cases[task_name].get("args", []), "--validate"]
+    start_time = time.time()
     try:
-        task_logger.debug(f"START_TASK: Attempting to submit Celery task for UID={get_id_prefix(uid)}, task_name={task_name}, Binary={binary}.")
-        task = run_binary_task.delay(binary, uid, task_name)
-        task_logger.info(
-            f"🚀 Task submitted [task_id=`{get_id_prefix(task.id)}` - UID=`{get_id_prefix(uid)}`] for task_name=`{task_name}`. Celery task ID: {task.id}"
+        result = await asyncio.to_thread(
+            subprocess.run, commandline, capture_output=True, text=True, timeout=INPUT_VALIDATION_TIMEOUT_SECONDS
         )
-        task_logger.debug(f"START_TASK: Completed for UID={get_id_prefix(uid)}, task_name={task_name}. Celery Task ID: {task.id}")
-        return JSONResponse({"task_id": task.id})
     except Exception as e:
-        error_message = f"❌ START_TASK: Failed to start Celery task `{task_name}` for UID={get_id_prefix(uid)}: {e}"
+        task_logger.warning(f"⚠️ START_TASK: Could not validate the input of `{task_name}` for UID={get_id_prefix(uid)}, accepting it: {e}")
+        return
+
+    if result.returncode == INVALID_INPUT_EXIT_CODE:
+        input_file_path.unlink(missing_ok=True)
+        error_message = f"❌ START_TASK: Invalid encrypted input for `{task_name}` (UID={get_id_prefix(uid)}): {result.stderr.strip()}"
         task_logger.error(error_message)
-        raise HTTPException(status_code=500, detail=error_message)
+        raise HTTPException(status_code=422, detail=error_message)
+    if result.returncode != 0:
+        task_logger.warning(f"⚠️ START_TASK: Validation of `{task_name}` crashed for UID={get_id_prefix(uid)}, accepting it: `{result.stderr.strip()}`")
+        return
+    task_logger.debug(f"START_TASK: Validated the input of `{task_name}` for UID={get_id_prefix(uid)} in {time.time() - start_time:.2f}s: {result.stdout.strip()}")
+
+
+@app.post("/start_task")
+async def start_task(
+    task_name: List[str] = Form(...),
+    encrypted_input: List[UploadFile] = Form(...),
+    uid: Optional[str] = Form(None),
+    key: Optional[UploadFile] = Form(None),
+    idempotency_key: Optional[str] = Depends(get_idempotency_key),
+) -> JSONResponse:
+    """Starts one or more Celery tasks by processing their encrypted input files.
+
+    The i-th `task_name` runs on the i-th `encrypted_input`, all with the key of `uid`, or with
+    `key`, which is then stored under a new UID, as `/add_key` does, in the same round trip. The
+    tasks are admitted, validated and enqueued together: if one is rejected, none is started.
+
+    Args:
+        task_name (List[str]): The names of the tasks to be executed, each at most once.
+        encrypted_input (List[UploadFile]): The encrypted input file of each task.
+        uid (Optional[str]): The unique key identifier of a key uploaded with `/add_key`.
+        key (Optional[UploadFile]): The evaluation key, if `uid` is not given.
+        idempotency_key (Optional[str]): The `Idempotency-Key` header of a request that may be
+            retried. A retry of started tasks returns the same task IDs, without starting them
+            again (see `idempotency.py`).
+
+    Returns:
+        JSONResponse: A JSON object containing the `task_id` of the first task, the `task_ids` of
+            all the tasks, in order, and the `uid` of their key, if the tasks start successfully.
+
+    Raises:
+        HTTPException: Raised with status code 400 if a `task_name` is invalid or repeated, if the
+            numbers of task names and inputs differ, or if not exactly one of `uid` and `key` is given.
+        HTTPException: Raised with status code 404 if the key of `uid` is not found.
+        HTTPException: Raised with status code 409 if a request with the same idempotency key is
+            still in progress.
+        HTTPException: Raised with status code 422 if `key` cannot be loaded by the first task, if
+            an encrypted input is malformed or does not match its task, or if the idempotency key
+            was used for a different request.
+        HTTPException: Raised with status code 429 if the server is too busy to admit a task.
+        HTTPException: Raised with status code 500 if saving a file or starting a task fails.
+
+        When `key` is given, the errors after it is stored carry its UID in a `uid` header, so
+        that the tasks can be retried without uploading the key again.
+    """
+    task_logger.debug(f"START_TASK: Entered for UID={get_id_prefix(uid)}, task_name={task_name}")
+    idempotency_endpoint = f"start_task:{uid}" if uid else "start_task:key"
+    content_hash = await request_hash(idempotency_key, {"task_name": task_name, "uid": uid}, [key, *encrypted_input])
+    previous_response = reserve_request(redis_bd_backend, idempotency_endpoint, idempotency_key, content_hash)
+    if previous_response is not None:
+        task_logger.info(f"🔁 Retried submission [task_id=`{get_id_prefix(previous_response['task_id'])}` - UID=`{get_id_prefix(previous_response.get('uid', uid))}`], not started again.")
+        return JSONResponse(previous_response)
+
+    try:
+        uid, tasks = await start_tasks(task_name, encrypted_input, uid, key)
+    except BaseException:
+        release_request(redis_bd_backend, idempotency_endpoint, idempotency_key)
+        raise
+
+    response = {"task_id": tasks[0].id, "task_ids": [task.id for task in tasks], "uid": uid}
+    store_response(redis_bd_backend, idempotency_endpoint, idempotency_key, content_hash, response)
+    return JSONResponse(response)
+
+
+async def start_tasks(task_name: List[str], encrypted_input: List[UploadFile], uid: Optional[str], key: Optional[UploadFile]) -> Tuple[str, List]:
+    """Checks a `/start_task` request, stores its key if given, and submits its tasks.
+
+    Args:
+        task_name (List[str]): The names of the tasks to be executed.
+        encrypted_input (List[UploadFile]): The encrypted input file of each task.
+        uid (Optional[str]): The unique key identifier of a stored key.
+        key (Optional[UploadFile]): The evaluation key, if `uid` is not given.
+
+    Returns:
+        Tuple[str, List]: The UID of the key, and the Celery `AsyncResult` of each task, in order.
+
+    Raises:
+        HTTPException: Raised with status code 400, 404, 422, 429 or 500, as `/start_task`.
+    """
+    for name in task_name:
+        if name not in use_cases:
+            error_message = f"❌ START_TASK: Invalid task name: `{name}` for UID={get_id_prefix(uid)}"
+            task_logger.error(error_message)
+            raise HTTPException(status_code=400, detail=error_message)
+    if len(set(task_name)) != len(task_name) or len(task_name) != len(encrypted_input):
+        error_message = f"❌ START_TASK: Expected one encrypted input per task, each task once, got tasks `{task_name}` and `{len(encrypted_input)}` input(s)."
+        task_logger.error(error_message)
+        raise HTTPException(status_code=400, detail=error_message)
+    if (uid is None) == (key is None):
+        error_message = "❌ START_TASK: Expected either the `uid` of a stored key or the `key` itself."
+        task_logger.error(error_message)
+        raise HTTPException(status_code=400, detail=error_message)
+
+    if key is not None:
+        uid, key_size = await store_key(key, task_name[0])
+        record_trace_event("add_key", uid, task_name=task_name[0], key_bytes=key_size)
+        try:
+            tasks = await submit_tasks(uid, task_name, encrypted_input)
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers={**(e.headers or {}), "uid": uid})
+    else:
+        try:
+            key_path = secure_path(FILES_FOLDER, f"{uid}.serverKey")
+            if not await asyncio.to_thread(artifact_store.exists, key_path):
+                error_message = f"❌ START_TASK: Key file `{key_path}` not found for UID={get_id_prefix(uid)}"
+                task_logger.error(error_message)
+                raise HTTPException(status_code=404, detail=error_message)
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            error_message = f"❌ START_TASK: Invalid path for UID={get_id_prefix(uid)}: {e}"
+            task_logger.error(error_message)
+            raise HTTPException(status_code=400, detail=error_message)
+        tasks = await submit_tasks(uid, task_name, encrypted_input)
+
+    return uid, tasks
+
+
+async def discard_inputs(uid: str, input_file_paths: List[Path]) -> None:
+    """Deletes the inputs saved by a `/start_task` request that failed, locally and from the store."""
+    for input_file_path in input_file_paths:
+        try:
+            await asyncio.to_thread(artifact_store.delete, input_file_path)
+        except Exception as e:
+            task_logger.warning(f"⚠️ START_TASK: Failed to delete input file `{input_file_path}` for UID={get_id_prefix(uid)}: {e}")
+
+
+async def submit_tasks(uid: str, task_names: List[str], encrypted_inputs: List[UploadFile]) -> List:
+    """Admits, saves, validates and enqueues the tasks of a `/start_task` request, all or none.
+
+    All the inputs are saved and validated before any is published to the artifact store. If a
+    step fails, the inputs saved by the request are deleted, locally and from the store.
+
+    Args:
+        uid (str): The unique key identifier.
+        task_names (List[str]): The names of the tasks.
+        encrypted_inputs (List[UploadFile]): The encrypted input file of each task.
+
+    Returns:
+        List: The Celery `AsyncResult` of each task, in order.
+
+    Raises:
+        HTTPException: Raised with status code 422, 429 or 500, as `/start_task`.
+    """
+    for task_name in task_names:
+        try:
+            check_admission(uid, task_name)
+        except HTTPException:
+            record_trace_event("start_task", uid, task_name=task_name, outcome="overloaded")
+            raise
+
+    input_file_paths, file_sizes = [], []
+    try:
+        for task_name, encrypted_input in zip(task_names, encrypted_inputs):
+            binary = use_cases[task_name]["binary"]
+            input_file_path = format_input_filename(uid, task_name)
+            task_logger.debug(f"START_TASK: Input file path for UID={get_id_prefix(uid)}, task_name={task_name}: `{input_file_path}`")
+
+            try:
+                task_logger.debug(f"START_TASK: Attempting to read encrypted_input for UID={get_id_prefix(uid)}, task_name={task_name}.")
+                file_content = await encrypted_input.read()
+                task_logger.debug(f"START_TASK: Successfully read encrypted_input (size: {len(file_content)}) for UID={get_id_prefix(uid)}, task_name={task_name}.")
+                input_file_paths.append(input_file_path)
+                with open(input_file_path, "wb") as f:
+                    f.write(file_content)
+                file_size = input_file_path.stat().st_size
+                task_logger.debug(f"START_TASK: Saved encrypted input to `{input_file_path}` (Size: `{file_size}` bytes) for UID={get_id_prefix(uid)}, task_name={task_name}.")
+            except Exception as e:
+                error_message = f"❌ START_TASK: Failed to save input file `{input_file_path}` for UID={get_id_prefix(uid)}: {e}."
+                task_logger.error(error_message)
+                raise HTTPException(status_code=500, detail=error_message)
+
+            try:
+                await validate_input(uid, task_name, binary, input_file_path)
+            except HTTPException:
+                record_trace_event("start_task", uid, task_name=task_name, input_bytes=file_size, outcome="invalid")
+                raise
+            file_sizes.append(file_size)
+
+        # Make the inputs available to the workers on other hosts (see storage.py)
+        for input_file_path in input_file_paths:
+            try:
+                await asyncio.to_thread(artifact_store.publish, input_file_path)
+                artifact_store.release(input_file_path)
+            except Exception as e:
+                error_message = f"❌ START_TASK: Failed to store input file `{input_file_path}` for UID={get_id_prefix(uid)}: {e}."
+                task_logger.error(error_message)
+                raise HTTPException(status_code=500, detail=error_message)
+    except HTTPException:
+        await discard_inputs(uid, input_file_paths)
+        raise
+
+    tasks = []
+    for task_name, file_size in zip(task_names, file_sizes):
+        binary = use_cases[task_name]["binary"]
+        try:
+            task_logger.debug(f"START_TASK: Attempting to submit Celery task for UID={get_id_prefix(uid)}, task_name={task_name}, Binary={binary}.")
+            task = run_binary_task.apply_async(
+                args=[binary, uid, task_name],
+                queue=route_task(redis_bd_broker, uid),
+                headers={INPUT_SIZE_HEADER: file_size},
+                **celery_time_limits(redis_bd_backend, task_name, file_size),
+            )
+            if INPUT_PREPARATION and use_cases[task_name].get("prepare", False):
+                prepare_input.apply_async(args=[binary, uid, task_name, task.id])
+            task_logger.info(
+                f"🚀 Task submitted [task_id=`{get_id_prefix(task.id)}` - UID=`{get_id_prefix(uid)}`] for task_name=`{task_name}`. Celery task ID: {task.id}"
+            )
+            task_logger.debug(f"START_TASK: Completed for UID={get_id_prefix(uid)}, task_name={task_name}. Celery Task ID: {task.id}")
+        except Exception as e:
+            for started_task in tasks:
+                started_task.revoke()
+            await discard_inputs(uid, input_file_paths)
+            error_message = f"❌ START_TASK: Failed to start Celery task `{task_name}` for UID={get_id_prefix(uid)}: {e}"
+            task_logger.error(error_message)
+            raise HTTPException(status_code=500, detail=error_message)
+        tasks.append(task)
+
+    for task_name, file_size, task in zip(task_names, file_sizes, tasks):
+        record_trace_event("start_task", uid, task.id, task_name=task_name, input_bytes=file_size, outcome="accepted")
+    return tasks
 
 
 @app.get("/list_current_tasks")
 def list_current_tasks() -> List[Dict]:
     """Lists all Celery tasks, including pending ones in the queue.
 
-    For workers, tasks may be active, reserved, queued, or scheduled.
+    For workers, tasks may be active or reserved, as published by the workers in the worker
+    registry (see `worker_registry.py`), which is read in one round trip.
     If the worker is full, the tasks are queued in Radis and wait to be pickup.
     With option `worker_prefetch_multiplier`, the worker is allowed to prefetch N task before
     starting the execution.
@@ -266,53 +771,32 @@ def list_current_tasks() -> List[Dict]:
     all_tasks: List[Dict] = []
 
     try:
-        inspector = celery_app.control.inspect(timeout=5)
-
-        if not inspector:
-            task_logger.error(
-                "❌ Failed to inspect Celery. Inspector returned `None`. No workers may be available."
-            )
-            return []
-
-        task_states = {
-            # Show the tasks that are currently active
-            "active": inspector.active() or {},
-            # Show the tasks that have been claimed by `workers`
-            "reserved": inspector.reserved() or {},
-            # Show tasks that have an ETA or are scheduled for later processing
-            "scheduled": inspector.scheduled() or {},
-        }
+        workers = worker_states(redis_bd_broker)
     except Exception as e:
-        task_logger.error(f"❌ Failed to inspect Celery tasks: {str(e)}")
-        return []
-
-    for state, tasks_data in task_states.items():
-        for worker_name, tasks_list in tasks_data.items():
-            for t in tasks_list:
-                task_info = {
-                    "task_id": t.get("id"),
-                    "status": STATUS_TEMPLATES[state]['status'],
-                    "worker": worker_name,
-                    "details": STATUS_TEMPLATES[state]['details'],
-                }
-                if state == "scheduled":
-                    request_info = t.get("request", {})
-                    task_info.update(
-                        {
-                            "task_id": request_info.get("id"),
-                        }
-                    )
-                all_tasks.append(task_info)
+        task_logger.error(f"❌ Failed to read the worker registry: {str(e)}")
+        workers = {}
+
+    for worker_name, worker in workers.items():
+        # `active`: the tasks that are currently executed, `reserved`: the tasks claimed by the worker
+        for state in ["active", "reserved"]:
+            for t in worker[state]:
+                all_tasks.append(
+                    {
+                        "task_id": t["task_id"],
+                        "status": STATUS_TEMPLATES[state]['status'],
+                        "worker": worker_name,
+                        "details": STATUS_TEMPLATES[state]['details'],
+                    }
+                )
 
     # Retrieving pending tasks from the Redis broker queue
     try:
-        pending_tasks = redis_bd_broker.lrange("usecases", 0, -1)
+        pending_tasks = queued_tasks(redis_bd_broker)
         total_tasks = len(pending_tasks)
         task_logger.info(f"Pending tasks in Redis broker: {total_tasks}.")
         for position, task in enumerate(pending_tasks):
-            task_data = json.loads(task)
             task_info = {
-                "task_id": task_data["headers"]["id"],
+                "task_id": task["task_id"],
                 "status": "queued",
                 "worker": "unknown",
                 "details": f"{STATUS_TEMPLATES['queued']['details']} Position in queue: `{position + 1} / {total_tasks}`",
@@ -327,6 +811,120 @@ def list_current_tasks() -> List[Dict]:
     return all_tasks
 
 
+
+@app.get("/list_workers")
+def list_workers() -> Dict[str, Dict]:
+    """Lists the live Celery workers, as published in the worker registry (see `worker_registry.py`).
+
+    Returns:
+        Dict[str, Dict]: The state of each worker, by node name: its `active` and `reserved`
+            tasks, queues, concurrency, cached keys, load and the time of its last publication.
+
+    Raises:
+        HTTPException: Raised with status code 500 if Redis cannot be queried.
+    """
+    try:
+        return worker_states(redis_bd_broker)
+    except Exception as e:
+        error_message = f"❌ LIST_WORKERS: Failed to read the worker registry: {e}"
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+
+def estimate_task_eta(task_id: str, status: str) -> Dict:
+    """Estimates when a queued or running task will start and finish, from the cost model.
+
+    Args:
+        task_id (str): The ID of the task.
+        status (str): Its current status, `queued` or `started`.
+
+    Returns:
+        Dict: The estimated start (for queued tasks) and finish, in seconds from now and as UTC
+            timestamps, or an empty dictionary if no estimate is available.
+    """
+    try:
+        if status == "queued":
+            snapshot = queue_snapshot(redis_bd_broker, redis_bd_backend)
+            task = next((t for t in snapshot["queued_tasks"] if t["task_id"] == task_id), None)
+            if task is None:
+                return {}
+            start_seconds, finish_seconds = task["estimated_start_seconds"], task["estimated_finish_seconds"]
+        else:
+            task = running_tasks(redis_bd_backend).get(task_id)
+            if task is None:
+                return {}
+            start_seconds, finish_seconds = 0.0, round(task["remaining_seconds"], 2)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to estimate the ETA of [task_id=`{get_id_prefix(task_id)}`]: {e}")
+        return {}
+
+    return format_eta(start_seconds, finish_seconds)
+
+
+def format_eta(start_seconds: float, finish_seconds: float) -> Dict:
+    """Returns an estimated start and finish, in seconds from now and as UTC timestamps."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        "estimated_start_seconds": start_seconds,
+        "estimated_finish_seconds": finish_seconds,
+        "estimated_start_time": (now + datetime.timedelta(seconds=start_seconds)).isoformat(timespec="seconds"),
+        "estimated_finish_time": (now + datetime.timedelta(seconds=finish_seconds)).isoformat(timespec="seconds"),
+    }
+
+
+@app.get("/queue_stats")
+def queue_stats() -> Dict:
+    """Returns the state of the `usecases` queue and the execution time model of each task.
+
+    Returns:
+        Dict: The worker capacity, the running tasks with their remaining time, the queued tasks
+            with their estimated start and finish (in seconds from now), the predicted wait of a
+            new task, the execution time estimates per task and input size, the live workers
+            with their queues and cached keys, and the number of timeouts per task.
+
+    Raises:
+        HTTPException: Raised with status code 500 if Redis cannot be queried.
+    """
+    try:
+        stats = queue_snapshot(redis_bd_broker, redis_bd_backend)
+        stats["cost_model"] = cost_model_stats(redis_bd_backend)
+        stats["workers"] = worker_states(redis_bd_broker)
+        stats["timeouts"] = timeout_stats(redis_bd_backend)
+    except Exception as e:
+        error_message = f"❌ QUEUE_STATS: Failed to compute the queue statistics: {e}"
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+
+    logger.info(
+        f"📊 Queue stats: `{len(stats['running_tasks'])}` running, `{len(stats['queued_tasks'])}` queued, "
+        f"predicted wait `{stats['predicted_wait_seconds']:.0f}`s."
+    )
+    return stats
+
+
+@app.get("/resource_stats")
+def get_resource_stats(with_samples: bool = False) -> Dict:
+    """Returns the resource usage of each task (CPU time, peak memory and I/O) per input size.
+
+    Args:
+        with_samples (bool): Whether to include the most recent runs of each task (default: False).
+
+    Returns:
+        Dict: For each task, the average usage per input size bucket, and optionally its samples.
+
+    Raises:
+        HTTPException: Raised with status code 500 if Redis cannot be queried.
+    """
+    try:
+        stats = resource_stats(redis_bd_backend, with_samples=with_samples)
+    except Exception as e:
+        error_message = f"❌ RESOURCE_STATS: Failed to compute the resource statistics: {e}"
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+
+    logger.info(f"📊 Resource stats: `{len(stats)}` task(s).")
+    return stats
+
+
 @app.get("/get_task_status")
 def get_task_status(task_id: str = Depends(get_task_id), uid: str = Depends(get_uid)) -> Dict:
     """Retrieves the status of a Celery task by its task ID and UID.
@@ -344,11 +942,8 @@ def get_task_status(task_id: str = Depends(get_task_id), uid: str = Depends(get_
         HTTPException: Raised if an unexpected error occurs while retrieving the task status.
     """
 
-    ttl: Optional[int] = None
-    status: str = "unknown"
     response: Optional[Dict] = None
-    worker_name: str = "unknown"
-    
+
     if not task_id or task_id.strip() == "":
         response = {
             **STATUS_TEMPLATES['invalid_task_id'],
@@ -366,80 +961,184 @@ def get_task_status(task_id: str = Depends(get_task_id), uid: str = Depends(get_
         logger.debug(list_current_tasks())
         return response
 
-    task_info = {"task_id": task_id, "uid": uid}
+    queue_position = None
     # Check if the task is in the Redis broker queue
     try:
-        queued_tasks = redis_bd_broker.lrange("usecases", 0, -1)
-        total_tasks = len(queued_tasks)
+        pending_tasks = queued_tasks(redis_bd_broker)
+        total_tasks = len(pending_tasks)
         task_logger.debug(f"Pending tasks in Redis broker: {total_tasks}")
-        for position, task in enumerate(queued_tasks):
-            task_data = json.loads(task)
-            if task_id == task_data["headers"]["id"]:
-                response = {
-                    **STATUS_TEMPLATES["queued"].copy(),
-                    **task_info,
-                    "logger_msg": STATUS_TEMPLATES['queued']['logger_msg'].format(get_id_prefix(task_id), get_id_prefix(uid), position + 1, total_tasks),
-                }
-                logger.info(response["logger_msg"])
-                return response
+        position = next((position for position, task in enumerate(pending_tasks) if task["task_id"] == task_id), None)
+        if position is not None:
+            queue_position = (position + 1, total_tasks)
     except Exception as e:
         logger.error("❌ Failed to check Redis broker bd: %s", str(e))
-    # Check if the task is marked as completed in the Redis backend queue
-    # Note: Redis only stores task statuses for a limited period of time (Time To Live)
+
+    response = build_task_status(
+        task_id, uid, queue_position, fetch_task_metas([task_id]).get(task_id), fetch_backup_files(task_id, uid), estimate_task_eta,
+    )
+    if response["status"] != "revoked":
+        logger.info(response["logger_msg"])
+    return response
+
+
+def fetch_task_metas(task_ids: List[str]) -> Dict[str, Optional[Dict]]:
+    """Reads the Celery results of many tasks from the Redis backend, in one pipelined round trip.
+
+    Note: Redis only stores task statuses for a limited period of time (Time To Live).
+
+    Returns:
+        Dict[str, Optional[Dict]]: The result metadata of each task, or `None` if the backend has none.
+    """
     try:
-        key = f"celery-task-meta-{task_id}"
-        if redis_bd_backend.exists(key):
-            raw = redis_bd_backend.get(key)
-            data = json.loads(raw)
-            ttl = redis_bd_backend.ttl(key)
-            logger.debug(f"[taks_id=`%s`] found in Redis with status=`%s` and TTL remaining `%s` seconds", get_id_prefix(task_id), data['status'].lower(), ttl)
+        pipeline = redis_bd_backend.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipeline.get(f"celery-task-meta-{task_id}")
+        return {task_id: json.loads(raw) if raw else None for task_id, raw in zip(task_ids, pipeline.execute())}
     except Exception as e:
         logger.error("❌ Failed to check Redis backend bd: `%s`", str(e))
+        return {}
 
-    # Check other status
-    try:
-        result = AsyncResult(task_id, app=celery_app)
-        status = result.state.lower()
-    except Exception as e:
-        logger.error(f"❌ Failed to get task status for `%s`: `%s`", task_id, str(e))
 
-    cached_output = fetch_backup_files(task_id, uid)
+def build_task_status(task_id: str, uid: str, queue_position, meta: Optional[Dict], cached_output: Optional[Dict], eta) -> Dict:
+    """Builds the status response of a task from what it depends on, fetched by the caller.
+
+    Args:
+        task_id (str): The ID of the task.
+        uid (str): The unique key identifier of the task.
+        queue_position (Optional[Tuple[int, int]]): The position of the task in the broker queues
+            and the number of queued tasks, if the task is queued.
+        meta (Optional[Dict]): The Celery result of the task in the Redis backend, if any.
+        cached_output (Optional[Dict]): The backup of the task outputs, if any.
+        eta (Callable): Returns the estimated start and finish of a task, from its ID and status.
+
+    Returns:
+        Dict: The task ID, status, worker name (if applicable), and additional details.
+    """
+    task_info = {"task_id": task_id, "uid": uid}
+
+    if queue_position is not None:
+        position, total_tasks = queue_position
+        return {
+            **STATUS_TEMPLATES["queued"].copy(),
+            **task_info,
+            **eta(task_id, "queued"),
+            "logger_msg": STATUS_TEMPLATES['queued']['logger_msg'].format(get_id_prefix(task_id), get_id_prefix(uid), position, total_tasks),
+        }
 
     # If the task is "PENDING" but a saved output file exists, treat it as "completed"
     if cached_output is not None:
-        response = {
+        return {
             **STATUS_TEMPLATES["completed"].copy(),
             **task_info,
             "details": f"Task completed on `{cached_output['timestamp']}`. The result is stored.",
             "logger_msg": STATUS_TEMPLATES["completed"]["logger_msg"].format(get_id_prefix(task_id), get_id_prefix(uid)) + f". Completed on `{cached_output['timestamp']}`.",
             "output_file_path": str(cached_output["files"]),
         }
-        logger.info(response['logger_msg'])
-        return response
 
-    # We have 2 options when status = "pending",
-    # either the task has been completed by Celery or the task is an undefined status
+    # Without a result in the backend, the task is "PENDING": either completed and expired, or undefined
+    status = meta["status"].lower() if meta else "pending"
+    result = (meta or {}).get("result")
+
     if status == 'started':
-        task_meta = result.backend.get_task_meta(task_id) or {}
-        worker_name = task_meta.get("result", {}).get("hostname", "unknown")
-        response = {
+        worker_name = result.get("hostname", "unknown") if isinstance(result, dict) else "unknown"
+        return {
             **STATUS_TEMPLATES[status],
+            **task_info,
             "worker": worker_name,
+            **eta(task_id, status),
             "logger_msg": STATUS_TEMPLATES[status]['logger_msg'].format(get_id_prefix(task_id), get_id_prefix(uid)),
-            }
-        logger.info(response['logger_msg'])
-        return response
+        }
+
+    # A task stopped at its time limit still completes from Celery's point of view
+    if status == "success" and isinstance(result, dict) and result.get("status") == "timeout":
+        status = "timeout"
+        task_info["details"] = f"{STATUS_TEMPLATES['timeout']['details']} {result['limit'].capitalize()} limit: `{result['time_limit_seconds']:.0f}`s."
 
     # Case, where the status is neither 'completed', 'started', 'unknown' or 'queued'
-    response = {**STATUS_TEMPLATES[status].copy(), **task_info}
-    
+    response = {**STATUS_TEMPLATES.get(status, STATUS_TEMPLATES["unknown"]).copy(), **task_info}
+
     if status != 'revoked':
         response['logger_msg'] = response['logger_msg'].format(get_id_prefix(task_id), get_id_prefix(uid))
-        logger.info(response['logger_msg'])
 
     return response
 
 
+def check_batch(tasks: List[Dict], fields: List[str]) -> List[Dict]:
+    """Rejects with a 400 a batch that is empty, larger than `BATCH_MAX_TASKS`, or whose entries lack a field."""
+    if not tasks or len(tasks) > BATCH_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f"A batch holds between 1 and {BATCH_MAX_TASKS} tasks, got `{len(tasks)}`.")
+    for task in tasks:
+        if not isinstance(task, dict) or any(not isinstance(task.get(field), str) for field in fields):
+            raise HTTPException(status_code=400, detail=f"Each task of the batch must have the fields {fields}, got `{task}`.")
+    return tasks
+
+
+def batch_task_statuses(tasks: List[Tuple[str, str]]) -> Tuple[List[Dict], Dict[str, Optional[Dict]]]:
+    """Resolves the status of many tasks with one scan of the broker queues, one pipelined read
+    of the Celery results and one listing of the backup files.
+
+    Args:
+        tasks (List[Tuple[str, str]]): The (task_id, uid) pairs of the tasks.
+
+    Returns:
+        Tuple[List[Dict], Dict[str, Optional[Dict]]]: The status of each task, as returned by
+            `/get_task_status`, in order, and the Celery results of the tasks by task ID.
+    """
+    valid_tasks = [(task_id, uid) for task_id, uid in tasks if task_id.strip() and uid.strip()]
+
+    snapshot = {"queued_tasks": [], "running_tasks": []}
+    try:
+        snapshot = queue_snapshot(redis_bd_broker, redis_bd_backend)
+    except Exception as e:
+        logger.error("❌ Failed to check Redis broker bd: %s", str(e))
+    queued = {task["task_id"]: task for task in snapshot["queued_tasks"]}
+    running = {task["task_id"]: task for task in snapshot["running_tasks"]}
+
+    def eta(task_id: str, status: str) -> Dict:
+        if status == "queued":
+            task = queued[task_id]
+            return format_eta(task["estimated_start_seconds"], task["estimated_finish_seconds"])
+        task = running.get(task_id)
+        return format_eta(0.0, round(task["remaining_seconds"], 2)) if task else {}
+
+    metas = fetch_task_metas([task_id for task_id, _ in valid_tasks])
+    backups = fetch_backup_files_batch(valid_tasks)
+
+    statuses = []
+    for task_id, uid in tasks:
+        if not task_id.strip():
+            statuses.append({**STATUS_TEMPLATES['invalid_task_id'], 'logger_msg': STATUS_TEMPLATES['invalid_task_id']['logger_msg'].format(task_id)})
+        elif not uid.strip():
+            statuses.append({**STATUS_TEMPLATES['invalid_uid'], 'logger_msg': STATUS_TEMPLATES['invalid_uid']['logger_msg'].format(uid)})
+        else:
+            queue_position = (queued[task_id]["position"], len(queued)) if task_id in queued else None
+            statuses.append(build_task_status(task_id, uid, queue_position, metas.get(task_id), backups.get((task_id, uid)), eta))
+    return statuses, metas
+
+
+@app.post("/get_task_status_batch")
+def get_task_status_batch(tasks: List[Dict] = Body(..., embed=True)) -> Dict:
+    """Retrieves the status of many tasks at once.
+
+    The request body is `{"tasks": [{"task_id": ..., "uid": ...}, ...]}`, with at most
+    `BATCH_MAX_TASKS` tasks.
+
+    Returns:
+        Dict: The status of each task, as returned by `/get_task_status`, in the order of the request.
+
+    Raises:
+        HTTPException: Raised with status code 400 if the batch is empty, too large or malformed.
+    """
+    check_batch(tasks, ["task_id", "uid"])
+    statuses, _ = batch_task_statuses([(task["task_id"], task["uid"]) for task in tasks])
+
+    counts = {}
+    for status in statuses:
+        counts[status["status"]] = counts.get(status["status"], 0) + 1
+    logger.info(f"📋 Batch status of `{len(statuses)}` task(s): {counts}")
+    return {"tasks": statuses}
+
+
 @app.post("/cancel_task")
 def cancel_task(task_id: str = Depends(get_task_id), uid: str = Depends(get_uid)) -> Dict:
     """Attempts to cancel a running task by ID, if possible.
@@ -521,8 +1220,8 @@ def build_stream_response(task_id, uid, task_name, output_files_config, response
     if cached_output:
         output_file_path = Path(cached_output["files"][0])
         timestamp = cached_output["timestamp"]
-        data = fetch_file_content(output_file_path)
-        logger_msg = f"📁 [Cached] Output: `{output_file_path}`, size: `{len(data)}` bytes, last modified: `{timestamp}`"
+        chunks, size = stream_file_content(output_file_path)
+        logger_msg = f"📁 [Cached] Output: `{output_file_path}`, size: `{size}` bytes, last modified: `{timestamp}`"
     else:
         file_template = output_files_config[0]["filename"]
         output_file_path = format_output_filename(file_template, uid)
@@ -531,10 +1230,10 @@ def build_stream_response(task_id, uid, task_name, output_files_config, response
         task_logger.debug("📁 Output path: `%s`", output_file_path)
         task_logger.debug("📁 Backup output path: `%s`", backup_file_path)
 
-        data = fetch_file_content(output_file_path)
-        save_backup_file(backup_file_path, data)
+        chunks, size = stream_file_content(output_file_path)
+        copy_backup_file(output_file_path, backup_file_path)
 
-        logger_msg = f"📁 Output path: `{output_file_path}`, data size (`{len(data)}`)"
+        logger_msg = f"📁 Output path: `{output_file_path}`, data size (`{size}`)"
 
     task_logger.info(logger_msg)
 
@@ -545,7 +1244,7 @@ def build_stream_response(task_id, uid, task_name, output_files_config, response
     }
  
     return StreamingResponse(
-            io.BytesIO(data),
+            chunks,
             media_type="application/octet-stream",
             headers=stream_headers,
     )
@@ -589,7 +1288,7 @@ def build_json_response(task_id, uid, task_name, output_files_config, response,
             task_logger.debug("📁 Backup output path: `%s`", backup_file_path)
 
             data = fetch_file_content(output_file_path)
-            save_backup_file(backup_file_path, data)
+            copy_backup_file(output_file_path, backup_file_path)
 
             logger_msg = f"📁 Output path: `{output_file_path}`, data size (`{len(data)}`)" 
         
@@ -642,6 +1341,7 @@ async def get_task_result(
     # Check task status
     response = get_task_status(task_id, uid)
     status = response.get("status")
+    record_trace_event("get_result", uid, task_id, task_name=task_name, status=status)
             
     if status not in STATUS_TEMPLATES:
         error_message = f"🚨 [task_id=`{task_id}` - uid=`{uid}`] has an undefined state (`{status}`)."
@@ -649,7 +1349,11 @@ async def get_task_result(
         raise HTTPException(status_code=500, detail=error_message)
              
     if status in STATUS_TEMPLATES and status not in ["success", "completed"]:
-        logger.info(STATUS_TEMPLATES[status]['logger_msg'].format(get_id_prefix(task_id), get_id_prefix(uid)))
+        # The message of a queued task, with its position, is already formatted by `get_task_status`
+        if status == "queued":
+            logger.info(response["logger_msg"])
+        else:
+            logger.info(STATUS_TEMPLATES[status]['logger_msg'].format(get_id_prefix(task_id), get_id_prefix(uid)))
         return JSONResponse(
             content=response,
             status_code=200,
@@ -684,6 +1388,208 @@ async def get_task_result(
         return build_json_response(task_id, uid, task_name, output_files_template, response, stderr_output, cached_output)
 
 
+class _TarChunks:
+    """Write-only file object collecting the blocks of a tar archive written in stream mode."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        yield from chunks
+
+
+def stream_tar_archive(members: List[Tuple[str, object]]):
+    """Yields a tar archive of `(name, content)` members, where `content` is bytes or a callable
+    returning bytes, so that files are read one at a time, while the archive is sent."""
+    writer = _TarChunks()
+    with tarfile.open(fileobj=writer, mode="w|") as tar:
+        for name, content in members:
+            data = content() if callable(content) else content
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+            yield from writer.drain()
+    yield from writer.drain()
+
+
+def read_and_backup_output(output_file_path: Path, backup_file_path: Path):
+    """Returns a loader of an output file, which also saves its backup, as `/get_task_result` does."""
+    def load() -> bytes:
+        data = fetch_file_content(output_file_path)
+        copy_backup_file(output_file_path, backup_file_path)
+        return data
+    return load
+
+
+@app.post("/get_task_result_batch")
+def get_task_result_batch(tasks: List[Dict] = Body(..., embed=True)) -> StreamingResponse:
+    """Retrieves the results of many tasks at once, as one streamed tar archive.
+
+    The request body is `{"tasks": [{"task_id": ..., "uid": ..., "task_name": ...}, ...]}`, with
+    at most `BATCH_MAX_TASKS` tasks. The archive starts with `manifest.json`, which lists, for each
+    task in the order of the request, its status (as returned by `/get_task_status`), `stderr` and
+    `files`: the archive member of each output file, by key for the tasks with a JSON response
+    (raw bytes, not base64), or under `output` for the streamed ones. The outputs of each task are
+    stored under `<task_id>/`. Tasks that have not completed are listed without files.
+
+    Raises:
+        HTTPException: Raised with status code 400 if the batch is empty, too large or malformed,
+            or if a task name is invalid.
+    """
+    check_batch(tasks, ["task_id", "uid", "task_name"])
+    for task in tasks:
+        if task["task_name"] not in use_cases:
+            raise HTTPException(status_code=400, detail=f"Task `{task['task_name']}` does not exist.")
+
+    statuses, metas = batch_task_statuses([(task["task_id"], task["uid"]) for task in tasks])
+
+    manifest = []
+    members = []
+    for task, status in zip(tasks, statuses):
+        task_id, uid, task_name = task["task_id"], task["uid"], task["task_name"]
+        state = status.get("status")
+        record_trace_event("get_result", uid, task_id, task_name=task_name, status=state)
+        entry = {**status, "task_name": task_name, "stderr": "", "files": {}}
+        entry.pop("logger_msg", None)
+        manifest.append(entry)
+        if state not in ["success", "completed"]:
+            continue
+
+        task_config = use_cases[task_name]
+        if state == "success":
+            result = (metas.get(task_id) or {}).get("result")
+            entry["stderr"] = result.get("stderr", "") if isinstance(result, dict) else ""
+            cached_output = None
+        else:
+            cached_output = fetch_backup_files(task_id, uid)
+
+        task_members = []
+        for config in task_config.get("output_files", []):
+            key = config["key"] if task_config.get("response_type", "stream") == "json" else "output"
+            if cached_output is not None:
+                # As in `build_json_response`, the backup of a JSON output is found by its key
+                files = cached_output["files"]
+                output_file_path = Path(files[0] if key == "output" else next((f for f in files if key.capitalize() in f), files[0]))
+                content = partial(fetch_file_content, output_file_path)
+            else:
+                output_file_path = format_output_filename(config["filename"], uid)
+                content = read_and_backup_output(output_file_path, format_backup_filename(config["filename"], uid, task_id))
+            if not artifact_store.exists(output_file_path):
+                entry.update({"status": "error", "details": f"Output file `{output_file_path.name}` not found."})
+                task_members = []
+                break
+            task_members.append((f"{task_id}/{config['filename'].format(uid=uid)}", key, content))
+
+        for member_name, key, content in task_members:
+            entry["files"][key] = member_name
+            members.append((member_name, content))
+
+    ready = sum(1 for entry in manifest if entry["files"])
+    task_logger.info(f"📦 Batch result of `{len(tasks)}` task(s): `{ready}` with outputs, `{len(members)}` file(s) streamed.")
+
+    manifest_member = ("manifest.json", json.dumps({"tasks": manifest}).encode("utf-8"))
+    return StreamingResponse(
+        stream_tar_archive([manifest_member] + members),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": "attachment; filename=results.tar"},
+    )
+
+
+@app.post("/admin/profile_task", dependencies=[Depends(verify_admin_token)])
+def admin_profile_task(
+    task_id: str = Depends(get_task_id),
+    uid: str = Depends(get_uid),
+    target: str = "binary",
+    duration: float = 10,
+) -> JSONResponse:
+    """Samples the process running a task for `duration` seconds, and writes its flamegraph.
+
+    The profile runs in the background on the worker running the task; poll `/admin/flamegraph`
+    to download the result.
+
+    Args:
+        task_id (str): The ID of the running task.
+        uid (str): The unique key identifier of the task.
+        target (str): `binary` for the task binary, `worker` for the Celery process running it.
+        duration (float): The duration of the profile, in seconds (at most `PROFILER_MAX_SECONDS`).
+
+    Returns:
+        JSONResponse: Status code 202, with the name of the flamegraph file.
+
+    Raises:
+        HTTPException: Raised with status code 400 for an invalid target or duration, 404 if the
+            task is not running, 409 if the worker refuses to profile it (e.g. a profile is
+            already running), and 503 if the worker does not answer.
+    """
+    if target not in PROFILE_TARGETS:
+        raise HTTPException(status_code=400, detail=f"Invalid target `{target}`, expected one of {PROFILE_TARGETS}.")
+    if not 0 < duration <= PROFILER_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"The duration must be in ]0, {PROFILER_MAX_SECONDS:.0f}] seconds.")
+
+    process = task_process(redis_bd_backend, task_id)
+    if process is None or process.get("uid") != uid:
+        raise HTTPException(status_code=404, detail=f"Task `{task_id}` is not running.")
+
+    node = process["node"]
+    replies = celery_app.control.broadcast(
+        "profile_task",
+        arguments={"task_id": task_id, "target": target, "duration": duration},
+        destination=[node],
+        reply=True,
+        timeout=5,
+    )
+    reply = next((answer[node] for answer in replies or [] if node in answer), None)
+    if reply is None:
+        error_message = f"❌ ADMIN_PROFILE_TASK: Worker `{node}` did not answer."
+        logger.error(error_message)
+        raise HTTPException(status_code=503, detail=error_message)
+    if "error" in reply:
+        raise HTTPException(status_code=409, detail=reply["error"])
+
+    logger.info(f"🔥 Profiling [task_id=`{get_id_prefix(task_id)}`, target=`{target}`] on `{node}` for `{duration}`s.")
+    return JSONResponse(
+        status_code=202,
+        content={
+            "task_id": task_id,
+            "uid": uid,
+            "target": target,
+            "status": "running",
+            "flamegraph": reply["ok"],
+            "details": f"Profiling for {duration}s, download the flamegraph from `/admin/flamegraph`.",
+        },
+    )
+
+
+@app.get("/admin/flamegraph", dependencies=[Depends(verify_admin_token)])
+def admin_flamegraph(task_id: str = Depends(get_task_id), uid: str = Depends(get_uid), target: str = "binary") -> Response:
+    """Returns the flamegraph of a task profiled with `/admin/profile_task`.
+
+    Returns:
+        Response: The SVG flamegraph, or, while the profile is running or if it failed, its state
+            as JSON (status code 202 or 500).
+
+    Raises:
+        HTTPException: Raised with status code 404 if the task was not profiled.
+    """
+    state = flamegraph_state(redis_bd_backend, task_id, target)
+    if state is None or not state.get("path", "").startswith(f"{uid}."):
+        raise HTTPException(status_code=404, detail=f"No profile of task `{task_id}` (target `{target}`).")
+
+    if state["status"] == "running":
+        return JSONResponse(status_code=202, content=state)
+    if state["status"] == "error":
+        return JSONResponse(status_code=500, content=state)
+
+    flamegraph_path = secure_path(FILES_FOLDER, state["path"])
+    return Response(content=fetch_file_content(flamegraph_path), media_type="image/svg+xml")
+
+
 @app.get("/logs")
 def get_logs(lines: int = 10) -> Response:
     """Serve the server log file with the specified number of last lines.
@@ -709,7 +1615,7 @@ def get_logs(lines: int = 10) -> Response:
 
         # Get Celery queue information
         try:
-            usecases_queue_length = redis_bd_broker.llen("usecases")
+            usecases_queue_length = sum(redis_bd_broker.llen(queue) for queue in usecase_queue_names(redis_bd_broker))
             completed_tasks = len(redis_bd_backend.keys("celery-task-meta-*"))
             queue_info = f"Queue Status:\nQueued tasks: {usecases_queue_length}\nCompleted in last hour: {completed_tasks}"
         except Exception as e:
@@ -0,0 +1,354 @@
+"""Storage of the keys, inputs and outputs of the tasks, shared by the API and the workers.
+
+With `STORAGE_BACKEND=local`, the artifacts live in the shared directory (`SHARED_DIR`) that every
+container mounts, so the API and the workers must run on the same host. With `STORAGE_BACKEND=s3`,
+they live in an S3-compatible bucket (`S3_BUCKET`, served at `S3_ENDPOINT_URL` by MinIO or any
+other stand-in), and the shared directory of each host is only a staging area: the task binaries
+keep reading and writing plain files, which the workers fetch before a task and publish after it.
+
+An artifact is named after its path in the shared directory, so that the rest of the code keeps
+building paths with the `format_*_filename` helpers of utils.py, and hands them to the store:
+
+- `publish` uploads a local file and `fetch` downloads it, both in parts of `S3_MULTIPART_CHUNK_BYTES`
+  transferred over `S3_MAX_CONCURRENCY` parallel connections;
+- `stream` reads an artifact chunk by chunk, without holding it in memory;
+- `fetch(..., cache=True)` keeps the file on the host for the next calls. It is used for the server
+  keys, which never change once stored, and the host evicts the least recently used ones beyond
+  `STORAGE_KEY_CACHE_MAX_BYTES`;
+- `release` deletes the local copy of an artifact once it is published or used.
+
+The local backend has the same methods, which do nothing when the file is already in place.
+"""
+
+import io
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_MULTIPART_CHUNK_BYTES = int(os.getenv("S3_MULTIPART_CHUNK_BYTES", str(16 * 1024 ** 2)))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+STORAGE_KEY_CACHE_MAX_BYTES = int(os.getenv("STORAGE_KEY_CACHE_MAX_BYTES", str(16 * 1024 ** 3)))
+
+STREAM_CHUNK_BYTES = 1024 * 1024
+# Local files kept by `fetch(..., cache=True)`, and evicted by size
+CACHED_FILE_PATTERN = "*.serverKey"
+
+logger = logging.getLogger(__name__)
+
+
+def _read_chunks(f, chunk_bytes: int) -> Iterator[bytes]:
+    with f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            yield chunk
+
+
+class LocalStorage:
+    """Artifacts kept in the shared directory `root`, which all the containers mount.
+
+    Args:
+        root (Path): The shared directory.
+    """
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def publish(self, path: Path) -> None:
+        """Makes the local file `path` available to all the hosts."""
+
+    def fetch(self, path: Path, cache: bool = False, missing_ok: bool = False) -> Optional[Path]:
+        """Makes the artifact `path` available as a local file.
+
+        Args:
+            path (Path): The artifact, as a path in the shared directory.
+            cache (bool): Whether a local copy left by a previous call can be used as is, for the
+                artifacts that never change once stored.
+            missing_ok (bool): Whether to return `None`, instead of raising, if the artifact does not exist.
+
+        Returns:
+            Optional[Path]: `path`, or `None` if the artifact does not exist and `missing_ok` is set.
+
+        Raises:
+            FileNotFoundError: Raised if the artifact does not exist, unless `missing_ok` is set.
+        """
+        if path.is_file():
+            return path
+        if missing_ok:
+            return None
+        raise FileNotFoundError(f"Artifact `{path.name}` not found.")
+
+    def exists(self, path: Path) -> bool:
+        return path.is_file()
+
+    def stat(self, path: Path) -> Tuple[int, float]:
+        """Returns the size in bytes and the modification time of an artifact.
+
+        Raises:
+            FileNotFoundError: Raised if the artifact does not exist.
+        """
+        st = path.stat()
+        return st.st_size, st.st_mtime
+
+    def read(self, path: Path) -> bytes:
+        return path.read_bytes()
+
+    def stream(self, path: Path, chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+        """Returns an iterator over the content of an artifact, by chunks of `chunk_bytes`.
+
+        Raises:
+            FileNotFoundError: Raised if the artifact does not exist, before the first chunk.
+        """
+        return _read_chunks(open(path, "rb"), chunk_bytes)
+
+    def write(self, path: Path, data: bytes) -> None:
+        path.write_bytes(data)
+
+    def copy(self, source: Path, target: Path) -> None:
+        shutil.copyfile(source, target)
+
+    def delete(self, path: Path) -> None:
+        path.unlink(missing_ok=True)
+
+    def list(self, prefix: str, match: Optional[Callable[[str], bool]] = None) -> List[Tuple[Path, float]]:
+        """Returns the artifacts whose name starts with `prefix` and satisfies `match`, with their
+        modification time."""
+        artifacts = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith(prefix) and (match is None or match(entry.name)):
+                    artifacts.append((Path(entry.path), entry.stat().st_mtime))
+        return artifacts
+
+    def release(self, path: Path) -> None:
+        """Deletes the local copy of an artifact once published or used: here, the artifact itself is kept."""
+
+
+class S3Storage:
+    """Artifacts kept in an S3-compatible bucket, and staged in the local directory `root`.
+
+    The credentials are read by `boto3` from the usual `AWS_ACCESS_KEY_ID`, `AWS_SECRET_ACCESS_KEY`
+    and `AWS_DEFAULT_REGION` variables.
+
+    Args:
+        root (Path): The local staging directory.
+        bucket (str): The bucket of the artifacts.
+        endpoint_url (str): The URL of the S3 API, empty for AWS.
+        prefix (str): The prefix of the object keys, to share a bucket between deployments.
+        chunk_bytes (int): The size of the parts of a multipart transfer, and of the smallest file transferred in parts.
+        max_concurrency (int): The number of parts transferred in parallel.
+        cache_max_bytes (int): The size beyond which the cached files are evicted.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        root: Path,
+        bucket: str,
+        endpoint_url: str = "",
+        prefix: str = "",
+        chunk_bytes: int = S3_MULTIPART_CHUNK_BYTES,
+        max_concurrency: int = S3_MAX_CONCURRENCY,
+        cache_max_bytes: int = STORAGE_KEY_CACHE_MAX_BYTES,
+    ):
+        # Only needed with this backend
+        from boto3.s3.transfer import TransferConfig
+
+        if not bucket:
+            raise ValueError("`S3_BUCKET` must be set with `STORAGE_BACKEND=s3`.")
+        self.root = Path(root)
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url or None
+        self.prefix = prefix
+        self.max_concurrency = max_concurrency
+        self.cache_max_bytes = cache_max_bytes
+        self.transfer_config = TransferConfig(
+            multipart_threshold=chunk_bytes,
+            multipart_chunksize=chunk_bytes,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+        self._client = None
+        self._client_pid = None
+
+    @property
+    def client(self):
+        """The S3 client of the current process: the clients are thread-safe, but not fork-safe."""
+        if self._client is None or self._client_pid != os.getpid():
+            import boto3
+            from botocore.config import Config
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                # Enough connections for the parallel parts of a transfer, and the concurrent requests of the API
+                config=Config(max_pool_connections=2 * self.max_concurrency + 10),
+            )
+            self._client_pid = os.getpid()
+        return self._client
+
+    def _key(self, path: Path) -> str:
+        return f"{self.prefix}{path.name}"
+
+    def _head(self, path: Path) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(path))
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+
+    def publish(self, path: Path) -> None:
+        """Uploads the local file `path`, in parallel parts if it is large."""
+        start_time = time.time()
+        self.client.upload_file(str(path), self.bucket, self._key(path), Config=self.transfer_config)
+        logger.debug(f"📤 Published `{path.name}` to `s3://{self.bucket}/{self._key(path)}` in `{time.time() - start_time:.2f}`s.")
+
+    def fetch(self, path: Path, cache: bool = False, missing_ok: bool = False) -> Optional[Path]:
+        """Downloads the artifact `path` into the staging directory, in parallel parts if it is large.
+
+        A cached file is only downloaded when the host has no copy of it yet. The other files are
+        downloaded on each call, and keep the modification time of the artifact, which the task
+        binaries compare (e.g. a prepared input is only used if it is newer than its input).
+
+        See `LocalStorage.fetch` for the arguments.
+        """
+        if cache and path.is_file():
+            # Marks the file as recently used
+            os.utime(path)
+            return path
+
+        head = self._head(path)
+        if head is None:
+            # A local copy left by an earlier task is stale, and must not be read as the artifact
+            path.unlink(missing_ok=True)
+            if missing_ok:
+                return None
+            raise FileNotFoundError(f"Artifact `{self._key(path)}` not found in bucket `{self.bucket}`.")
+
+        start_time = time.time()
+        # Downloaded aside, so that a concurrent reader never sees a partial file
+        download_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.download")
+        try:
+            self.client.download_file(self.bucket, self._key(path), str(download_path), Config=self.transfer_config)
+            if not cache:
+                modified_at = head["LastModified"].timestamp()
+                os.utime(download_path, (modified_at, modified_at))
+            os.replace(download_path, path)
+        finally:
+            download_path.unlink(missing_ok=True)
+        logger.debug(f"📥 Fetched `{path.name}` ({head['ContentLength']} bytes) in `{time.time() - start_time:.2f}`s.")
+
+        if cache:
+            self.evict_cache(keep=path)
+        return path
+
+    def exists(self, path: Path) -> bool:
+        return self._head(path) is not None
+
+    def stat(self, path: Path) -> Tuple[int, float]:
+        head = self._head(path)
+        if head is None:
+            raise FileNotFoundError(f"Artifact `{self._key(path)}` not found in bucket `{self.bucket}`.")
+        return head["ContentLength"], head["LastModified"].timestamp()
+
+    def read(self, path: Path) -> bytes:
+        """Reads an artifact in memory, in parallel ranged requests if it is large."""
+        from botocore.exceptions import ClientError
+
+        buffer = io.BytesIO()
+        try:
+            self.client.download_fileobj(self.bucket, self._key(path), buffer, Config=self.transfer_config)
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(f"Artifact `{self._key(path)}` not found in bucket `{self.bucket}`.") from e
+            raise
+        return buffer.getvalue()
+
+    def stream(self, path: Path, chunk_bytes: int = STREAM_CHUNK_BYTES) -> Iterator[bytes]:
+        from botocore.exceptions import ClientError
+
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(path))["Body"]
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(f"Artifact `{self._key(path)}` not found in bucket `{self.bucket}`.") from e
+            raise
+        return _read_chunks(body, chunk_bytes)
+
+    def write(self, path: Path, data: bytes) -> None:
+        self.client.upload_fileobj(io.BytesIO(data), self.bucket, self._key(path), Config=self.transfer_config)
+
+    def copy(self, source: Path, target: Path) -> None:
+        """Copies an artifact within the bucket, without transferring it through this host."""
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self._key(source)}, self.bucket, self._key(target), Config=self.transfer_config
+        )
+
+    def delete(self, path: Path) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(path))
+        path.unlink(missing_ok=True)
+
+    def list(self, prefix: str, match: Optional[Callable[[str], bool]] = None) -> List[Tuple[Path, float]]:
+        artifacts = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}{prefix}"):
+            for entry in page.get("Contents", []):
+                name = entry["Key"][len(self.prefix):]
+                if match is None or match(name):
+                    artifacts.append((self.root / name, entry["LastModified"].timestamp()))
+        return artifacts
+
+    def release(self, path: Path) -> None:
+        path.unlink(missing_ok=True)
+
+    def evict_cache(self, keep: Optional[Path] = None) -> None:
+        """Removes the least recently used cached files, but `keep`, until they fit in `cache_max_bytes`."""
+        paths = []
+        for path in self.root.glob(CACHED_FILE_PATTERN):
+            try:
+                paths.append((path.stat().st_mtime, path.stat().st_size, path))
+            except FileNotFoundError:
+                continue
+        paths.sort()
+        total_size = sum(size for _, size, _ in paths)
+        for _, size, path in paths:
+            if total_size <= self.cache_max_bytes:
+                break
+            if keep is not None and path.name == keep.name:
+                continue
+            total_size -= size
+            path.unlink(missing_ok=True)
+            logger.info(f"🗑️ Evicted `{path.name}` from the local copies of the artifact store.")
+
+
+def _is_not_found(error) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+def create_storage(root: Path):
+    """Returns the artifact store selected by `STORAGE_BACKEND`, staging its files in `root`.
+
+    Raises:
+        ValueError: Raised if the backend is unknown, or `S3_BUCKET` is not set for `s3`.
+    """
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(root)
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(root, S3_BUCKET, S3_ENDPOINT_URL, S3_PREFIX)
+    raise ValueError(f"Unknown `STORAGE_BACKEND`: `{STORAGE_BACKEND}`, expected `local` or `s3`.")
@@ -0,0 +1,58 @@
+"""Anonymized trace of the task submissions, for capacity planning (see `tests/replay_trace.py`).
+
+With `TRACE_FILE` set, the server appends one JSON line per event to this file:
+
+    {"t": 1718000000.123, "event": "add_key", "key": "9f2c…", "task_name": "weight_stats", "key_bytes": 123456}
+    {"t": 1718000004.456, "event": "start_task", "key": "9f2c…", "task": "41ab…", "task_name": "weight_stats",
+     "input_bytes": 4567, "outcome": "accepted"}
+    {"t": 1718000063.789, "event": "get_result", "key": "9f2c…", "task": "41ab…", "task_name": "weight_stats",
+     "status": "success"}
+
+`outcome` is `accepted`, `overloaded` (429) or `invalid` (422), and `status` the status of the
+task when its result was requested. No ciphertext is recorded, and UIDs and task IDs are replaced
+by keyed hashes (`TRACE_SALT`), which keep the reuse of a key across tasks but cannot be traced
+back to the server files. Processes writing to the same trace must share `TRACE_SALT`, otherwise
+a random salt is drawn at startup.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+from pathlib import Path
+from typing import Optional
+
+from utils import logger
+
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_PATH = Path(__file__).parent / TRACE_FILE if TRACE_FILE else None
+TRACE_SALT = os.getenv("TRACE_SALT") or secrets.token_hex(16)
+
+_trace_lock = threading.Lock()
+
+
+def anonymize(identifier: Optional[str]) -> Optional[str]:
+    """Returns a keyed hash of a UID or task ID."""
+    if identifier is None:
+        return None
+    return hmac.new(TRACE_SALT.encode("utf-8"), identifier.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+
+def record_trace_event(event: str, uid: str, task_id: Optional[str] = None, **fields) -> None:
+    """Appends an event to the trace, if `TRACE_FILE` is set. Never raises."""
+    if TRACE_PATH is None:
+        return
+    entry = {"t": round(time.time(), 3), "event": event, "key": anonymize(uid)}
+    if task_id is not None:
+        entry["task"] = anonymize(task_id)
+    entry.update(fields)
+    try:
+        line = json.dumps(entry) + "\n"
+        with _trace_lock, open(TRACE_PATH, "a", encoding="utf-8") as trace_file:
+            trace_file.write(line)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to record the `{event}` trace event: {e}")
@@ -1,15 +1,55 @@
+import json
 import os
+import socket
 import subprocess
+import threading
 import time
 
-from typing import Dict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import redis
 
 from celery import Celery
+from celery.exceptions import Ignore
+from celery.worker.control import control_command, nok, ok
+from celery.signals import celeryd_after_setup, worker_ready, worker_shutdown
 
 from utils import *
+from cost_model import input_size_of, mark_task_finished, mark_task_started, record_execution_time
+from cpu_budget import CPU_BUDGET, CpuAllocation
+from key_cache import (
+    KEY_WARMUP_HARD_TIME_LIMIT_SECONDS,
+    KEY_WARMUP_SOFT_TIME_LIMIT_SECONDS,
+    KEY_WARMUP_TASK_NAME,
+    cached_uids,
+    evict_key_cache,
+    remove_partial_cached_key,
+    touch_cached_key,
+)
+from lease import VISIBILITY_TIMEOUT, DuplicateTaskError, TaskLease
+from resource_usage import output_size_of, record_resource_usage, usage_from_rusage
+from routing import KEY_AFFINITY_ROUTING, usecase_queue_names, worker_queue
+from task_profiler import (
+    PROFILE_TARGETS,
+    flamegraph_state,
+    register_task_process,
+    run_profile,
+    set_flamegraph_state,
+    task_process,
+    unregister_task_process,
+)
+from time_limits import (
+    CELERY_TIME_LIMIT_MARGIN_SECONDS,
+    TASK_HARD_TIME_LIMIT_SECONDS,
+    TaskTimeLimitExceeded,
+    record_timeout,
+    remove_partial_outputs,
+    run_with_time_limits,
+    task_time_limits,
+)
+from worker_registry import WorkerStatePublisher
 
 BROKER_URL = os.getenv("BROKER_URL")
 BACKEND_URL = os.getenv("BACKEND_URL")
@@ -37,8 +77,10 @@ try:
         task_acks_late=True,
         # `task_acks_on_failure_or_timeout`: Avoid marking a task as “acknowledged” if it crashes
         task_acks_on_failure_or_timeout=False,
-        # `broker_transport_options`: X seconds before an abandoned task becomes available again
-        broker_transport_options={"visibility_timeout": 60 * 1},
+        # `broker_transport_options`: X seconds before an abandoned task becomes available again.
+        # Running tasks keep their message reserved with a heartbeat (see `lease.py`), so only the
+        # tasks of a dead worker are redelivered.
+        broker_transport_options={"visibility_timeout": VISIBILITY_TIMEOUT},
         # `worker_prefetch_multiplier`: How many tasks a Celery worker prefetchs before starting it
         worker_prefetch_multiplier=1,
         task_reject_on_worker_lost=True,
@@ -54,90 +96,575 @@ except Exception as e:
     raise RuntimeError(error_message)
 
 
-# Instanciate Redis broker data-base
+# Instanciate the Redis clients. A client only connects on its first command, and reconnects after
+# a fork, so each server or worker process has its own connection pool. A Redis that is not up yet
+# is only reported: the clients connect once it is.
+redis_bd_broker = redis.Redis(
+            host=PARSED_BROKER_URL.hostname,
+            port=PARSED_BROKER_URL.port,
+            db=int(PARSED_BROKER_URL.path.lstrip('/')),  # 0
+            decode_responses=True,
+        )
+redis_bd_backend = redis.Redis(
+    host=PARSED_BACKEND_URL.hostname,
+    port=PARSED_BACKEND_URL.port,
+    db=int(PARSED_BACKEND_URL.path.lstrip('/')),  # 1
+    decode_responses=True,
+)
+
 try:
-    redis_bd_broker = redis.Redis(
-                host=PARSED_BROKER_URL.hostname,
-                port=PARSED_BROKER_URL.port,
-                db=int(PARSED_BROKER_URL.path.lstrip('/')),  # 0
-                decode_responses=True,
-            )
     redis_bd_broker.ping()
     logger.info("🔥 Successfully connected to Redis broker!")
 except redis.ConnectionError:
-    redis_bd_broker = None
     logger.error("❌ Failed to connect to Redis broker!")
 
-# Instanciate Redis backend data-base
 try:
-    redis_bd_backend = redis.Redis(
-        host=PARSED_BACKEND_URL.hostname,
-        port=PARSED_BACKEND_URL.port,
-        db=int(PARSED_BACKEND_URL.path.lstrip('/')),  # 1
-        decode_responses=True,
-    )
     redis_bd_backend.ping()
     logger.info("🔥 Successfully connected to Redis backend!")
 except redis.ConnectionError:
-    redis_bd_backend = None
     logger.error("❌ Failed to connect to Redis backend!")
 
 
+# Key-affinity routing: each `usecases` worker container also consumes its own queue, named after its
+# hostname (the container ID under Docker), which it publishes to the worker registry with the keys
+# it has cached (see `routing.py`)
+WORKER_HOSTNAME = socket.gethostname()
+
+
+@celeryd_after_setup.connect
+def add_worker_queue(sender, instance, **kwargs):
+    if KEY_AFFINITY_ROUTING and os.getenv("RUN_TYPE") == "usecases":
+        instance.app.amqp.queues.select_add(worker_queue(WORKER_HOSTNAME))
+        logger.info(f"🔀 Worker host `{WORKER_HOSTNAME}` also consumes `{worker_queue(WORKER_HOSTNAME)}`.")
+
+
+# Every worker publishes the tasks it holds, so that the API lists them without broadcasting
+# `inspect` commands (see `worker_registry.py`)
+worker_state_publisher: Optional[WorkerStatePublisher] = None
+
+
+@worker_ready.connect
+def start_worker_state_publisher(sender, **kwargs):
+    global worker_state_publisher
+    worker_state_publisher = WorkerStatePublisher(
+        redis_bd_broker,
+        sender.hostname,
+        [queue.name for queue in sender.task_consumer.queues],
+        sender.controller.concurrency,
+        cached_uids,
+    )
+    worker_state_publisher.start()
+
+
+@worker_shutdown.connect
+def stop_worker_state_publisher(sender, **kwargs):
+    if worker_state_publisher is not None:
+        worker_state_publisher.stop()
+
+
+# On-demand profiling: `/admin/profile_task` sends this command to the worker running the task
+# (see `task_profiler.py`)
+@control_command(
+    args=[("task_id", str), ("target", str), ("duration", float)],
+    signature="<task_id> [target] [duration]",
+)
+def profile_task(state, task_id: str, target: str = "binary", duration: float = 10, **kwargs) -> Dict:
+    process = task_process(redis_bd_backend, task_id)
+    if process is None:
+        return nok(f"Task `{task_id}` is not running.")
+    if target not in PROFILE_TARGETS:
+        return nok(f"Unknown profile target `{target}`, expected one of {PROFILE_TARGETS}.")
+    previous = flamegraph_state(redis_bd_backend, task_id, target)
+    if previous is not None and previous.get("status") == "running":
+        return nok(f"Task `{task_id}` is already being profiled.")
+
+    pid = int(process["pid"] if target == "binary" else process["worker_pid"])
+    output_path = format_flamegraph_filename(process["uid"], process["task_name"], task_id, target)
+    set_flamegraph_state(
+        redis_bd_backend, task_id, target,
+        status="running", path=output_path.name, pid=pid, duration=duration, started_at=time.time(), detail="",
+    )
+    threading.Thread(
+        target=run_profile,
+        args=(redis_bd_backend, task_id, process["binary"], target, pid, duration, output_path),
+        name=f"profile-{task_id}",
+        daemon=True,
+    ).start()
+    logger.info(f"🔥 Profiling [task_id=`{get_id_prefix(task_id)}`, target=`{target}`, pid=`{pid}`] for `{duration}`s.")
+    return ok(output_path.name)
+
+
+def load_profile(profile_path: Optional[Path]) -> Optional[Dict]:
+    """Loads the JSON profile written by a task binary, if any.
+
+    Args:
+        profile_path (Optional[Path]): The path passed to the binary through `FHE_PROFILE`.
+
+    Returns:
+        Optional[Dict]: The profile, or `None` if profiling was disabled or the file is missing.
+    """
+    if profile_path is None or not profile_path.is_file():
+        return None
+    try:
+        return json.loads(profile_path.read_text(encoding="utf-8"))
+    except Exception as e:
+        task_logger.warning(f"⚠️ Failed to read profile `{profile_path}`: {e}")
+        return None
+
+
+def task_state_filenames(uid: str, task_name: str) -> List[Path]:
+    """Returns the files that a task keeps from one run to the next (`state_files` in `tasks.yaml`)."""
+    return [format_output_filename(template, uid) for template in use_cases.get(task_name, {}).get("state_files", [])]
+
+
+def stage_task_files(uid: str, task_name: str) -> List[Path]:
+    """Fetches the key, the input, the prepared input and the state of a task from the artifact
+    store (see storage.py), to the paths where the binary reads them.
+
+    The key stays on the host for the next tasks of the UID. A missing file is skipped: the
+    binary reports it, or starts from an empty state. Any other failure raises, so that a state
+    that cannot be fetched is never mistaken for a missing one.
+
+    Returns:
+        List[Path]: The files that were fetched.
+    """
+    staged_files = [artifact_store.fetch(secure_path(FILES_FOLDER, f"{uid}.serverKey"), cache=True, missing_ok=True)]
+    paths = [format_input_filename(uid, task_name), *task_state_filenames(uid, task_name)]
+    if use_cases.get(task_name, {}).get("prepare", False):
+        paths.append(format_prepared_filename(uid, task_name))
+    for path in paths:
+        staged_files.append(artifact_store.fetch(path, missing_ok=True))
+    return [path for path in staged_files if path is not None]
+
+
+def publish_task_files(uid: str, task_name: str, staged_files: List[Path]) -> None:
+    """Publishes the outputs and the state written by a task to the artifact store, and deletes
+    the prepared input that the binary consumed."""
+    for output_file in use_cases.get(task_name, {}).get("output_files", []):
+        artifact_store.publish(format_output_filename(output_file["filename"], uid))
+    for path in task_state_filenames(uid, task_name):
+        if path.is_file():
+            artifact_store.publish(path)
+    prepared_path = format_prepared_filename(uid, task_name)
+    if prepared_path in staged_files and not prepared_path.exists():
+        artifact_store.delete(prepared_path)
+
+
+def release_task_files(uid: str, task_name: str) -> None:
+    """Deletes the local copies of the files of a task, which the artifact store keeps."""
+    paths = [format_input_filename(uid, task_name), format_prepared_filename(uid, task_name), *task_state_filenames(uid, task_name)]
+    paths += [format_output_filename(output_file["filename"], uid) for output_file in use_cases.get(task_name, {}).get("output_files", [])]
+    for path in paths:
+        artifact_store.release(path)
+
+
+# Redis lock serializing the tasks that update the saved state of a UID (`state_files` in
+# `tasks.yaml`), so that two runs never start from the same state
+STATE_LOCK_TEMPLATE = "task_state_lock:{}"
+# A task waits this long for the lock, then is retried after `STATE_LOCK_RETRY_SECONDS`, so that
+# it neither holds a worker slot nor spends its own time limit while the previous task runs
+STATE_LOCK_WAIT_SECONDS = 2
+STATE_LOCK_RETRY_SECONDS = int(os.getenv("STATE_LOCK_RETRY_SECONDS", "10"))
+
+
+class StateLockedError(Exception):
+    """Raised when another task of the UID is updating its state."""
+
+
+def acquire_state_lock(uid: str, task_name: str):
+    """Takes the lock of the state of `uid`, once the previous task that updates it has finished.
+
+    The lock expires with the time limit of the Celery task, in case its worker dies while
+    holding it.
+
+    Returns:
+        The held lock, or `None` if the task keeps no state.
+
+    Raises:
+        StateLockedError: Raised if the lock is still held after `STATE_LOCK_WAIT_SECONDS`.
+    """
+    if not task_state_filenames(uid, task_name):
+        return None
+    timelimit = celery_app.current_task.request.timelimit if celery_app.current_task else None
+    timeout = (timelimit or [None])[0] or TASK_HARD_TIME_LIMIT_SECONDS + CELERY_TIME_LIMIT_MARGIN_SECONDS
+    lock = redis_bd_backend.lock(STATE_LOCK_TEMPLATE.format(uid), timeout=timeout)
+    if not lock.acquire(blocking_timeout=STATE_LOCK_WAIT_SECONDS):
+        raise StateLockedError(f"The state of UID=`{get_id_prefix(uid)}` is locked by another task.")
+    return lock
+
+
+def release_state_lock(lock) -> None:
+    if lock is None:
+        return
+    try:
+        lock.release()
+    except Exception as e:
+        task_logger.warning(f"⚠️ Failed to release the state lock `{lock.name}`: {e}")
+
+
+def allocate_cores(task_id: str, task_name: str, env: Dict) -> Tuple[Optional[CpuAllocation], Dict]:
+    """Allocates cores to a binary from the CPU budget, sized according to the current load.
+
+    Returns:
+        Tuple[Optional[CpuAllocation], Dict]: The allocation, to release once the binary exits, or
+            `None` without CPU budget or if the allocation failed, and the environment of the binary.
+    """
+    if not CPU_BUDGET:
+        return None, env
+    try:
+        queue_depth = sum(redis_bd_broker.llen(queue) for queue in usecase_queue_names(redis_bd_broker))
+        cpu_allocation = CpuAllocation(redis_bd_broker, task_id, task_name, queue_depth).acquire()
+        return cpu_allocation, cpu_allocation.env(env)
+    except Exception as e:
+        task_logger.warning(f"⚠️ Failed to allocate cores to `{task_name}`, running it unpinned: {e}")
+        return None, env
+
+
 def execute_binary(binary: str, uid: str, task_name: str) -> Dict:
     """Executes a binary command as a Celery task.
 
+    If `FHE_PROFILING` is enabled, the binary is asked to write a profile of its FHE operations
+    and phases, which is attached to the result under the `profile` key.
+
+    The binary runs in its own process group, which is stopped at the soft and hard time limits
+    of the task (see `time_limits.py`). A stopped task returns a `timeout` status, and its partial
+    outputs are removed.
+
+    The files of the task are fetched from the artifact store before the binary runs, and its
+    outputs are published once it succeeds (see `storage.py`).
+
     Args:
         binary (str): The name of the executable binary to run.
         uid (str): The unique key identifier.
         task_name (str): The name of the task to execute.
 
     Returns:
-        Dict: A dictionary containing the command's stdout, stderr, and the returned code.
+        Dict: On success, the `stdout`, `stderr` and `returncode` of the binary, its
+            `execution_time_seconds`, the `num_threads` it was given (`None` without CPU budget),
+            its `resources` usage, the `prepare` stage of its input and its `profile` (`None`
+            when missing or disabled).
+            On failure, `status: error` with a `detail` and the `execution_time_seconds` (`0.0` if
+            the files could not be fetched), plus the `stderr`, `stdout` and `returncode` of the
+            binary when it exited with an error.
+            When stopped at a time limit, `status: timeout` with a `detail`, the `limit` reached
+            (`soft` or `hard`), its `time_limit_seconds` and the `execution_time_seconds`.
 
     Raises:
-        subprocess.CalledProcessError: Raised if the binary execution fails.
+        StateLockedError: Raised before anything runs if another task of the UID is updating its state.
     """
-    commandline = [f"./{binary}", uid]
+    commandline = [f"./{binary}", uid, *use_cases.get(task_name, {}).get("args", [])]
     current_task_id = celery_app.current_task.request.id if celery_app.current_task else "UnknownCeleryID"
     task_logger.info(f"EXECUTE_BINARY: Task {task_name} (UID {get_id_prefix(uid)}, CeleryID {get_id_prefix(current_task_id)}): Preparing to run command: {' '.join(commandline)}")
-    
+
+    # Bring the key and the inputs of the task to this host, with its state once no other task of
+    # the UID is updating it; a locked state is retried by the caller
+    state_lock = acquire_state_lock(uid, task_name)
+    try:
+        staged_files = stage_task_files(uid, task_name)
+    except Exception as e:
+        error_message = f"🥕 ❌ Failed to fetch the files of `{task_name}` (UID=`{get_id_prefix(uid)}`, CeleryID=`{get_id_prefix(current_task_id)}`) from the artifact store: {e}"
+        task_logger.error(error_message)
+        release_state_lock(state_lock)
+        release_task_files(uid, task_name)
+        return {"status": "error", "detail": error_message, "execution_time_seconds": 0.0}
+
+    env = os.environ.copy()
+    profile_path = None
+    if FHE_PROFILING:
+        profile_path = format_profile_filename(uid, task_name, current_task_id)
+        env["FHE_PROFILE"] = str(profile_path)
+
+    # Pin the binary to its own cores, sized according to the current load
+    cpu_allocation, env = allocate_cores(current_task_id, task_name, env)
+
+    # Keep the cost model informed, so that the server can estimate the queue ETA
+    input_size = input_size_of(uid, task_name)
+    try:
+        mark_task_started(redis_bd_backend, current_task_id, task_name, input_size)
+    except Exception as e:
+        task_logger.warning(f"⚠️ Failed to register `{task_name}` as running in the cost model: {e}")
+
+    soft_limit, hard_limit = task_time_limits(redis_bd_backend, task_name, input_size)
+
+    # Let `/admin/profile_task` find the processes running the task
+    def register_process(process: subprocess.Popen) -> None:
+        entry = {
+            "node": celery_app.current_task.request.hostname if celery_app.current_task else "",
+            "worker_pid": os.getpid(),
+            "pid": process.pid,
+            "binary": binary,
+            "uid": uid,
+            "task_name": task_name,
+            "started_at": time.time(),
+        }
+        try:
+            register_task_process(redis_bd_backend, current_task_id, entry, hard_limit)
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to register the process of `{task_name}`: {e}")
+
     start_time = time.time()
     try:
-        result = subprocess.run(commandline, capture_output=True, check=True, text=True)
+        result = run_with_time_limits(
+            commandline, soft_limit, hard_limit, env=env,
+            preexec_fn=cpu_allocation.pin if cpu_allocation else None,
+            on_start=register_process,
+        )
         execution_time = time.time() - start_time
         task_logger.info(f"🥕 ✅ [task_name=`{task_name}`, UID=`{get_id_prefix(uid)}`, CeleryID=`{get_id_prefix(current_task_id)}`]: completed in `{execution_time:.2f}`s. Subprocess stdout (first 200 chars): {result.stdout[:200]}, stderr (first 200 chars): {result.stderr[:200]}")
-        return {"stdout": result.stdout, "stderr": result.stderr, "returncode": result.returncode, "execution_time_seconds": execution_time}
+        try:
+            record_execution_time(redis_bd_backend, task_name, execution_time, input_size)
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to update the cost model of `{task_name}`: {e}")
+        resources = usage_from_rusage(result.rusage, execution_time, input_size, output_size_of(uid, task_name))
+        task_logger.info(f"📊 Resources [task_name=`{task_name}`]: cpu=`{resources['cpu_seconds']}`s, utilization=`{resources['cpu_utilization']}`, peak_rss=`{resources['peak_rss_bytes'] / 1024 ** 2:.1f}`MB, disk_read=`{resources['disk_read_bytes']}`B, disk_write=`{resources['disk_write_bytes']}`B")
+        try:
+            record_resource_usage(redis_bd_backend, task_name, input_size, resources)
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to record the resource usage of `{task_name}`: {e}")
+        publish_task_files(uid, task_name, staged_files)
+        return {
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "returncode": result.returncode,
+            "execution_time_seconds": execution_time,
+            "num_threads": len(cpu_allocation.cores) if cpu_allocation else None,
+            "resources": resources,
+            "prepare": load_prepare_stage(current_task_id, start_time),
+            "profile": load_profile(profile_path),
+        }
 
     except subprocess.CalledProcessError as e:
         execution_time = time.time() - start_time
         error_message = f"🥕 ❌ CalledProcessError for `{binary}` (UID=`{get_id_prefix(uid)}`, CeleryID=`{get_id_prefix(current_task_id)}`) after {execution_time:.2f}s: `{e.stderr}`. Stdout: `{e.stdout}`. Return code: {e.returncode}"
         task_logger.error(error_message)
         return {"status": "error", "detail": error_message, "stderr": e.stderr, "stdout": e.stdout, "returncode": e.returncode, "execution_time_seconds": execution_time}
-    except subprocess.TimeoutExpired as e:
+    except TaskTimeLimitExceeded as e:
         execution_time = time.time() - start_time
-        error_message = f"🥕 ❌ TimeoutExpired for `{binary}` (UID=`{get_id_prefix(uid)}`, CeleryID=`{get_id_prefix(current_task_id)}`) after {execution_time:.2f}s (timeout was {e.timeout}s). Stdout: {e.stdout.decode(errors='ignore') if e.stdout else ''}, Stderr: {e.stderr.decode(errors='ignore') if e.stderr else ''}"
+        error_message = f"🥕 ⏱️ `{binary}` stopped at its {e.limit} time limit (UID=`{get_id_prefix(uid)}`, CeleryID=`{get_id_prefix(current_task_id)}`) after {execution_time:.2f}s (limit was {e.timeout:.0f}s). Stdout: {e.stdout or ''}, Stderr: {e.stderr or ''}"
         task_logger.error(error_message)
-        return {"status": "error", "detail": error_message, "execution_time_seconds": execution_time}
+        remove_partial_outputs(uid, task_name)
+        try:
+            record_timeout(redis_bd_backend, task_name, e.limit)
+        except Exception as record_error:
+            task_logger.warning(f"⚠️ Failed to record the timeout of `{task_name}`: {record_error}")
+        return {
+            "status": "timeout",
+            "detail": error_message,
+            "limit": e.limit,
+            "time_limit_seconds": e.timeout,
+            "execution_time_seconds": execution_time,
+        }
     except Exception as e:
         execution_time = time.time() - start_time
         error_message = f"🥕 ❌ Generic Exception for `{binary}` (UID=`{get_id_prefix(uid)}`, CeleryID=`{get_id_prefix(current_task_id)}`) after {execution_time:.2f}s: {str(e)}"
         task_logger.error(error_message)
         return {"status": "error", "detail": error_message, "execution_time_seconds": execution_time}
+    finally:
+        if cpu_allocation is not None:
+            cpu_allocation.release()
+        release_state_lock(state_lock)
+        release_task_files(uid, task_name)
+        try:
+            touch_cached_key(uid)
+            evict_key_cache()
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to maintain the key cache: {e}")
+        try:
+            mark_task_finished(redis_bd_backend, current_task_id)
+            unregister_task_process(redis_bd_backend, current_task_id)
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to unregister `{task_name}` from the running tasks: {e}")
+
+
+def execute_binary_with_lease(task, binary: str, uid: str, task_name: str) -> Dict:
+    """Executes a binary while holding the lease of the Celery task.
+
+    A redelivered copy of a task that has already succeeded, or that is still running on another
+    worker, is dropped instead of being executed twice.
+
+    Args:
+        task: The bound Celery task.
+        binary (str): The name of the executable binary to run.
+        uid (str): The unique key identifier.
+        task_name (str): The name of the task to execute.
+
+    Returns:
+        Dict: The result of `execute_binary`.
+
+    Raises:
+        Ignore: Raised for a duplicate delivery, so that it is acknowledged without overwriting
+            the state of the original execution.
+        Retry: Raised if another task of the UID is updating its state, to run the task again
+            after `STATE_LOCK_RETRY_SECONDS` without holding a worker slot meanwhile.
+    """
+    task_id = task.request.id
+
+    # A message prefetched by a busy worker may be redelivered, and completed elsewhere, before
+    # this worker starts it
+    meta = redis_bd_backend.get(f"celery-task-meta-{task_id}")
+    if meta is not None and json.loads(meta).get("status") == "SUCCESS":
+        task_logger.warning(f"♻️ Duplicate delivery of [task_id=`{get_id_prefix(task_id)}`] dropped: the task already succeeded.")
+        raise Ignore()
+
+    try:
+        with TaskLease(redis_bd_broker, task_id):
+            return execute_binary(binary, uid, task_name)
+    except DuplicateTaskError as e:
+        task_logger.warning(f"♻️ Duplicate delivery of [task_id=`{get_id_prefix(task_id)}`] dropped: {e}")
+        raise Ignore()
+    except StateLockedError as e:
+        task_logger.info(f"🔒 [task_id=`{get_id_prefix(task_id)}`] retried in `{STATE_LOCK_RETRY_SECONDS}`s: {e}")
+        raise task.retry(countdown=STATE_LOCK_RETRY_SECONDS)
 
 
 # Queue 1: `use-cases`
-@celery_app.task(name="tasks.run_binary_task", bind=True, queue="usecases")
+# Retried for as long as the state of its UID is locked, which expires with the holder's time limit
+@celery_app.task(name="tasks.run_binary_task", bind=True, queue="usecases", max_retries=None)
 def run_binary_task(self, binary: str, uid: str, task_name: str) -> Dict:
     task_logger.info(f"CELERY_TASK run_binary_task: Received. Binary: {binary}, UID: {get_id_prefix(uid)}, Task Name: {task_name}, Celery Task ID: {get_id_prefix(self.request.id)}")
-    result = execute_binary(binary, uid, task_name)
+    result = execute_binary_with_lease(self, binary, uid, task_name)
     task_logger.info(f"CELERY_TASK run_binary_task: Completed execution for UID {get_id_prefix(uid)}, Task Name: {task_name}, Celery Task ID: {get_id_prefix(self.request.id)}. Result status: {result.get('status', 'success') if isinstance(result, dict) else 'unknown'}")
     return result
 
 
+# Speculative decompression of a new key, enqueued by `/add_key` on the queue of its first task.
+# A lost warm-up only costs the next task a cold key load, so it is neither retried nor redelivered.
+# Like the tasks, it runs within time limits and on cores allocated by the CPU budget.
+@celery_app.task(
+    name="tasks.warm_key", bind=True, queue="usecases", acks_late=False, ignore_result=True,
+    soft_time_limit=KEY_WARMUP_HARD_TIME_LIMIT_SECONDS + CELERY_TIME_LIMIT_MARGIN_SECONDS,
+    time_limit=KEY_WARMUP_HARD_TIME_LIMIT_SECONDS + 2 * CELERY_TIME_LIMIT_MARGIN_SECONDS,
+)
+def warm_key(self, binary: str, uid: str) -> None:
+    task_logger.info(f"CELERY_TASK warm_key: Received. Binary: {binary}, UID: {get_id_prefix(uid)}, Celery Task ID: {get_id_prefix(self.request.id)}")
+    try:
+        mark_task_started(redis_bd_backend, self.request.id, KEY_WARMUP_TASK_NAME, None)
+    except Exception as e:
+        task_logger.warning(f"⚠️ Failed to register the key warm-up as running in the cost model: {e}")
+
+    cpu_allocation = None
+    start_time = time.time()
+    try:
+        artifact_store.fetch(secure_path(FILES_FOLDER, f"{uid}.serverKey"), cache=True)
+        cpu_allocation, env = allocate_cores(self.request.id, KEY_WARMUP_TASK_NAME, os.environ.copy())
+        result = run_with_time_limits(
+            [f"./{binary}", uid, "--warmup"], KEY_WARMUP_SOFT_TIME_LIMIT_SECONDS, KEY_WARMUP_HARD_TIME_LIMIT_SECONDS, env=env,
+            preexec_fn=cpu_allocation.pin if cpu_allocation else None,
+        )
+        execution_time = time.time() - start_time
+        task_logger.info(f"🔥 Key warm-up [UID=`{get_id_prefix(uid)}`] completed in `{execution_time:.2f}`s: {result.stdout.strip()}")
+        record_execution_time(redis_bd_backend, KEY_WARMUP_TASK_NAME, execution_time)
+        touch_cached_key(uid)
+        evict_key_cache()
+    except TaskTimeLimitExceeded as e:
+        task_logger.warning(f"⚠️ Key warm-up [UID=`{get_id_prefix(uid)}`] stopped at its {e.limit} time limit (`{e.timeout:.0f}`s).")
+        remove_partial_cached_key(uid)
+        try:
+            record_timeout(redis_bd_backend, KEY_WARMUP_TASK_NAME, e.limit)
+        except Exception as record_error:
+            task_logger.warning(f"⚠️ Failed to record the timeout of the key warm-up: {record_error}")
+    except subprocess.CalledProcessError as e:
+        task_logger.warning(f"⚠️ Key warm-up failed for UID=`{get_id_prefix(uid)}`: `{e.stderr}`")
+    except Exception as e:
+        task_logger.warning(f"⚠️ Key warm-up failed for UID=`{get_id_prefix(uid)}`: {e}")
+    finally:
+        if cpu_allocation is not None:
+            cpu_allocation.release()
+        try:
+            mark_task_finished(redis_bd_backend, self.request.id)
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to unregister the key warm-up from the running tasks: {e}")
+
+
 # Queue 2: `ads`
 @celery_app.task(name="tasks.fetch_ad", bind=True, queue="ads")
 def fetch_ad(self, binary: str, uid: str) -> Dict:
     task_logger.info(f"CELERY_TASK fetch_ad: Received. Binary: {binary}, UID: {get_id_prefix(uid)}, Celery Task ID: {get_id_prefix(self.request.id)}")
-    result = execute_binary(binary, uid, "fetch_ad")
+    result = execute_binary_with_lease(self, binary, uid, "fetch_ad")
     task_logger.info(f"CELERY_TASK fetch_ad: Completed execution for UID {get_id_prefix(uid)}, Celery Task ID: {get_id_prefix(self.request.id)}. Result status: {result.get('status', 'success') if isinstance(result, dict) else 'unknown'}")
     return result
+
+
+# Queue 3: `prepare`
+# Expands the input of a queued task ahead of its execution, on spare capacity: the binary runs at
+# a lower CPU priority than the tasks, and the preparation is dropped once the task has started.
+PREPARE_STAGE_KEY_TEMPLATE = "task_prepare:{}"
+PREPARE_NICENESS = 10
+
+
+def task_has_started(task_id: str) -> bool:
+    # The backend has no entry for a task that is still queued
+    return redis_bd_backend.get(f"celery-task-meta-{task_id}") is not None
+
+
+@celery_app.task(name="tasks.prepare_input", bind=True, queue="prepare", acks_late=False, ignore_result=True)
+def prepare_input(self, binary: str, uid: str, task_name: str, task_id: str) -> None:
+    task_logger.info(f"CELERY_TASK prepare_input: Received. Binary: {binary}, UID: {get_id_prefix(uid)}, Task Name: {task_name}, for task ID: {get_id_prefix(task_id)}")
+    if task_has_started(task_id):
+        task_logger.info(f"🧺 Preparation of [task_id=`{get_id_prefix(task_id)}`] skipped: the task has already started.")
+        return
+
+    commandline = [f"./{binary}", uid, *use_cases.get(task_name, {}).get("args", []), "--prepare"]
+    env = os.environ.copy()
+    if FHE_PROFILING:
+        env["FHE_PROFILE"] = str(format_profile_filename(uid, f"{task_name}_prepare", task_id))
+
+    stage = {"started_at": time.time()}
+    try:
+        artifact_store.fetch(secure_path(FILES_FOLDER, f"{uid}.serverKey"), cache=True)
+        artifact_store.fetch(format_input_filename(uid, task_name))
+    except Exception as e:
+        task_logger.warning(f"⚠️ Preparation of [task_id=`{get_id_prefix(task_id)}`] skipped: failed to fetch its files from the artifact store: {e}")
+        return
+    try:
+        # Bounded by the limits of the task itself, since it does a part of the task's work
+        soft_limit, hard_limit = task_time_limits(redis_bd_backend, task_name, input_size_of(uid, task_name))
+        run_with_time_limits(commandline, soft_limit, hard_limit, env=env, preexec_fn=lambda: os.nice(PREPARE_NICENESS))
+        stage["status"] = "success"
+    except TaskTimeLimitExceeded as e:
+        stage["status"] = "timeout"
+        task_logger.warning(f"⚠️ Preparation of [task_id=`{get_id_prefix(task_id)}`] stopped at its {e.limit} time limit.")
+    except subprocess.CalledProcessError as e:
+        stage["status"] = "error"
+        task_logger.warning(f"⚠️ Preparation of [task_id=`{get_id_prefix(task_id)}`] failed, the task will expand its input itself: `{e.stderr}`")
+    except Exception as e:
+        stage["status"] = "error"
+        task_logger.warning(f"⚠️ Preparation of [task_id=`{get_id_prefix(task_id)}`] failed, the task will expand its input itself: {e}")
+    finally:
+        # A preparation that did not complete leaves its partial output behind
+        for path in FILES_FOLDER.glob(f"{uid}.{task_name}.prepared.fheencrypted.*.tmp"):
+            path.unlink(missing_ok=True)
+    stage["finished_at"] = time.time()
+    stage["seconds"] = round(stage["finished_at"] - stage["started_at"], 2)
+
+    # If the task started in the meantime, it expanded its input itself
+    if stage["status"] == "success" and task_has_started(task_id):
+        stage["status"] = "too_late"
+        format_prepared_filename(uid, task_name).unlink(missing_ok=True)
+    if stage["status"] == "success":
+        try:
+            artifact_store.publish(format_prepared_filename(uid, task_name))
+        except Exception as e:
+            stage["status"] = "error"
+            task_logger.warning(f"⚠️ Failed to publish the prepared input of [task_id=`{get_id_prefix(task_id)}`]: {e}")
+    # The local copy of the input is left to the task, which may already be reading it on this host
+    artifact_store.release(format_prepared_filename(uid, task_name))
+    task_logger.info(f"🧺 Preparation of [task_id=`{get_id_prefix(task_id)}`]: `{stage['status']}` in `{stage['seconds']}`s.")
+
+    try:
+        redis_bd_backend.set(PREPARE_STAGE_KEY_TEMPLATE.format(task_id), json.dumps(stage), ex=24 * 60 * 60)
+    except Exception as e:
+        task_logger.warning(f"⚠️ Failed to record the preparation of [task_id=`{get_id_prefix(task_id)}`]: {e}")
+
+
+def load_prepare_stage(task_id: str, execution_started_at: float) -> Optional[Dict]:
+    """Returns the preparation of a task, if any, and whether it completed before the execution."""
+    try:
+        raw = redis_bd_backend.get(PREPARE_STAGE_KEY_TEMPLATE.format(task_id))
+    except Exception:
+        return None
+    if raw is None:
+        return None
+    stage = json.loads(raw)
+    stage["ready_before_execution"] = stage["status"] == "success" and stage["finished_at"] <= execution_started_at
+    return stage
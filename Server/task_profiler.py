@@ -0,0 +1,133 @@
+"""On-demand sampling profiles of running tasks.
+
+While a task runs, its worker records which process executes it (the Celery node, the PID of the
+pool process and the PID of the binary) in the Redis backend data-base. `/admin/profile_task`
+looks the task up there and asks its worker, with a Celery control command, to sample the
+process for a bounded duration:
+
+- the Rust binaries with `perf record`, folded into a flamegraph with `inferno`,
+- the Python binaries (e.g. `ad_targeting.py`) and the worker process itself with `py-spy`.
+
+The flamegraph is written next to the outputs of the task
+(`<uid>.<task_name>.<task_id>.<target>.flamegraph.svg`) and published to the artifact store, and
+the state of the profile is kept in Redis until it can be downloaded from `/admin/flamegraph`.
+"""
+
+import os
+import subprocess
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils import artifact_store, logger
+
+# Redis hashes of the process running each task, and of the state of its profiles
+TASK_PROCESS_KEY_TEMPLATE = "task_process:{}"
+FLAMEGRAPH_KEY_TEMPLATE = "task_flamegraph:{}:{}"
+FLAMEGRAPH_STATE_TTL_SECONDS = 24 * 60 * 60
+
+# Upper bound of a profile duration, and sampling frequency of the profilers
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_SAMPLE_HZ = int(os.getenv("PROFILER_SAMPLE_HZ", "99"))
+
+# `binary`: the process of the task binary, `worker`: the Celery pool process running the task
+PROFILE_TARGETS = ["binary", "worker"]
+
+
+def register_task_process(redis_client, task_id: str, entry: Dict, ttl_seconds: float) -> None:
+    """Records the process running a task, until it finishes or `ttl_seconds` elapse."""
+    key = TASK_PROCESS_KEY_TEMPLATE.format(task_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping=entry)
+    pipe.expire(key, int(ttl_seconds))
+    pipe.execute()
+
+
+def unregister_task_process(redis_client, task_id: str) -> None:
+    redis_client.delete(TASK_PROCESS_KEY_TEMPLATE.format(task_id))
+
+
+def task_process(redis_client, task_id: str) -> Optional[Dict]:
+    """Returns the process running a task, or `None` if the task is not running."""
+    entry = redis_client.hgetall(TASK_PROCESS_KEY_TEMPLATE.format(task_id))
+    return entry or None
+
+
+def flamegraph_state(redis_client, task_id: str, target: str) -> Optional[Dict]:
+    """Returns the state of the last profile of a task (`running`, `done` or `error`), if any."""
+    entry = redis_client.hgetall(FLAMEGRAPH_KEY_TEMPLATE.format(task_id, target))
+    return entry or None
+
+
+def set_flamegraph_state(redis_client, task_id: str, target: str, **fields) -> None:
+    key = FLAMEGRAPH_KEY_TEMPLATE.format(task_id, target)
+    pipe = redis_client.pipeline()
+    pipe.hset(key, mapping={name: value for name, value in fields.items() if value is not None})
+    pipe.expire(key, FLAMEGRAPH_STATE_TTL_SECONDS)
+    pipe.execute()
+
+
+def profiler_commands(binary: str, target: str, pid: int, duration: float, output_path: Path, perf_data: Path) -> List[List[str]]:
+    """Returns the commands sampling `pid` for `duration` seconds into an SVG flamegraph.
+
+    Python processes are sampled with `py-spy`, native ones with `perf`. The last command of the
+    `perf` pipeline writes the flamegraph to its standard output.
+    """
+    if target == "worker" or binary.endswith(".py"):
+        return [[
+            "py-spy", "record", "--pid", str(pid), "--duration", str(int(duration)),
+            "--rate", str(PROFILER_SAMPLE_HZ), "--format", "flamegraph", "--output", str(output_path), "--nonblocking",
+        ]]
+    return [
+        ["perf", "record", "-F", str(PROFILER_SAMPLE_HZ), "-g", "-p", str(pid), "-o", str(perf_data), "--", "sleep", str(duration)],
+        ["perf", "script", "-i", str(perf_data)],
+        ["inferno-collapse-perf"],
+        ["inferno-flamegraph", "--title", output_path.name],
+    ]
+
+
+def record_flamegraph(binary: str, target: str, pid: int, duration: float, output_path: Path) -> None:
+    """Samples a process and writes its flamegraph to `output_path`.
+
+    Raises:
+        subprocess.CalledProcessError: Raised if a profiler fails, e.g. when the process exits
+            before the end of the profile, or the container is not allowed to trace it.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        perf_data = Path(tmp_dir) / "perf.data"
+        commands = profiler_commands(binary, target, pid, duration, output_path, perf_data)
+        # Stopping a sample a little late is fine, hanging forever is not
+        timeout = duration + 120
+        subprocess.run(commands[0], check=True, capture_output=True, text=True, timeout=timeout)
+        if len(commands) == 1:
+            return
+
+        data = None
+        for command in commands[1:]:
+            data = subprocess.run(command, input=data, check=True, capture_output=True, text=True, timeout=timeout).stdout
+        tmp_output = output_path.with_name(f"{output_path.name}.tmp")
+        tmp_output.write_text(data, encoding="utf-8")
+        tmp_output.replace(output_path)
+
+
+def run_profile(redis_client, task_id: str, binary: str, target: str, pid: int, duration: float, output_path: Path) -> None:
+    """Records a flamegraph and keeps its state up to date in Redis (run in a background thread)."""
+    start_time = time.time()
+    try:
+        record_flamegraph(binary, target, pid, duration, output_path)
+        # The API serving `/admin/flamegraph` may run on another host
+        artifact_store.publish(output_path)
+    except subprocess.CalledProcessError as e:
+        detail = f"`{e.cmd[0]}` failed with return code {e.returncode}: {(e.stderr or '').strip()[-500:]}"
+        logger.error(f"🔥 ❌ Profile of [task_id=`{task_id}`, target=`{target}`] failed: {detail}")
+        set_flamegraph_state(redis_client, task_id, target, status="error", detail=detail, finished_at=time.time())
+        return
+    except Exception as e:
+        logger.error(f"🔥 ❌ Profile of [task_id=`{task_id}`, target=`{target}`] failed: {e}")
+        set_flamegraph_state(redis_client, task_id, target, status="error", detail=str(e), finished_at=time.time())
+        return
+
+    logger.info(f"🔥 Profile of [task_id=`{task_id}`, target=`{target}`] written to `{output_path}` in `{time.time() - start_time:.2f}`s.")
+    set_flamegraph_state(redis_client, task_id, target, status="done", finished_at=time.time())
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import json
+import os
 import pickle as pkl
 import sys
 
@@ -8,6 +10,23 @@ import numpy as np
 
 from time import time
 
+
+def write_profile(phases, metadata):
+    """Write the phase timings to the `FHE_PROFILE` path, if profiling is enabled."""
+    profile_path = os.getenv("FHE_PROFILE")
+    if not profile_path:
+        return
+
+    profile = {
+        "task_name": "ad_targeting",
+        "metadata": metadata,
+        "operations": [],
+        "phases": [{"name": name, "seconds": seconds} for name, seconds in phases],
+    }
+    with open(profile_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+
+
 def main():
     if len(sys.argv) < 2:
         print("No arguments provided.")
@@ -28,7 +47,10 @@ def main():
 
     print(f"Paths:\n" f"\tsk: {sk_path}\n" f"\tin: {input_path}\n" f"\tout: {output_path}")
 
+    phases = []
+
     # Load the serialized key
+    phase_start = time()
     with open(sk_path, "rb") as binary_file:
         serialized_ckey = binary_file.read()
 
@@ -36,8 +58,10 @@ def main():
     compression_key = fhext.deserialize_compression_key(serialized_ckey)
 
     print("ServerKey set")
+    phases.append(("load_key", time() - phase_start))
 
     # Load the encrypted input matrix
+    phase_start = time()
     with open(input_path, "rb") as binary_file:
         serialized_ciphertext = binary_file.read()
 
@@ -51,6 +75,7 @@ def main():
     # Unsigned integers [0, 2⁶⁴ - 1]
     CRYPTO_DTYPE = np.uint64
     b = b.astype(CRYPTO_DTYPE)
+    phases.append(("load_input", time() - phase_start))
 
     start_time = time()
     # Perform matrix multiplication
@@ -58,11 +83,16 @@ def main():
         encrypted_matrix=deserialized_encrypted_a, data=b, compression_key=compression_key
     )
     end_time = time() - start_time
+    phases.append(("compute", end_time))
     print(f"Ad targeting use-case: execution time = {end_time:.2f}s with {device =}")
 
     # Save the encrypted result
+    phase_start = time()
     with open(output_path, "wb") as binary_file:
         binary_file.write(encrypted_scores.serialize())
+    phases.append(("serialize", time() - phase_start))
+
+    write_profile(phases, {"num_ads": int(b.shape[1])})
 
     print("Successful end")
     print("\n========\n")
@@ -0,0 +1,250 @@
+//! Chunked encrypted inputs, expanded and consumed one chunk at a time.
+//!
+//! A legacy input file holds a single bincode-serialized `CompactCiphertextList`, which has to
+//! be expanded at once. A chunked input file starts with `CHUNKED_INPUT_MAGIC`, followed by a
+//! bincode-serialized `Vec<CompactCiphertextList>`. Chunks are deserialized lazily from the file
+//! and expanded on a background thread while the caller consumes the previous chunk, so that at
+//! most two expanded chunks are alive at any time: peak memory is O(chunk) rather than O(n).
+//!
+//! While a task waits in the queue, `--prepare` expands its input ahead of time and stages the
+//! expanded chunks next to it (`<uid>.<task>.prepared.fheencrypted`): `PREPARED_INPUT_MAGIC`,
+//! followed by one bincode-serialized `Some(chunk)` per chunk and a final `None`. The task then
+//! reads the staged chunks instead of expanding its input.
+//!
+//! `--validate` checks the framing of an input at upload time, without expanding it (see
+//! `validate_input`).
+use std::fs::{self, File};
+use std::io::{BufReader, BufWriter, Read, Seek, SeekFrom, Write};
+use std::path::Path;
+use std::sync::mpsc;
+use std::thread;
+
+use bincode::Options;
+use serde::de::DeserializeOwned;
+use serde::Serialize;
+use tfhe::{set_server_key, CompactCiphertextList, CompactCiphertextListExpander, ServerKey};
+
+use crate::profiling;
+
+pub const CHUNKED_INPUT_MAGIC: &[u8; 8] = b"FHECHNK1";
+pub const PREPARED_INPUT_MAGIC: &[u8; 8] = b"FHEPREP1";
+
+pub fn prepared_path(input_path: &str) -> String {
+    input_path.replace(".input.fheencrypted", ".prepared.fheencrypted")
+}
+
+/// Serializes the chunks of an input in the chunked format.
+#[allow(dead_code)]
+pub fn serialize_chunks(chunks: &[CompactCiphertextList], path: &str) {
+    let mut serialized = CHUNKED_INPUT_MAGIC.to_vec();
+    bincode::serialize_into(&mut serialized, chunks).expect("Failed to serialize encrypted chunks.");
+    fs::write(Path::new(path), serialized).expect("Failed to write serialized encrypted chunks to file.");
+}
+
+/// Returns an iterator over the (compact) chunks of an input file, read lazily.
+fn read_chunks(path: &str) -> Box<dyn Iterator<Item = CompactCiphertextList> + Send> {
+    let mut reader = BufReader::new(File::open(Path::new(path)).expect("Failed to open input file."));
+
+    let mut magic = [0u8; 8];
+    let is_chunked = reader.read_exact(&mut magic).is_ok() && &magic == CHUNKED_INPUT_MAGIC;
+
+    if !is_chunked {
+        // Legacy format: the whole input is a single `CompactCiphertextList`
+        let serialized_list = fs::read(Path::new(path)).unwrap();
+        let list: CompactCiphertextList = bincode::deserialize(&serialized_list).unwrap();
+        return Box::new(std::iter::once(list));
+    }
+
+    let num_chunks: u64 = bincode::deserialize_from(&mut reader).expect("Failed to read the number of chunks.");
+    Box::new((0..num_chunks).map(move |_| {
+        bincode::deserialize_from(&mut reader).expect("Failed to deserialize an encrypted chunk.")
+    }))
+}
+
+/// Expands the input chunk by chunk and calls `consume` on each expanded chunk, in order.
+///
+/// The next chunk is expanded on a background thread while `consume` runs on the current one.
+pub fn for_each_expanded_chunk<F>(path: &str, server_key: &ServerKey, mut consume: F) -> usize
+where
+    F: FnMut(&CompactCiphertextListExpander),
+{
+    let mut num_chunks = 0;
+
+    thread::scope(|scope| {
+        // A rendezvous channel: the producer holds at most one expanded chunk ahead of the consumer
+        let (sender, receiver) = mpsc::sync_channel::<CompactCiphertextListExpander>(0);
+
+        scope.spawn(move || {
+            // Server keys are thread-local
+            set_server_key(server_key.clone());
+            for chunk in read_chunks(path) {
+                let expanded = {
+                    let _phase = profiling::phase("expand");
+                    chunk.expand().unwrap()
+                };
+                if sender.send(expanded).is_err() {
+                    break;
+                }
+            }
+        });
+
+        for expanded in receiver {
+            let _phase = profiling::phase("compute");
+            consume(&expanded);
+            num_chunks += 1;
+        }
+    });
+
+    num_chunks
+}
+
+/// Expands every chunk of the input, converts it with `convert` and stages the result, so that
+/// the task can skip the expansion. Returns the number of chunks.
+pub fn prepare_input<T, C>(path: &str, convert: C) -> usize
+where
+    T: Serialize,
+    C: Fn(&CompactCiphertextListExpander) -> T,
+{
+    let staged_path = prepared_path(path);
+    let tmp_path = format!("{}.{}.tmp", staged_path, std::process::id());
+    let mut writer = BufWriter::new(File::create(Path::new(&tmp_path)).expect("Failed to create the prepared input file."));
+    writer.write_all(PREPARED_INPUT_MAGIC).unwrap();
+
+    let mut num_chunks = 0;
+    for chunk in read_chunks(path) {
+        let converted = {
+            let _phase = profiling::phase("expand");
+            convert(&chunk.expand().unwrap())
+        };
+        let _phase = profiling::phase("stage");
+        bincode::serialize_into(&mut writer, &Some(converted)).expect("Failed to stage an expanded chunk.");
+        num_chunks += 1;
+    }
+    bincode::serialize_into(&mut writer, &None::<T>).unwrap();
+    writer.flush().expect("Failed to write the prepared input file.");
+
+    // Renamed once complete, so that the task never reads a partially staged input
+    fs::rename(&tmp_path, &staged_path).expect("Failed to stage the prepared input.");
+    num_chunks
+}
+
+/// Opens the staged chunks of an input, unless they are missing or older than the input.
+fn open_prepared(path: &str) -> Option<BufReader<File>> {
+    let staged_path = prepared_path(path);
+    let prepared_at = fs::metadata(&staged_path).and_then(|m| m.modified()).ok()?;
+    let uploaded_at = fs::metadata(path).and_then(|m| m.modified()).ok()?;
+    if prepared_at < uploaded_at {
+        return None;
+    }
+    let mut reader = BufReader::new(File::open(Path::new(&staged_path)).ok()?);
+    let mut magic = [0u8; 8];
+    if reader.read_exact(&mut magic).is_err() || &magic != PREPARED_INPUT_MAGIC {
+        return None;
+    }
+    Some(reader)
+}
+
+/// Calls `consume` on each chunk of the input, converted by `convert`, in order.
+///
+/// Reads the chunks staged by `prepare_input` if there are any, and removes them once consumed.
+/// Otherwise, expands the input on the fly, as `for_each_expanded_chunk`.
+pub fn for_each_input_chunk<T, C, F>(path: &str, server_key: &ServerKey, convert: C, mut consume: F) -> usize
+where
+    T: DeserializeOwned,
+    C: Fn(&CompactCiphertextListExpander) -> T,
+    F: FnMut(T),
+{
+    let Some(mut reader) = open_prepared(path) else {
+        profiling::set_metadata("prepared_input", 0);
+        return for_each_expanded_chunk(path, server_key, |expanded| consume(convert(expanded)));
+    };
+    profiling::set_metadata("prepared_input", 1);
+
+    let mut num_chunks = 0;
+    loop {
+        let chunk: Option<T> = {
+            let _phase = profiling::phase("load_prepared");
+            bincode::deserialize_from(&mut reader).expect("Failed to deserialize a prepared chunk.")
+        };
+        let Some(chunk) = chunk else {
+            break;
+        };
+        let _phase = profiling::phase("compute");
+        consume(chunk);
+        num_chunks += 1;
+    }
+
+    let _ = fs::remove_file(prepared_path(path));
+    num_chunks
+}
+
+/// Bincode options matching `bincode::serialize`, with the size of any length-prefixed value
+/// bounded by `limit`, so that a corrupted length cannot trigger a huge allocation.
+fn bounded_options(limit: u64) -> impl Options {
+    bincode::DefaultOptions::new()
+        .with_fixint_encoding()
+        .allow_trailing_bytes()
+        .with_limit(limit)
+}
+
+/// Checks that a legacy or chunked input file is well-formed, without expanding it: the chunks
+/// deserialize as compact lists, and no bytes are missing or left over.
+///
+/// Returns the number of ciphertexts of each chunk, or the reason the input is malformed.
+pub fn validate_input(path: &str) -> Result<Vec<usize>, String> {
+    let file = File::open(Path::new(path)).map_err(|e| format!("Cannot open the input: {}", e))?;
+    let file_size = file.metadata().map_err(|e| format!("Cannot read the input: {}", e))?.len();
+    if file_size == 0 {
+        return Err("The input is empty.".to_string());
+    }
+    let mut reader = BufReader::new(file);
+
+    let mut magic = [0u8; 8];
+    let is_chunked = reader.read_exact(&mut magic).is_ok() && &magic == CHUNKED_INPUT_MAGIC;
+    let num_chunks = if is_chunked {
+        bounded_options(file_size)
+            .deserialize_from(&mut reader)
+            .map_err(|e| format!("Malformed chunked input header: {}", e))?
+    } else {
+        reader.seek(SeekFrom::Start(0)).map_err(|e| format!("Cannot read the input: {}", e))?;
+        1
+    };
+    read_list_lengths(&mut reader, num_chunks, file_size)
+}
+
+/// Checks that a file holds a bincode-serialized `Vec<CompactCiphertextList>` (e.g. a batch of
+/// independent inputs), and returns the number of ciphertexts of each list.
+#[allow(dead_code)]
+pub fn validate_lists(path: &str) -> Result<Vec<usize>, String> {
+    let file = File::open(Path::new(path)).map_err(|e| format!("Cannot open the input: {}", e))?;
+    let file_size = file.metadata().map_err(|e| format!("Cannot read the input: {}", e))?.len();
+    let mut reader = BufReader::new(file);
+    let num_lists = bounded_options(file_size)
+        .deserialize_from(&mut reader)
+        .map_err(|e| format!("Malformed input header: {}", e))?;
+    read_list_lengths(&mut reader, num_lists, file_size)
+}
+
+fn read_list_lengths<R: Read>(reader: &mut R, num_lists: u64, file_size: u64) -> Result<Vec<usize>, String> {
+    if num_lists == 0 {
+        return Err("The input holds no ciphertext list.".to_string());
+    }
+    // Each list takes several bytes, so a larger count can only come from a corrupted header
+    if num_lists > file_size {
+        return Err(format!("The input claims {} lists in {} bytes.", num_lists, file_size));
+    }
+
+    let mut lengths = Vec::new();
+    for i in 0..num_lists {
+        let list: CompactCiphertextList = bounded_options(file_size)
+            .deserialize_from(&mut *reader)
+            .map_err(|e| format!("Malformed or truncated ciphertext list {}: {}", i, e))?;
+        lengths.push(list.len());
+    }
+
+    let mut trailing = [0u8; 1];
+    if reader.read(&mut trailing).map_err(|e| format!("Cannot read the input: {}", e))? != 0 {
+        return Err("Unexpected bytes after the last ciphertext list.".to_string());
+    }
+    Ok(lengths)
+}
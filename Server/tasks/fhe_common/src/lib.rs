@@ -0,0 +1,4 @@
+//! Modules shared by the FHE task binaries.
+pub mod input_stream;
+pub mod profiling;
+pub mod server_key;
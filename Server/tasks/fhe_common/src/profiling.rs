@@ -0,0 +1,97 @@
+//! Opt-in FHE profiling: operation counters and phase timers.
+//!
+//! Profiling is enabled by setting the `FHE_PROFILE` environment variable to the path of the
+//! JSON profile to write. When it is unset, `count` is a no-op and no file is written.
+use std::collections::BTreeMap;
+use std::env;
+use std::fs;
+use std::sync::{Mutex, OnceLock};
+use std::time::Instant;
+
+use serde_json::json;
+
+static PROFILE_PATH: OnceLock<Option<String>> = OnceLock::new();
+static OPERATIONS: Mutex<BTreeMap<(&'static str, u32), u64>> = Mutex::new(BTreeMap::new());
+static PHASES: Mutex<Vec<(&'static str, f64)>> = Mutex::new(Vec::new());
+static METADATA: Mutex<BTreeMap<&'static str, u64>> = Mutex::new(BTreeMap::new());
+
+fn profile_path() -> &'static Option<String> {
+    PROFILE_PATH.get_or_init(|| env::var("FHE_PROFILE").ok().filter(|p| !p.is_empty()))
+}
+
+/// Returns `true` if profiling was requested for this run.
+pub fn enabled() -> bool {
+    profile_path().is_some()
+}
+
+/// Counts one FHE operation of type `op` on `bits`-bit ciphertexts.
+pub fn count(op: &'static str, bits: u32) {
+    count_n(op, bits, 1);
+}
+
+/// Counts `n` FHE operations of type `op` on `bits`-bit ciphertexts.
+pub fn count_n(op: &'static str, bits: u32, n: u64) {
+    if !enabled() {
+        return;
+    }
+    *OPERATIONS.lock().unwrap().entry((op, bits)).or_insert(0) += n;
+}
+
+/// Records a numeric property of the run (e.g. the number of input ciphertexts).
+pub fn set_metadata(key: &'static str, value: u64) {
+    METADATA.lock().unwrap().insert(key, value);
+}
+
+/// Times a named phase until the returned guard is dropped.
+pub struct Phase {
+    name: &'static str,
+    start: Instant,
+}
+
+pub fn phase(name: &'static str) -> Phase {
+    Phase { name, start: Instant::now() }
+}
+
+impl Drop for Phase {
+    fn drop(&mut self) {
+        // A phase entered several times (e.g. once per input chunk) accumulates its durations
+        let elapsed = self.start.elapsed().as_secs_f64();
+        let mut phases = PHASES.lock().unwrap();
+        match phases.iter_mut().find(|(name, _)| *name == self.name) {
+            Some((_, seconds)) => *seconds += elapsed,
+            None => phases.push((self.name, elapsed)),
+        }
+    }
+}
+
+/// Writes the collected profile as JSON to the `FHE_PROFILE` path, if profiling is enabled.
+pub fn write_profile(task_name: &str) {
+    let Some(path) = profile_path() else {
+        return;
+    };
+
+    let operations: Vec<_> = OPERATIONS
+        .lock()
+        .unwrap()
+        .iter()
+        .map(|((op, bits), n)| json!({"op": op, "bits": bits, "count": n}))
+        .collect();
+    let phases: Vec<_> = PHASES
+        .lock()
+        .unwrap()
+        .iter()
+        .map(|(name, seconds)| json!({"name": name, "seconds": seconds}))
+        .collect();
+    let metadata = METADATA.lock().unwrap().clone();
+
+    let profile = json!({
+        "task_name": task_name,
+        "metadata": metadata,
+        "operations": operations,
+        "phases": phases,
+    });
+
+    if let Err(e) = fs::write(path, serde_json::to_vec_pretty(&profile).unwrap()) {
+        eprintln!("Failed to write profile to `{}`: {}", path, e);
+    }
+}
@@ -0,0 +1,106 @@
+//! Loading of the server key, through an optional cache of decompressed keys.
+//!
+//! When `KEY_CACHE_DIR` is set, the decompressed key of each UID is saved there on first use
+//! (`<uid>.serverKey.decompressed`) and deserialized directly by the next tasks of the same UID,
+//! skipping the decompression. `--warmup` fills the cache as soon as the key is uploaded. The
+//! worker evicts the least recently used keys.
+use std::env;
+use std::fs::{self, File};
+use std::io::BufReader;
+use std::path::Path;
+
+use bincode::Options;
+
+use tfhe::{CompressedServerKey, ServerKey};
+
+use crate::profiling;
+
+fn cached_key_path(uid: &str) -> Option<String> {
+    env::var("KEY_CACHE_DIR")
+        .ok()
+        .filter(|dir| !dir.is_empty())
+        .map(|dir| format!("{}/{}.serverKey.decompressed", dir, uid))
+}
+
+/// Decompresses the key of `uid` into the cache ahead of its first task (`--warmup`), unless it
+/// is already cached. Returns whether the key was decompressed.
+pub fn warm_server_key(folder: &str, uid: &str) -> Result<bool, String> {
+    let compressed_path = format!("{}/{}.serverKey", folder, uid);
+    let cache_path = cached_key_path(uid).ok_or("`KEY_CACHE_DIR` is not set.")?;
+    if is_fresh(&cache_path, &compressed_path) {
+        return Ok(false);
+    }
+    let server_key = decompress_server_key(&compressed_path);
+    write_cached_key(&server_key, &cache_path);
+    Ok(true)
+}
+
+/// Checks that the uploaded key of `uid` deserializes as a compressed server key, without
+/// decompressing it.
+pub fn validate_server_key(folder: &str, uid: &str) -> Result<(), String> {
+    let compressed_path = format!("{}/{}.serverKey", folder, uid);
+    let file = File::open(Path::new(&compressed_path)).map_err(|e| format!("Cannot open the server key: {}", e))?;
+    let file_size = file.metadata().map_err(|e| format!("Cannot read the server key: {}", e))?.len();
+    bincode::DefaultOptions::new()
+        .with_fixint_encoding()
+        .allow_trailing_bytes()
+        .with_limit(file_size)
+        .deserialize_from::<_, CompressedServerKey>(BufReader::new(file))
+        .map(|_| ())
+        .map_err(|e| format!("The server key is not a compressed server key of this task: {}", e))
+}
+
+pub fn load_server_key(folder: &str, uid: &str) -> ServerKey {
+    let compressed_path = format!("{}/{}.serverKey", folder, uid);
+    let cache_path = cached_key_path(uid);
+
+    if let Some(cache_path) = &cache_path {
+        if let Some(server_key) = read_cached_key(cache_path, &compressed_path) {
+            profiling::set_metadata("key_cache_hit", 1);
+            return server_key;
+        }
+    }
+    profiling::set_metadata("key_cache_hit", 0);
+
+    let server_key = decompress_server_key(&compressed_path);
+    if let Some(cache_path) = &cache_path {
+        write_cached_key(&server_key, cache_path);
+    }
+    server_key
+}
+
+fn decompress_server_key(compressed_path: &str) -> ServerKey {
+    let serialized_sk = fs::read(Path::new(compressed_path)).expect("Failed to read the server key.");
+    let compressed_sk: CompressedServerKey = bincode::deserialize(&serialized_sk).expect("Failed to deserialize the server key.");
+    compressed_sk.decompress()
+}
+
+/// Whether the cached key exists and is not older than the uploaded key.
+fn is_fresh(cache_path: &str, compressed_path: &str) -> bool {
+    let cached_at = fs::metadata(cache_path).and_then(|m| m.modified());
+    let uploaded_at = fs::metadata(compressed_path).and_then(|m| m.modified());
+    matches!((cached_at, uploaded_at), (Ok(cached_at), Ok(uploaded_at)) if cached_at >= uploaded_at)
+}
+
+/// Returns the cached key, unless it is missing, unreadable or older than the uploaded key.
+fn read_cached_key(cache_path: &str, compressed_path: &str) -> Option<ServerKey> {
+    if !is_fresh(cache_path, compressed_path) {
+        return None;
+    }
+    let serialized = fs::read(cache_path).ok()?;
+    bincode::deserialize(&serialized).ok()
+}
+
+/// Saves the decompressed key atomically, since concurrent tasks may share the cache.
+fn write_cached_key(server_key: &ServerKey, cache_path: &str) {
+    let tmp_path = format!("{}.{}.tmp", cache_path, std::process::id());
+    let result = fs::create_dir_all(Path::new(cache_path).parent().unwrap_or(Path::new(".")))
+        .map_err(|e| e.to_string())
+        .and_then(|_| bincode::serialize(server_key).map_err(|e| e.to_string()))
+        .and_then(|serialized| fs::write(&tmp_path, serialized).map_err(|e| e.to_string()))
+        .and_then(|_| fs::rename(&tmp_path, cache_path).map_err(|e| e.to_string()));
+    if let Err(e) = result {
+        let _ = fs::remove_file(&tmp_path);
+        eprintln!("Failed to cache the decompressed server key in `{}`: {}", cache_path, e);
+    }
+}
@@ -1,3 +1,4 @@
+use std::env;
 use std::fs;
 use std::path::Path;
 use std::process::{Command, Stdio};
@@ -9,9 +10,13 @@ use bincode;
 use tfhe::{set_server_key, CompressedServerKey, CompactCiphertextList, FheUint4, FheUint8, FheUint10, CompactPublicKey, ClientKey, ConfigBuilder};
 use tfhe::prelude::*;
 
+pub use fhe_common::{input_stream, profiling};
 pub mod sleep_analysis;
 
-const UPLOAD_FOLDER: &str = "./project/uploaded_files";
+/// Directory of the generated keys and inputs, overridable with `UPLOAD_FOLDER`.
+fn upload_folder() -> String {
+    env::var("UPLOAD_FOLDER").unwrap_or_else(|_| "./project/uploaded_files".to_string())
+}
 
 #[derive(Serialize, Deserialize)]
 pub struct EncryptedRecord {
@@ -82,37 +87,106 @@ pub fn encrypt_brut_data(
 }
 
 
+/// Encrypts the sleep records and writes the key and input files of `uid`.
+///
+/// With `chunk_size > 0`, the input is written in the chunked format, with at most `chunk_size`
+/// records per chunk, so that the server can expand it with bounded memory.
+#[pyfunction]
+#[pyo3(signature = (clear_data, uid, chunk_size=0))]
+pub fn generate_files(clear_data: Vec<(u8, u16, u16)>, uid: &str, chunk_size: usize) -> PyResult<u8> {
+
+    let input_path = format!("{}/{}.sleep_quality.input.fheencrypted", upload_folder(), uid);
+
+    let public_key = generate_keys(uid);
+
+    write_input(&clear_data, &public_key, &input_path, chunk_size);
+
+    Ok(1)
+}
+
+
+/// Encrypts the sleep records with the existing keys of `uid`, and writes the `sleep_quality` input
+/// file `{input_id}.sleep_quality.input.fheencrypted`, so that one key can be reused for many inputs.
+#[pyfunction]
+#[pyo3(signature = (clear_data, uid, input_id, chunk_size=0))]
+pub fn generate_input(clear_data: Vec<(u8, u16, u16)>, uid: &str, input_id: &str, chunk_size: usize) -> PyResult<u8> {
+
+    let ck_path = format!("{}/{}.clientKey", upload_folder(), uid);
+    let input_path = format!("{}/{}.sleep_quality.input.fheencrypted", upload_folder(), input_id);
+
+    let client_key = deserialize_client_key(&ck_path);
+    let public_key = CompactPublicKey::new(&client_key);
+
+    write_input(&clear_data, &public_key, &input_path, chunk_size);
+
+    Ok(1)
+}
+
+
+fn write_input(clear_data: &[(u8, u16, u16)], public_key: &CompactPublicKey, input_path: &str, chunk_size: usize) {
+    if chunk_size == 0 {
+        let compact_list = build_compact_list(clear_data, public_key);
+        serialize_compactciphertextlist(&compact_list, input_path);
+    } else {
+        let chunks: Vec<CompactCiphertextList> = clear_data
+            .chunks(chunk_size)
+            .map(|chunk| build_compact_list(chunk, public_key))
+            .collect();
+        input_stream::serialize_chunks(&chunks, input_path);
+    }
+}
+
+
+/// Encrypts several nights of sleep records, one compact list per night, and writes the key and
+/// input files of the `sleep_quality_batch` task for `uid`.
 #[pyfunction]
-pub fn generate_files(clear_data: Vec<(u8, u16, u16)>, uid: &str) -> PyResult<u8> {
+pub fn generate_batch_files(nights: Vec<Vec<(u8, u16, u16)>>, uid: &str) -> PyResult<u8> {
+
+    let input_path = format!("{}/{}.sleep_quality_batch.input.fheencrypted", upload_folder(), uid);
+
+    let public_key = generate_keys(uid);
 
-    let sk_path = format!("{}/{}.serverKey", UPLOAD_FOLDER, uid);
-    let ck_path = format!("{}/{}.clientKey", UPLOAD_FOLDER, uid);
-    let input_path = format!("{}/{}.sleep_quality.input.fheencrypted", UPLOAD_FOLDER, uid);
+    let lists: Vec<CompactCiphertextList> = nights
+        .iter()
+        .map(|night| build_compact_list(night, &public_key))
+        .collect();
+    let serialized_lists = bincode::serialize(&lists).expect("Failed to serialize encrypted nights.");
+    fs::write(Path::new(&input_path), serialized_lists).expect("Failed to write serialized encrypted nights to file.");
+
+    Ok(1)
+}
+
+
+/// Generates and writes the client and server keys of `uid`, and returns the public key.
+fn generate_keys(uid: &str) -> CompactPublicKey {
+    let sk_path = format!("{}/{}.serverKey", upload_folder(), uid);
+    let ck_path = format!("{}/{}.clientKey", upload_folder(), uid);
 
     let config = ConfigBuilder::default().build();
     let client_key = ClientKey::generate(config);
-
     let compressed_server_key = CompressedServerKey::new(&client_key);
 
     let sks = compressed_server_key.decompress();
 
     set_server_key(sks.clone());
 
-    let public_key = CompactPublicKey::new(&client_key);
-    let mut builder = CompactCiphertextList::builder(&public_key);
-    
-    for (val_u4, val_u10_1, val_u10_2) in clear_data {
+    serialize_compressed_key(&compressed_server_key, &sk_path);
+    serialize_client_key(&client_key, &ck_path);
+
+    CompactPublicKey::new(&client_key)
+}
+
+
+fn build_compact_list(clear_data: &[(u8, u16, u16)], public_key: &CompactPublicKey) -> CompactCiphertextList {
+    let mut builder = CompactCiphertextList::builder(public_key);
+
+    for &(val_u4, val_u10_1, val_u10_2) in clear_data {
         let _ = builder.push_with_num_bits(val_u4 as u8, 4);
         let _ = builder.push_with_num_bits(val_u10_1 as u16, 10);
         let _ = builder.push_with_num_bits(val_u10_2 as u16, 10);
     }
-    let compact_list = builder.build();
-    
-    serialize_compressed_key(&compressed_server_key, &sk_path);
-    serialize_client_key(&client_key, &ck_path);
-    serialize_compactciphertextlist(&compact_list, &input_path);
 
-    Ok(1)
+    builder.build()
 }
 
 
@@ -150,10 +224,26 @@ pub fn decrypt(ck_path: &str, output_path: &str) -> PyResult<u8> {
 }
 
 
+#[pyfunction]
+pub fn decrypt_batch(ck_path: &str, output_path: &str) -> PyResult<Vec<u8>> {
+
+    let deserialize_ck = deserialize_client_key(&ck_path);
+
+    // Retrive the encrypted scores, one per night
+    let serialized_scores = fs::read(output_path).unwrap();
+    let encrypted_scores: Vec<FheUint8> = bincode::deserialize(&serialized_scores).unwrap();
+
+    Ok(encrypted_scores.iter().map(|score| score.decrypt(&deserialize_ck)).collect())
+}
+
+
 #[pymodule]
 fn sleep_quality(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(generate_files, m)?)?;
+    m.add_function(wrap_pyfunction!(generate_input, m)?)?;
     m.add_function(wrap_pyfunction!(run, m)?)?;
     m.add_function(wrap_pyfunction!(decrypt, m)?)?;
+    m.add_function(wrap_pyfunction!(generate_batch_files, m)?)?;
+    m.add_function(wrap_pyfunction!(decrypt_batch, m)?)?;
     Ok(())
 }
@@ -1,13 +1,32 @@
-use tfhe::{set_server_key, CompressedServerKey, CompactCiphertextList, CompactCiphertextListExpander, FheUint4, FheUint8, FheUint10};
+use tfhe::{set_server_key, CompactCiphertextList, CompactCiphertextListExpander, FheUint4, FheUint8, FheUint10, ServerKey};
 use tfhe::prelude::*;
+use rayon::prelude::*;
 use std::path::Path;
 use std::fs;
-use std::io::Cursor;
 use std::env;
 
+use fhe_common::{input_stream, profiling, server_key};
+
 mod sleep_analysis;
 use sleep_analysis::*;
 
+// Sleep stages
+const STAGES: [u8; 6] = [0, 1, 2, 3, 4, 5];
+
+// Each record is encrypted as 3 ciphertexts: (stage, slot start, slot end)
+const CIPHERTEXTS_PER_RECORD: usize = 3;
+
+const INVALID_INPUT_EXIT_CODE: i32 = 2;
+
+// Usage: ./rust_binary 1234 [--batch] [--validate] | ./rust_binary 1234 [--prepare | --warmup | --validate-key]
+//
+// With `--batch`, the input holds several nights (one compact list per night), which are scored
+// in parallel under a single server key load. With `--warmup`, the server key of `uid` is only
+// decompressed into the key cache, ahead of its first task. With `--prepare`, the input of a single
+// night is only expanded and staged, while the task waits in the queue. With `--validate`, the
+// framing and the number of ciphertexts of the input are only checked, at upload time, and with
+// `--validate-key`, the server key of `uid`, once when it is uploaded: the binary exits with
+// `INVALID_INPUT_EXIT_CODE` and the reason on stderr if they cannot be processed.
 fn main() -> std::result::Result<(), Box<dyn std::error::Error>> {
     let args: Vec<String> = env::args().collect();
 
@@ -16,33 +35,168 @@ fn main() -> std::result::Result<(), Box<dyn std::error::Error>> {
     }
 
     let uid = &args[1];
-
-    // Construct paths
-    let sk_path = format!("/project/uploaded_files/{}.serverKey", uid);
-    let input_path = format!("/project/uploaded_files/{}.sleep_quality.input.fheencrypted", uid);
-    let output_final_score_path = format!("/project/uploaded_files/{}.sleep_quality.output.fheencrypted", uid);
+    let batch = args.iter().skip(2).any(|arg| arg == "--batch");
+    let prepare = args.iter().skip(2).any(|arg| arg == "--prepare");
+    let folder = upload_folder();
+    if args.iter().skip(2).any(|arg| arg == "--warmup") {
+        return warm_up(&folder, uid);
+    }
+    if args.iter().skip(2).any(|arg| arg == "--validate-key") {
+        validate_key(&folder, uid);
+        return Ok(());
+    }
+    if args.iter().skip(2).any(|arg| arg == "--validate") {
+        validate(&folder, uid, batch);
+        return Ok(());
+    }
 
     // Deserialize and set server key
-    let compressed_sk = deserialize_compressed_server_key(&sk_path);
-    let decompressed_sk = compressed_sk.decompress();
-    set_server_key(decompressed_sk);
+    let server_key = {
+        let _phase = profiling::phase("load_key");
+        server_key::load_server_key(&folder, uid)
+    };
+    set_server_key(server_key.clone());
 
-    // Deserialize input data
-    let compact_list = deserialize_list(&input_path);
+    if prepare {
+        prepare_single_night(&folder, uid);
+    } else if batch {
+        run_batch(&folder, uid, &server_key);
+    } else {
+        run_single_night(&folder, uid, &server_key);
+    }
 
-    // Expand compact list
-    let expanded = compact_list.expand().unwrap();
+    Ok(())
+}
 
-    // Reshape expanded list into EncryptedRecords
-    let encrypted_data = reshape_into_encrypted_records(&expanded);
+fn warm_up(folder: &str, uid: &str) -> std::result::Result<(), Box<dyn std::error::Error>> {
+    if server_key::warm_server_key(folder, uid)? {
+        println!("Decompressed the server key of {} into the key cache.", uid);
+    } else {
+        println!("The server key of {} is already cached.", uid);
+    }
+    Ok(())
+}
+
+/// Checks that each night (or chunk of a night) holds whole records, without loading the key.
+fn validate(folder: &str, uid: &str, batch: bool) {
+    let checked = if batch {
+        input_stream::validate_lists(&format!("{}/{}.sleep_quality_batch.input.fheencrypted", folder, uid))
+    } else {
+        input_stream::validate_input(&format!("{}/{}.sleep_quality.input.fheencrypted", folder, uid))
+    };
+    let checked = checked.and_then(|lengths| {
+        match lengths.iter().position(|&n| n == 0 || n % CIPHERTEXTS_PER_RECORD != 0) {
+            Some(i) => Err(format!(
+                "List {} holds {} ciphertexts, which is not a whole number of records of {}.",
+                i, lengths[i], CIPHERTEXTS_PER_RECORD
+            )),
+            None => Ok(lengths.iter().sum::<usize>() / CIPHERTEXTS_PER_RECORD),
+        }
+    });
+    match checked {
+        Ok(num_records) => println!("Valid input: {} record(s).", num_records),
+        Err(reason) => {
+            eprintln!("{}", reason);
+            std::process::exit(INVALID_INPUT_EXIT_CODE);
+        }
+    }
+}
 
-    // Define stages
-    let stages = vec![0u8, 1u8, 2u8, 3u8, 4u8, 5u8];
+/// Checks that the uploaded key of `uid` can be loaded, once, when it is uploaded.
+fn validate_key(folder: &str, uid: &str) {
+    match server_key::validate_server_key(folder, uid) {
+        Ok(()) => println!("Valid server key."),
+        Err(reason) => {
+            eprintln!("{}", reason);
+            std::process::exit(INVALID_INPUT_EXIT_CODE);
+        }
+    }
+}
+
+fn run_single_night(folder: &str, uid: &str, server_key: &ServerKey) {
+    let input_path = format!("{}/{}.sleep_quality.input.fheencrypted", folder, uid);
+    let output_final_score_path = format!("{}/{}.sleep_quality.output.fheencrypted", folder, uid);
 
+    // Expand the input chunk by chunk (unless it was prepared), reshape each chunk into
+    // EncryptedRecords and aggregate them, overlapping expansion with computation
+    let mut accumulator = SleepAccumulator::new(&STAGES);
+    let num_chunks = input_stream::for_each_input_chunk(&input_path, server_key, reshape_into_encrypted_records, |records| {
+        for record in records {
+            accumulator.update(&record);
+        }
+    });
+    profiling::set_metadata("num_records", accumulator.num_records());
+    profiling::set_metadata("num_chunks", num_chunks as u64);
+
+    let final_score = {
+        let _phase = profiling::phase("score");
+        compute_sleep_score(accumulator)
+    };
+
+    // Simplified output - only serialize final score
+    {
+        let _phase = profiling::phase("serialize");
+        serialize_fheuint8(&final_score, &output_final_score_path);
+    }
+
+    profiling::write_profile("sleep_quality");
+}
+
+fn prepare_single_night(folder: &str, uid: &str) {
+    let input_path = format!("{}/{}.sleep_quality.input.fheencrypted", folder, uid);
+    let num_chunks = input_stream::prepare_input(&input_path, reshape_into_encrypted_records);
+    profiling::set_metadata("num_chunks", num_chunks as u64);
+    profiling::write_profile("sleep_quality_prepare");
+}
+
+fn run_batch(folder: &str, uid: &str, server_key: &ServerKey) {
+    let input_path = format!("{}/{}.sleep_quality_batch.input.fheencrypted", folder, uid);
+    let output_scores_path = format!("{}/{}.sleep_quality_batch.output.fheencrypted", folder, uid);
+
+    let nights: Vec<CompactCiphertextList> = {
+        let _phase = profiling::phase("load_input");
+        let serialized_nights = fs::read(Path::new(&input_path)).unwrap();
+        bincode::deserialize(&serialized_nights).expect("Failed to deserialize the encrypted nights.")
+    };
+    profiling::set_metadata("num_nights", nights.len() as u64);
+
+    // One night per task: nights are independent, so they fill the cores that a single night's
+    // mostly sequential aggregation leaves idle
+    let scores: Vec<FheUint8> = {
+        let _phase = profiling::phase("compute");
+        nights
+            .par_iter()
+            .map(|night| {
+                // Server keys are thread-local
+                set_server_key(server_key.clone());
+                let expanded = night.expand().unwrap();
+                let mut accumulator = SleepAccumulator::new(&STAGES);
+                for record in reshape_into_encrypted_records(&expanded) {
+                    accumulator.update(&record);
+                }
+                compute_sleep_score(accumulator)
+            })
+            .collect()
+    };
+
+    {
+        let _phase = profiling::phase("serialize");
+        let serialized_scores = bincode::serialize(&scores).expect("Failed to serialize the encrypted scores.");
+        fs::write(Path::new(&output_scores_path), serialized_scores).unwrap();
+    }
+
+    profiling::write_profile("sleep_quality_batch");
+}
+
+/// Directory of keys, inputs and outputs, overridable with `UPLOAD_FOLDER` for local runs.
+fn upload_folder() -> String {
+    env::var("UPLOAD_FOLDER").unwrap_or_else(|_| "/project/uploaded_files".to_string())
+}
+
+fn compute_sleep_score(accumulator: SleepAccumulator) -> FheUint8 {
     // Perform sleep analysis computations
-    let total_durations = compute_total_duration_per_stage(&encrypted_data, &stages);
+    let (total_durations, sleep_onset_latency) = accumulator.finish();
     let (total_sleep_time, total_in_bed_time) = compute_sleep_time_from_durations(&total_durations);
-    let sleep_onset_latency = compute_sleep_onset_latency(&encrypted_data);
 
     let sleep_efficiency_category = evaluate_sleep_efficiency(&total_sleep_time, &total_in_bed_time);
     let total_sleep_time_category = evaluate_total_sleep_time(&total_sleep_time);
@@ -54,38 +208,21 @@ fn main() -> std::result::Result<(), Box<dyn std::error::Error>> {
         &sleep_efficiency_category
     ];
     let num_categories = categories.len();
-    
+
     // Sum all categories
     let mut raw_score = FheUint8::encrypt_trivial(0u8);
     for category in categories {
         raw_score = &raw_score + category;
     }
+    profiling::count_n("add", 8, num_categories as u64);
 
     // Normalize to 1-5 range
     let multiplier = FheUint8::encrypt_trivial(4u8);
     let max_possible = FheUint8::encrypt_trivial((num_categories * 3) as u8);
-    let final_score = (&raw_score * &multiplier) / &max_possible + 1;
-
-    // Simplified output - only serialize final score
-    serialize_fheuint8(&final_score, &output_final_score_path);
-
-    Ok(())
-}
-
-fn deserialize_compressed_server_key(path: &str) -> CompressedServerKey {
-    let path_sk: &Path = Path::new(path);
-    let serialized_sk = fs::read(path_sk).unwrap();
-    let mut serialized_data = Cursor::new(serialized_sk);
-    let res = bincode::deserialize_from(&mut serialized_data).unwrap();
-    return res;
-}
-
-fn deserialize_list(path_string: &str) -> CompactCiphertextList {
-    let path: &Path = Path::new(path_string);
-    let serialized_list = fs::read(path).unwrap();
-    let mut serialized_data = Cursor::new(serialized_list);
-    let res = bincode::deserialize_from(&mut serialized_data).unwrap();
-    return res;
+    profiling::count("mul", 8);
+    profiling::count("div", 8);
+    profiling::count("scalar_add", 8);
+    (&raw_score * &multiplier) / &max_possible + 1
 }
 
 fn reshape_into_encrypted_records(expanded: &CompactCiphertextListExpander) -> Vec<EncryptedRecord> {
@@ -1,35 +1,99 @@
+use serde::{Deserialize, Serialize};
 use tfhe::prelude::*;
 use tfhe::*;
 
+use crate::profiling;
+
 /// Represents an encrypted record of sleep data.
+#[derive(Serialize, Deserialize)]
 pub struct EncryptedRecord {
     pub stage_id: FheUint4,
     pub slot_start: FheUint10,
     pub slot_end: FheUint10,
 }
 
-/// Computes total duration per sleep stage.
-pub fn compute_total_duration_per_stage(
-    records: &[EncryptedRecord],
-    stages: &[u8],
-) -> Vec<(u8, FheUint10)> {
-    let mut total_durations = Vec::new();
+/// Single-pass encrypted aggregates over a stream of sleep records.
+///
+/// Records are consumed one at a time, in order, so the input never has to be fully expanded
+/// in memory. It accumulates the total duration per sleep stage and the state needed for the
+/// sleep onset latency (first in-bed and first sleep times).
+pub struct SleepAccumulator {
+    total_durations: Vec<(u8, FheUint10)>,
+    first_in_bed_time: FheUint10,
+    first_sleep_time: FheUint10,
+    found_in_bed: FheBool,
+    found_sleep: FheBool,
+    num_records: u64,
+}
+
+impl SleepAccumulator {
+    pub fn new(stages: &[u8]) -> Self {
+        SleepAccumulator {
+            total_durations: stages
+                .iter()
+                .map(|&stage_id| (stage_id, FheUint10::encrypt_trivial(0u16)))
+                .collect(),
+            first_in_bed_time: FheUint10::encrypt_trivial(0u16),
+            first_sleep_time: FheUint10::encrypt_trivial(0u16),
+            found_in_bed: FheBool::encrypt_trivial(false),
+            found_sleep: FheBool::encrypt_trivial(false),
+            num_records: 0,
+        }
+    }
+
+    /// Number of records aggregated so far.
+    pub fn num_records(&self) -> u64 {
+        self.num_records
+    }
 
-    for &stage_id in stages {
-        let mut total = FheUint10::encrypt_trivial(0u16);
+    pub fn update(&mut self, record: &EncryptedRecord) {
+        self.num_records += 1;
 
-        for record in records {
-            let is_current_stage = record.stage_id.eq(stage_id);
-            let slot_duration = &record.slot_end - &record.slot_start;
+        // Total duration per sleep stage
+        let slot_duration = &record.slot_end - &record.slot_start;
+        profiling::count("sub", 10);
+        for (stage_id, total) in self.total_durations.iter_mut() {
+            let is_current_stage = record.stage_id.eq(*stage_id);
             let partial_duration =
                 is_current_stage.select(&slot_duration, &FheUint10::encrypt_trivial(0u16));
-            total = total + partial_duration;
+            *total += partial_duration;
+            profiling::count("scalar_eq", 4);
+            profiling::count("select", 10);
+            profiling::count("add", 10);
         }
 
-        total_durations.push((stage_id, total));
+        // Sleep onset latency
+        let is_in_bed = record.stage_id.eq(0);
+        let is_sleeping = !&is_in_bed;
+
+        // Update first in-bed time only if we haven't found it yet
+        let should_update_in_bed = !&self.found_in_bed & &is_in_bed;
+        let update_in_bed_time = &record.slot_start * &FheUint10::cast_from(should_update_in_bed.clone());
+        self.first_in_bed_time = &self.first_in_bed_time + update_in_bed_time;
+        self.found_in_bed = &self.found_in_bed | &is_in_bed;
+
+        // Update first sleep time only if we haven't found it yet
+        let should_update_sleep = !&self.found_sleep & &is_sleeping;
+        let update_sleep_time = &record.slot_start * &FheUint10::cast_from(should_update_sleep.clone());
+        self.first_sleep_time = &self.first_sleep_time + update_sleep_time;
+        self.found_sleep = &self.found_sleep | &is_sleeping;
+
+        profiling::count("scalar_eq", 4);
+        profiling::count_n("not", 1, 3);
+        profiling::count_n("and", 1, 2);
+        profiling::count_n("or", 1, 2);
+        profiling::count_n("cast", 10, 2);
+        profiling::count_n("mul", 10, 2);
+        profiling::count_n("add", 10, 2);
     }
 
-    total_durations
+    /// Returns the total duration per sleep stage and the sleep onset latency.
+    pub fn finish(self) -> (Vec<(u8, FheUint10)>, FheUint10) {
+        // Calculate the difference between first sleep time and first in-bed time
+        profiling::count("sub", 10);
+        let sleep_onset_latency = self.first_sleep_time - self.first_in_bed_time;
+        (self.total_durations, sleep_onset_latency)
+    }
 }
 
 /// Computes total sleep time and total in-bed time.
@@ -50,39 +114,12 @@ pub fn compute_sleep_time_from_durations(
                 total_sleep_time = &total_sleep_time + duration;
             }
         }
+        profiling::count("add", 10);
     }
 
     (total_sleep_time, total_in_bed_time)
 }
 
-/// Computes sleep onset latency.
-pub fn compute_sleep_onset_latency(records: &[EncryptedRecord]) -> FheUint10 {
-    let mut first_in_bed_time = FheUint10::encrypt_trivial(0u16);
-    let mut first_sleep_time = FheUint10::encrypt_trivial(0u16);
-    let mut found_in_bed = FheBool::encrypt_trivial(false);
-    let mut found_sleep = FheBool::encrypt_trivial(false);
-
-    for record in records {
-        let is_in_bed = record.stage_id.eq(0);
-        let is_sleeping = !&is_in_bed;
-
-        // Update first in-bed time only if we haven't found it yet
-        let should_update_in_bed = !&found_in_bed & &is_in_bed;
-        let update_in_bed_time = &record.slot_start * &FheUint10::cast_from(should_update_in_bed.clone());
-        first_in_bed_time = &first_in_bed_time + update_in_bed_time;
-        found_in_bed = &found_in_bed | &is_in_bed;
-
-        // Update first sleep time only if we haven't found it yet
-        let should_update_sleep = !&found_sleep & &is_sleeping;
-        let update_sleep_time = &record.slot_start * &FheUint10::cast_from(should_update_sleep.clone());
-        first_sleep_time = &first_sleep_time + update_sleep_time;
-        found_sleep = &found_sleep | &is_sleeping;
-    }
-
-    // Calculate the difference between first sleep time and first in-bed time
-    first_sleep_time - first_in_bed_time
-}
-
 /// Evaluates total sleep time category.
 pub fn evaluate_total_sleep_time(total_sleep_time: &FheUint10) -> FheUint8 {
     // Convert hours to minutes for comparison
@@ -95,6 +132,8 @@ pub fn evaluate_total_sleep_time(total_sleep_time: &FheUint10) -> FheUint8 {
     let is_between_6h_and_7h = total_sleep_time.le(&seven_hours) & total_sleep_time.gt(&six_hours);
     let is_between_5h_and_6h = total_sleep_time.le(&six_hours) & total_sleep_time.gt(&five_hours);
     let is_less_than_or_equal_5h = total_sleep_time.le(&five_hours);
+    profiling::count_n("cmp", 10, 6);
+    profiling::count_n("and", 1, 2);
 
     // Assign categories based on conditions
     let result_0 = FheUint8::cast_from(is_greater_than_7h.clone()) * 0u8;
@@ -102,6 +141,10 @@ pub fn evaluate_total_sleep_time(total_sleep_time: &FheUint10) -> FheUint8 {
     let result_2 = FheUint8::cast_from(is_between_5h_and_6h.clone()) * 2u8;
     let result_3 = FheUint8::cast_from(is_less_than_or_equal_5h.clone()) * 3u8;
 
+    profiling::count_n("cast", 8, 4);
+    profiling::count_n("scalar_mul", 8, 4);
+    profiling::count_n("add", 8, 3);
+
     // Combine results
     result_0 + result_1 + result_2 + result_3
 }
@@ -130,6 +173,10 @@ pub fn evaluate_sleep_efficiency(
     let is_between_65_and_75 =
         sleep_efficiency.le(&threshold_75) & sleep_efficiency.gt(&threshold_65);
     let is_less_than_or_equal_65 = sleep_efficiency.le(&threshold_65);
+    profiling::count_n("cast", 16, 2);
+    profiling::count_n("scalar_mul", 16, 4);
+    profiling::count_n("cmp", 16, 6);
+    profiling::count_n("and", 1, 2);
 
     // Assign categories based on conditions
     let result_0 = FheUint8::cast_from(is_greater_than_85.clone()) * 0u8;
@@ -137,6 +184,10 @@ pub fn evaluate_sleep_efficiency(
     let result_2 = FheUint8::cast_from(is_between_65_and_75.clone()) * 2u8;
     let result_3 = FheUint8::cast_from(is_less_than_or_equal_65.clone()) * 3u8;
 
+    profiling::count_n("cast", 8, 4);
+    profiling::count_n("scalar_mul", 8, 4);
+    profiling::count_n("add", 8, 3);
+
     // Combine results
     result_0 + result_1 + result_2 + result_3
 }
@@ -155,6 +206,8 @@ pub fn evaluate_sleep_onset_latency(sleep_onset_latency: &FheUint10) -> FheUint8
     let is_between_30_and_60 =
         sleep_onset_latency.gt(&thirty_minutes) & sleep_onset_latency.le(&sixty_minutes);
     let is_greater_than_60 = sleep_onset_latency.gt(&sixty_minutes);
+    profiling::count_n("cmp", 10, 6);
+    profiling::count_n("and", 1, 2);
 
     // Assign categories based on conditions
     let result_0 = FheUint8::cast_from(is_less_than_or_equal_15.clone()) * 0u8;
@@ -162,6 +215,10 @@ pub fn evaluate_sleep_onset_latency(sleep_onset_latency: &FheUint10) -> FheUint8
     let result_2 = FheUint8::cast_from(is_between_30_and_60.clone()) * 2u8;
     let result_3 = FheUint8::cast_from(is_greater_than_60.clone()) * 3u8;
 
+    profiling::count_n("cast", 8, 4);
+    profiling::count_n("scalar_mul", 8, 4);
+    profiling::count_n("add", 8, 3);
+
     // Combine results
     result_0 + result_1 + result_2 + result_3
 }
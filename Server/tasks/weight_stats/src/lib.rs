@@ -1,3 +1,4 @@
+use std::env;
 use std::fs;
 use std::path::Path;
 use std::process::{Command, Stdio};
@@ -9,7 +10,12 @@ use bincode;
 use tfhe::{set_server_key, CompressedServerKey, CompactCiphertextList, FheUint4, FheUint16, FheUint10, CompactPublicKey, ClientKey, ConfigBuilder};
 use tfhe::prelude::*;
 
-const UPLOAD_FOLDER: &str = "./project/uploaded_files";
+pub use fhe_common::{input_stream, profiling};
+
+/// Directory of the generated keys and inputs, overridable with `UPLOAD_FOLDER`.
+fn upload_folder() -> String {
+    env::var("UPLOAD_FOLDER").unwrap_or_else(|_| "./project/uploaded_files".to_string())
+}
 
 #[derive(Serialize, Deserialize)]
 pub struct EncryptedRecord {
@@ -71,12 +77,17 @@ fn deserialize_fheuint16(path: &str) -> FheUint16 {
 }
 
 
+/// Encrypts the weights and writes the key and input files of `uid`.
+///
+/// With `chunk_size > 0`, the input is written in the chunked format, with at most `chunk_size`
+/// weights per chunk, so that the server can expand it with bounded memory.
 #[pyfunction]
-pub fn generate_files(clear_data: Vec<f64>, uid: String) -> PyResult<u8> {
+#[pyo3(signature = (clear_data, uid, chunk_size=0))]
+pub fn generate_files(clear_data: Vec<f64>, uid: String, chunk_size: usize) -> PyResult<u8> {
 
-    let sk_path = format!("{}/{}.serverKey", UPLOAD_FOLDER, uid);
-    let ck_path = format!("{}/{}.clientKey", UPLOAD_FOLDER, uid);
-    let input_path = format!("{}/{}.weight_stats.input.fheencrypted", UPLOAD_FOLDER, uid);
+    let sk_path = format!("{}/{}.serverKey", upload_folder(), uid);
+    let ck_path = format!("{}/{}.clientKey", upload_folder(), uid);
+    let input_path = format!("{}/{}.weight_stats.input.fheencrypted", upload_folder(), uid);
 
     let config = ConfigBuilder::default().build();
     let client_key = ClientKey::generate(config);
@@ -86,25 +97,80 @@ pub fn generate_files(clear_data: Vec<f64>, uid: String) -> PyResult<u8> {
 
     set_server_key(sks.clone());
 
-    let clear_data: Vec<u16> = clear_data.into_iter().map(|w| (w * 10.0) as u16).collect();
-
     let public_key = CompactPublicKey::new(&client_key);
-    let mut builder = CompactCiphertextList::builder(&public_key);
-    
-    for val_u16 in &clear_data {
-        let _ = builder.push_with_num_bits(*val_u16, 16);
-    }
-
-    let compact_list = builder.build();
 
     serialize_compressed_key(&compressed_server_key, &sk_path);
     serialize_client_key(&client_key, &ck_path);
-    serialize_compactciphertextlist(&compact_list, &input_path);
+
+    write_input(&clear_data, &public_key, &input_path, chunk_size);
     
     Ok(1)
 }
 
 
+/// Encrypts the weights added since the previous request, with the existing keys of `uid`, and
+/// writes the input file of the `weight_stats_incremental` task.
+#[pyfunction]
+#[pyo3(signature = (clear_data, uid, chunk_size=0))]
+pub fn generate_incremental_input(clear_data: Vec<f64>, uid: String, chunk_size: usize) -> PyResult<u8> {
+
+    let ck_path = format!("{}/{}.clientKey", upload_folder(), uid);
+    let input_path = format!("{}/{}.weight_stats_incremental.input.fheencrypted", upload_folder(), uid);
+
+    let client_key = deserialize_client_key(&ck_path);
+    let public_key = CompactPublicKey::new(&client_key);
+
+    write_input(&clear_data, &public_key, &input_path, chunk_size);
+
+    Ok(1)
+}
+
+
+/// Encrypts the weights with the existing keys of `uid`, and writes the `weight_stats` input file
+/// `{input_id}.weight_stats.input.fheencrypted`, so that one key can be reused for many inputs.
+#[pyfunction]
+#[pyo3(signature = (clear_data, uid, input_id, chunk_size=0))]
+pub fn generate_input(clear_data: Vec<f64>, uid: String, input_id: String, chunk_size: usize) -> PyResult<u8> {
+
+    let ck_path = format!("{}/{}.clientKey", upload_folder(), uid);
+    let input_path = format!("{}/{}.weight_stats.input.fheencrypted", upload_folder(), input_id);
+
+    let client_key = deserialize_client_key(&ck_path);
+    let public_key = CompactPublicKey::new(&client_key);
+
+    write_input(&clear_data, &public_key, &input_path, chunk_size);
+
+    Ok(1)
+}
+
+
+fn write_input(clear_data: &[f64], public_key: &CompactPublicKey, input_path: &str, chunk_size: usize) {
+    let clear_data: Vec<u16> = clear_data.iter().map(|w| (w * 10.0) as u16).collect();
+
+    if chunk_size == 0 {
+        let compact_list = build_compact_list(&clear_data, public_key);
+        serialize_compactciphertextlist(&compact_list, input_path);
+    } else {
+        let chunks: Vec<CompactCiphertextList> = clear_data
+            .chunks(chunk_size)
+            .map(|chunk| build_compact_list(chunk, public_key))
+            .collect();
+        input_stream::serialize_chunks(&chunks, input_path);
+    }
+}
+
+
+fn build_compact_list(clear_data: &[u16], public_key: &CompactPublicKey) -> CompactCiphertextList {
+    let mut builder = CompactCiphertextList::builder(public_key);
+
+    for val_u16 in clear_data {
+        let _ = builder.push_with_num_bits(*val_u16, 16);
+    }
+
+    builder.build()
+}
+
+
 #[pyfunction]
 pub fn run(uid: String) -> PyResult<u8> {
     // Call main.rs
@@ -143,6 +209,8 @@ pub fn decrypt(ck_path: &str, output_avg_path: &str, output_min_path: &str, outp
 #[pymodule]
 fn weight_stats(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(generate_files, m)?)?;
+    m.add_function(wrap_pyfunction!(generate_incremental_input, m)?)?;
+    m.add_function(wrap_pyfunction!(generate_input, m)?)?;
     m.add_function(wrap_pyfunction!(run, m)?)?;
     m.add_function(wrap_pyfunction!(decrypt, m)?)?;
     Ok(())
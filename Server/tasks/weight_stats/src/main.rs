@@ -1,11 +1,25 @@
-use tfhe::{set_server_key, CompressedServerKey, CompactCiphertextList, CompactCiphertextListExpander, FheUint16};
-use tfhe::prelude::*;
+use tfhe::{set_server_key, FheUint16};
 use std::path::Path;
 use std::fs;
-use std::io::Cursor;
 use std::env;
 
-// Usage: ./rust_binary 1234
+use fhe_common::{input_stream, profiling, server_key};
+
+mod weight_analysis;
+use weight_analysis::{unpack_weights, WeightAccumulator};
+
+// Usage: ./rust_binary 1234 [--incremental] [--prepare | --validate] | ./rust_binary 1234 [--warmup | --validate-key]
+//
+// By default, the statistics are recomputed from the whole weight history, and the running
+// state of `uid` is reset to it. With `--incremental`, the input only holds the weights added
+// since the previous run, which are merged into the saved state. With `--warmup`, the server key
+// of `uid` is only decompressed into the key cache, ahead of its first task. With `--prepare`, the
+// input is only expanded and staged, while the task waits in the queue. With `--validate`, the
+// framing and the number of weights of the input are only checked, at upload time, and with
+// `--validate-key`, the server key of `uid`, once when it is uploaded: the binary exits with
+// `INVALID_INPUT_EXIT_CODE` and the reason on stderr if they cannot be processed.
+const INVALID_INPUT_EXIT_CODE: i32 = 2;
+
 fn main() -> Result<(), Box<dyn std::error::Error>> {
     let args: Vec<String> = env::args().collect();
 
@@ -14,62 +28,112 @@ fn main() -> Result<(), Box<dyn std::error::Error>> {
     }
     
     let uid = &args[1];
+    let folder = upload_folder();
+    if args.iter().skip(2).any(|arg| arg == "--warmup") {
+        return warm_up(&folder, uid);
+    }
+    if args.iter().skip(2).any(|arg| arg == "--validate-key") {
+        validate_key(&folder, uid);
+        return Ok(());
+    }
 
-    let sk_path = format!("/project/uploaded_files/{}.serverKey", uid);
-    let input_path = format!("/project/uploaded_files/{}.weight_stats.input.fheencrypted", uid);
-    let output_avg_path = format!("/project/uploaded_files/{}.outputAvg.weight_stats.fheencrypted", uid);
-    let output_min_path = format!("/project/uploaded_files/{}.outputMin.weight_stats.fheencrypted", uid);
-    let output_max_path = format!("/project/uploaded_files/{}.outputMax.weight_stats.fheencrypted", uid);
+    let incremental = args.iter().skip(2).any(|arg| arg == "--incremental");
+    let prepare = args.iter().skip(2).any(|arg| arg == "--prepare");
+    let task_name = if incremental { "weight_stats_incremental" } else { "weight_stats" };
 
-    let compressed = deserialize_compressed_server_key(&sk_path);
-    let decompressed = compressed.decompress();
-    set_server_key(decompressed);
+    let input_path = format!("{}/{}.{}.input.fheencrypted", folder, uid, task_name);
+    let state_path = format!("{}/{}.weight_stats.state.fheencrypted", folder, uid);
+    let output_avg_path = format!("{}/{}.outputAvg.{}.fheencrypted", folder, uid, task_name);
+    let output_min_path = format!("{}/{}.outputMin.{}.fheencrypted", folder, uid, task_name);
+    let output_max_path = format!("{}/{}.outputMax.{}.fheencrypted", folder, uid, task_name);
 
-    let compact_list = deserialize_list(&input_path);
-    let expanded = compact_list.expand().unwrap();
-    
-    let (min, max, avg) = compute_min_max_avg(&expanded);
-    
-    serialize_fheuint16(min, &output_min_path);
-    serialize_fheuint16(max, &output_max_path);
-    serialize_fheuint16(avg, &output_avg_path);
+    if args.iter().skip(2).any(|arg| arg == "--validate") {
+        validate(&input_path);
+        return Ok(());
+    }
+
+    let server_key = {
+        let _phase = profiling::phase("load_key");
+        server_key::load_server_key(&folder, uid)
+    };
+    set_server_key(server_key.clone());
+
+    if prepare {
+        let num_chunks = input_stream::prepare_input(&input_path, unpack_weights);
+        profiling::set_metadata("num_chunks", num_chunks as u64);
+        profiling::write_profile(&format!("{}_prepare", task_name));
+        return Ok(());
+    }
+
+    // Expand the input chunk by chunk (unless it was prepared), overlapping expansion with computation
+    let mut accumulator = if incremental {
+        let _phase = profiling::phase("load_state");
+        WeightAccumulator::load(&state_path)
+    } else {
+        WeightAccumulator::new()
+    };
+    let previous_count = accumulator.count();
+    let num_chunks = input_stream::for_each_input_chunk(&input_path, &server_key, unpack_weights, |values| {
+        accumulator.update_all(values)
+    });
+    profiling::set_metadata("num_ciphertexts", accumulator.count() - previous_count);
+    profiling::set_metadata("num_chunks", num_chunks as u64);
+    profiling::set_metadata("history_length", accumulator.count());
+
+    let (min, max, avg) = accumulator.finish();
+
+    {
+        let _phase = profiling::phase("serialize");
+        accumulator.save(&state_path);
+        serialize_fheuint16(min, &output_min_path);
+        serialize_fheuint16(max, &output_max_path);
+        serialize_fheuint16(avg, &output_avg_path);
+    }
+
+    profiling::write_profile(task_name);
 
     Ok(())
 }
 
-fn compute_min_max_avg(expanded: &CompactCiphertextListExpander) -> (FheUint16, FheUint16, FheUint16) {
-    assert!(expanded.len() > 0, "array is empty, no min/max/avg to compute");
-    
-    let first: FheUint16 = expanded.get::<FheUint16>(0).unwrap().unwrap();
-    let mut min: FheUint16 = first.clone();
-    let mut max: FheUint16 = first.clone();
-    let mut sum: FheUint16 = first.clone();
-
-    for i in 1..expanded.len() {
-        let value: FheUint16 = expanded.get::<FheUint16>(i).unwrap().unwrap();
-        min = min.min(&value);
-        max = max.max(&value);
-        sum += value;
+fn warm_up(folder: &str, uid: &str) -> Result<(), Box<dyn std::error::Error>> {
+    if server_key::warm_server_key(folder, uid)? {
+        println!("Decompressed the server key of {} into the key cache.", uid);
+    } else {
+        println!("The server key of {} is already cached.", uid);
     }
+    Ok(())
+}
 
-    let avg = sum / expanded.len() as u16;
-    (min, max, avg)
+/// Checks that the input holds at least one weight per chunk, without loading the key.
+fn validate(input_path: &str) {
+    let checked = input_stream::validate_input(input_path)
+        .and_then(|lengths| match lengths.iter().position(|&n| n == 0) {
+            Some(i) => Err(format!("Chunk {} holds no weight.", i)),
+            None => Ok(lengths.iter().sum::<usize>()),
+        });
+    match checked {
+        Ok(num_weights) => println!("Valid input: {} weight(s).", num_weights),
+        Err(reason) => {
+            eprintln!("{}", reason);
+            std::process::exit(INVALID_INPUT_EXIT_CODE);
+        }
+    }
 }
 
-fn deserialize_compressed_server_key(path: &str) -> CompressedServerKey {
-    let path_sk: &Path = Path::new(path);
-    let serialized_sk = fs::read(path_sk).unwrap();
-    let mut serialized_data = Cursor::new(serialized_sk);
-    let res = bincode::deserialize_from(&mut serialized_data).unwrap();
-    return res;
+/// Checks that the uploaded key of `uid` can be loaded, once, when it is uploaded.
+fn validate_key(folder: &str, uid: &str) {
+    match server_key::validate_server_key(folder, uid) {
+        Ok(()) => println!("Valid server key."),
+        Err(reason) => {
+            eprintln!("{}", reason);
+            std::process::exit(INVALID_INPUT_EXIT_CODE);
+        }
+    }
 }
 
-fn deserialize_list(path_string: &str) -> CompactCiphertextList {
-    let path: &Path = Path::new(path_string);
-    let serialized_list = fs::read(path).unwrap();
-    let mut serialized_data = Cursor::new(serialized_list);
-    let res = bincode::deserialize_from(&mut serialized_data).unwrap();
-    return res;
+/// Directory of keys, inputs and outputs, overridable with `UPLOAD_FOLDER` for local runs.
+fn upload_folder() -> String {
+    env::var("UPLOAD_FOLDER").unwrap_or_else(|_| "/project/uploaded_files".to_string())
 }
 
 fn serialize_fheuint16(fheuint: FheUint16, path: &str) {
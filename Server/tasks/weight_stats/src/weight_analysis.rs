@@ -0,0 +1,97 @@
+//! Running min/max/average over a stream of encrypted weights.
+use std::fs;
+use std::io::ErrorKind;
+use std::path::Path;
+
+use serde::{Deserialize, Serialize};
+use tfhe::prelude::*;
+use tfhe::{CompactCiphertextListExpander, FheUint16, FheUint32};
+
+use crate::profiling;
+
+/// Encrypted aggregates updated one weight at a time, so that the input never has to be
+/// fully expanded in memory.
+///
+/// The accumulator can be saved and reloaded between runs, so that a new request only has to
+/// process the weights added since the previous one.
+#[derive(Serialize, Deserialize)]
+pub struct WeightAccumulator {
+    // (min, max, sum) once at least one weight has been seen. The sum is kept on 32 bits so that
+    // it does not overflow as the history grows.
+    aggregates: Option<(FheUint16, FheUint16, FheUint32)>,
+    // The number of weights is not secret: the server already sees the number of ciphertexts
+    count: u64,
+}
+
+impl WeightAccumulator {
+    pub fn new() -> Self {
+        WeightAccumulator { aggregates: None, count: 0 }
+    }
+
+    /// Loads the state saved by a previous run, or starts from scratch if there is none. Any other
+    /// failure to read the state fails the run, rather than silently resetting the history.
+    pub fn load(path: &str) -> Self {
+        match fs::read(Path::new(path)) {
+            Ok(serialized_state) => {
+                bincode::deserialize(&serialized_state).expect("Failed to deserialize the weight_stats state.")
+            }
+            Err(e) if e.kind() == ErrorKind::NotFound => WeightAccumulator::new(),
+            Err(e) => panic!("Failed to read the weight_stats state: {}", e),
+        }
+    }
+
+    /// Saves the state atomically, so that a crashed run never leaves a truncated state behind.
+    /// The temporary file is named after the process, so that concurrent runs never share it.
+    pub fn save(&self, path: &str) {
+        let tmp_path = format!("{}.{}.tmp", path, std::process::id());
+        let serialized_state = bincode::serialize(self).expect("Failed to serialize the weight_stats state.");
+        fs::write(Path::new(&tmp_path), serialized_state).expect("Failed to write the weight_stats state.");
+        fs::rename(&tmp_path, path).expect("Failed to replace the weight_stats state.");
+    }
+
+    /// Number of weights aggregated so far.
+    pub fn count(&self) -> u64 {
+        self.count
+    }
+
+    pub fn update(&mut self, value: FheUint16) {
+        self.count += 1;
+        let value_32 = FheUint32::cast_from(value.clone());
+        profiling::count("cast", 32);
+        self.aggregates = Some(match self.aggregates.take() {
+            None => (value.clone(), value, value_32),
+            Some((min, max, mut sum)) => {
+                let min = min.min(&value);
+                let max = max.max(&value);
+                sum += value_32;
+                profiling::count("min", 16);
+                profiling::count("max", 16);
+                profiling::count("add", 32);
+                (min, max, sum)
+            }
+        });
+    }
+
+    /// Aggregates every weight of a chunk.
+    pub fn update_all(&mut self, values: Vec<FheUint16>) {
+        for value in values {
+            self.update(value);
+        }
+    }
+
+    /// Returns the encrypted (min, max, avg).
+    pub fn finish(&self) -> (FheUint16, FheUint16, FheUint16) {
+        let (min, max, sum) = self.aggregates.as_ref().expect("array is empty, no min/max/avg to compute");
+        let avg = FheUint16::cast_from(sum / self.count as u32);
+        profiling::count("scalar_div", 32);
+        profiling::count("cast", 16);
+        (min.clone(), max.clone(), avg)
+    }
+}
+
+/// Extracts the weights of an expanded chunk.
+pub fn unpack_weights(expanded: &CompactCiphertextListExpander) -> Vec<FheUint16> {
+    (0..expanded.len())
+        .map(|i| expanded.get::<FheUint16>(i).unwrap().unwrap())
+        .collect()
+}
@@ -0,0 +1,379 @@
+"""Throughput and latency of the control plane (FastAPI, Celery, Redis and file handling), without FHE compute.
+
+The script starts a local stack: a Redis (a local `redis-server`, or the in-process `fakeredis`
+server), the FastAPI server and `usecases` Celery workers, with the tasks of
+`tests/stubs/tasks.stub.yaml`, whose binary (`stub_task.py`) sleeps or spins for a random duration
+and writes outputs of the real size. Many simulated clients then run the full workflow
+concurrently (`/add_key`, `/start_task`, `/get_task_status` until done, `/get_task_result`).
+
+It reports the requests per second and latency percentiles of each endpoint, and the time added
+by the orchestration to each task: its end-to-end duration minus the execution time of the stub.
+Results are appended to `control_plane_benchmark.csv`.
+
+With `--mode polling`, the clients only poll `/get_task_status` of a completed task for
+`--duration` seconds, which measures the request rate of the API server alone. Given several
+`--server-workers` counts, the local stack is restarted with each of them in turn, to measure how
+the request rate scales with the number of server processes.
+
+Usage (after `make tests_build`):
+    python tests/benchmark_control_plane.py [--clients N] [--workflows M] [--redis local|fake|URL]
+    python tests/benchmark_control_plane.py --mode polling --server-workers 1 2 4 8 --redis local
+    python tests/benchmark_control_plane.py --url http://localhost:82 --redis redis://localhost:6379
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import defaultdict
+from pathlib import Path
+
+import aiohttp
+import redis.asyncio as aioredis
+import requests
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+STUB_PATH = SERVER_DIR / "tests" / "stubs" / "stub_task.py"
+STUB_CONFIG = SERVER_DIR / "tests" / "stubs" / "tasks.stub.yaml"
+OUTPUT_CSV = Path("control_plane_benchmark.csv")
+
+TASK_NAMES = ["weight_stats", "sleep_quality", "ad_targeting"]
+STARTUP_TIMEOUT_SECONDS = 60
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_redis(kind: str, processes: list) -> str:
+    """Starts the Redis of the stack; returns its URL (without data-base)."""
+    if kind.startswith("redis://"):
+        return kind.rstrip("/")
+
+    port = free_port()
+    if kind == "fake":
+        # In-process stand-in, for hosts without `redis-server`
+        from fakeredis import TcpFakeServer
+
+        server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        processes.append(subprocess.Popen(
+            ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL,
+        ))
+    return f"redis://127.0.0.1:{port}"
+
+
+def start_stack(redis_url: str, workdir: Path, args, processes: list) -> str:
+    """Starts the FastAPI server and the Celery workers on the stub tasks; returns the server URL."""
+    shared_dir = workdir / "uploaded_files"
+    backup_dir = workdir / "backup_files"
+    shared_dir.mkdir()
+    backup_dir.mkdir()
+    shutil.copy(STUB_PATH, workdir / STUB_PATH.name)
+
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(SERVER_DIR),
+        "TASKS_CONFIG_FILE": str(STUB_CONFIG),
+        "SHARED_DIR": str(shared_dir),
+        "BACKUP_DIR": str(backup_dir),
+        "BROKER_URL": f"{redis_url}/0",
+        "BACKEND_URL": f"{redis_url}/1",
+        "CELERY_LOGLEVEL": "warning",
+        "CELERY_WORKER_CONCURRENCY_USECASE_QUEUE": str(args.concurrency),
+        "URL": "http://127.0.0.1",
+        "PORT": str(port),
+    }
+    env.pop("ENV_FILE", None)
+
+    processes.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--workers", str(args.server_workers)],
+        cwd=SERVER_DIR, env={**env, "RUN_TYPE": "fastapi"},
+    ))
+    for i in range(args.workers):
+        # Binaries are run as `./<binary>` from the working directory of the worker
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "celery", "-A", "task_executor.celery_app", "worker", "--queues=usecases",
+             f"--concurrency={args.concurrency}", "--loglevel=warning", f"--hostname=bench{i}@%h"],
+            cwd=workdir, env={**env, "RUN_TYPE": "usecases"},
+        ))
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + STARTUP_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/get_use_cases", timeout=1).raise_for_status()
+            return url
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise TimeoutError(f"The server did not start within {STARTUP_TIMEOUT_SECONDS}s.")
+
+
+class Recorder:
+    """Latencies of the requests per endpoint, and the end-to-end duration of the workflows."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.workflows = []
+
+    async def request(self, session: aiohttp.ClientSession, method: str, url: str, endpoint: str, **kwargs):
+        start_time = time.perf_counter()
+        async with session.request(method, f"{url}{endpoint}", **kwargs) as response:
+            body = await response.read()
+        self.latencies[endpoint].append(time.perf_counter() - start_time)
+        if response.status >= 400 and response.status != 429:
+            self.errors[endpoint] += 1
+        return response, body
+
+
+async def run_workflow(session, url: str, backend, recorder: Recorder, args) -> None:
+    task_name = random.choice(args.tasks)
+
+    data = aiohttp.FormData()
+    data.add_field("key", os.urandom(args.key_bytes), filename="serverKey")
+    data.add_field("task_name", task_name)
+    response, body = await recorder.request(session, "POST", url, "/add_key", data=data)
+    if response.status != 200:
+        return
+    uid = json.loads(body)["uid"]
+
+    start_time = time.perf_counter()
+    while True:
+        data = aiohttp.FormData()
+        data.add_field("encrypted_input", os.urandom(args.input_bytes), filename="input")
+        data.add_field("uid", uid)
+        data.add_field("task_name", task_name)
+        response, body = await recorder.request(session, "POST", url, "/start_task", data=data)
+        if response.status != 429:
+            break
+        await asyncio.sleep(int(response.headers.get("Retry-After", 1)))
+    if response.status != 200:
+        return
+    task_id = json.loads(body)["task_id"]
+
+    params = {"task_id": task_id, "uid": uid}
+    while True:
+        await asyncio.sleep(args.poll_interval)
+        response, body = await recorder.request(session, "GET", url, "/get_task_status", params=params)
+        if response.status != 200:
+            return
+        status = json.loads(body)["status"]
+        if status in ["success", "completed"]:
+            break
+        if status in ["failure", "error", "revoked", "timeout"]:
+            return
+
+    response, _ = await recorder.request(session, "GET", url, "/get_task_result", params={**params, "task_name": task_name})
+    end_to_end = time.perf_counter() - start_time
+    if response.status != 200:
+        return
+
+    execution_time = None
+    if backend is not None:
+        meta = await backend.get(f"celery-task-meta-{task_id}")
+        result = json.loads(meta)["result"] if meta else None
+        if isinstance(result, dict):
+            execution_time = result.get("execution_time_seconds")
+    recorder.workflows.append((task_name, end_to_end, execution_time))
+    return params
+
+
+async def run_client(session, url: str, backend, recorder: Recorder, args) -> None:
+    for _ in range(args.workflows):
+        try:
+            await run_workflow(session, url, backend, recorder, args)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            recorder.errors["connection"] += 1
+            print(f"⚠️ Client error: {e}")
+
+
+async def run_load(url: str, backend_url, args) -> tuple:
+    recorder = Recorder()
+    backend = aioredis.from_url(backend_url, decode_responses=True) if backend_url else None
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        # Warm-up: one workflow, so that the server and the workers are ready
+        await run_workflow(session, url, backend, Recorder(), args)
+        start_time = time.perf_counter()
+        await asyncio.gather(*(run_client(session, url, backend, recorder, args) for _ in range(args.clients)))
+        duration = time.perf_counter() - start_time
+    if backend is not None:
+        await backend.aclose()
+    return recorder, duration
+
+
+async def run_polling(url: str, args) -> tuple:
+    """Polls the status of a completed task from every client for `args.duration` seconds."""
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        params = await run_workflow(session, url, None, Recorder(), args)
+        if params is None:
+            raise RuntimeError("The warm-up task did not complete.")
+
+        async def poll(deadline: float) -> None:
+            while time.perf_counter() < deadline:
+                try:
+                    await recorder.request(session, "GET", url, "/get_task_status", params=params)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    recorder.errors["connection"] += 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(poll(start_time + args.duration) for _ in range(args.clients)))
+        duration = time.perf_counter() - start_time
+    return recorder, duration
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(recorder: Recorder, duration: float, args) -> list:
+    rows = []
+    load = f"{args.workflows} workflows" if args.mode == "workflow" else "status polls"
+    print(f"\n{args.clients} clients x {load} in {duration:.1f}s, {args.server_workers} server worker(s)")
+    print(f"{'endpoint':<20} {'requests':>9} {'errors':>7} {'req/s':>8} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        row = {
+            "endpoint": endpoint,
+            "requests": len(latencies),
+            "errors": recorder.errors[endpoint],
+            "requests_per_second": len(latencies) / duration,
+            "mean_ms": 1000 * sum(latencies) / len(latencies),
+            "p50_ms": 1000 * percentile(latencies, 0.50),
+            "p95_ms": 1000 * percentile(latencies, 0.95),
+            "p99_ms": 1000 * percentile(latencies, 0.99),
+        }
+        rows.append(row)
+        print(
+            f"{endpoint:<20} {row['requests']:>9} {row['errors']:>7} {row['requests_per_second']:>8.1f} "
+            f"{row['mean_ms']:>9.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+        )
+
+    completed = len(recorder.workflows)
+    print(f"\nCompleted workflows: {completed} ({completed / duration:.1f}/s), connection errors: {recorder.errors['connection']}")
+    overheads = [e2e - execution for _, e2e, execution in recorder.workflows if execution is not None]
+    if overheads:
+        row = {
+            "endpoint": "orchestration_overhead",
+            "requests": len(overheads),
+            "errors": 0,
+            "requests_per_second": completed / duration,
+            "mean_ms": 1000 * sum(overheads) / len(overheads),
+            "p50_ms": 1000 * percentile(overheads, 0.50),
+            "p95_ms": 1000 * percentile(overheads, 0.95),
+            "p99_ms": 1000 * percentile(overheads, 0.99),
+        }
+        rows.append(row)
+        print(
+            f"Added latency per task (end-to-end - execution): mean {row['mean_ms']:.0f}ms, "
+            f"p50 {row['p50_ms']:.0f}ms, p95 {row['p95_ms']:.0f}ms, p99 {row['p99_ms']:.0f}ms"
+        )
+    return rows
+
+
+def save_rows(rows: list, args) -> None:
+    new_file = not OUTPUT_CSV.exists()
+    with OUTPUT_CSV.open("a", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        if new_file:
+            writer.writerow(["date", "redis", "mode", "clients", "workflows", "workers", "concurrency", "server_workers", "endpoint",
+                             "requests", "errors", "requests_per_second", "mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+        for row in rows:
+            writer.writerow([
+                datetime.date.today().isoformat(), args.redis, args.mode, args.clients, args.workflows, args.workers,
+                args.concurrency, args.server_workers,
+                row["endpoint"], row["requests"], row["errors"], f"{row['requests_per_second']:.2f}",
+                f"{row['mean_ms']:.1f}", f"{row['p50_ms']:.1f}", f"{row['p95_ms']:.1f}", f"{row['p99_ms']:.1f}",
+            ])
+    print(f"\nSaved results in `{OUTPUT_CSV}`.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="Number of concurrent simulated clients.")
+    parser.add_argument("--workflows", type=int, default=5, help="Number of workflows run by each client.")
+    parser.add_argument("--tasks", nargs="+", default=TASK_NAMES, help="Tasks picked at random by the clients.")
+    parser.add_argument("--redis", default="local", help="`local` (redis-server), `fake` (fakeredis) or a `redis://` URL.")
+    parser.add_argument("--url", default=None, help="Benchmark a running server instead of starting a local stack.")
+    parser.add_argument("--workers", type=int, default=2, help="Number of Celery workers of the local stack.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrency of each Celery worker.")
+    parser.add_argument("--server-workers", type=int, nargs="+", default=[1],
+                        help="Number of Uvicorn workers of the local stack, or several counts to compare.")
+    parser.add_argument("--mode", choices=["workflow", "polling"], default="workflow",
+                        help="Full workflows, or status polls only, to measure the API server alone.")
+    parser.add_argument("--duration", type=float, default=30, help="Duration of the `polling` mode, in seconds.")
+    parser.add_argument("--key-bytes", type=int, default=1024 ** 2, help="Size of the uploaded server keys.")
+    parser.add_argument("--input-bytes", type=int, default=64 * 1024, help="Size of the uploaded inputs.")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Interval between two status polls, in seconds.")
+    parser.add_argument("--request-timeout", type=float, default=300, help="Timeout of a request, in seconds.")
+    args = parser.parse_args()
+
+    server_workers_counts = args.server_workers
+    processes = []
+    try:
+        if args.url:
+            url = args.url
+            backend_url = f"{args.redis.rstrip('/')}/1" if args.redis.startswith("redis://") else None
+            args.server_workers = None
+            run_benchmark(url, backend_url, args)
+            return
+
+        redis_url = start_redis(args.redis, processes)
+        for server_workers in server_workers_counts:
+            args.server_workers = server_workers
+            stack_processes = []
+            workdir = Path(tempfile.mkdtemp(prefix="control_plane_"))
+            try:
+                url = start_stack(redis_url, workdir, args, stack_processes)
+                run_benchmark(url, f"{redis_url}/1", args)
+            finally:
+                stop_processes(stack_processes)
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        stop_processes(processes)
+
+
+def run_benchmark(url: str, backend_url, args) -> None:
+    print(f"🚀 Benchmarking `{url}` with {args.clients} clients...")
+    if args.mode == "polling":
+        recorder, duration = asyncio.run(run_polling(url, args))
+    else:
+        recorder, duration = asyncio.run(run_load(url, backend_url, args))
+    save_rows(report(recorder, duration, args), args)
+
+
+def stop_processes(processes: list) -> None:
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Throughput and latency of the Rust task binaries for each split of the cores between jobs.
+
+For each task and each number of threads per job `t`, the script runs `cores // t` jobs at the
+same time, each pinned to its own `t` cores with `RAYON_NUM_THREADS=t`, and records the average
+job latency and the throughput (jobs per minute). The best split per task gives the
+`cpu.min_threads` (throughput, under load) and `cpu.max_threads` (latency, when idle) bounds of
+`tasks.yaml`.
+
+Usage (after `make tests_build`):
+    python tests/benchmark_cpu_split.py [--cores N]
+"""
+
+import argparse
+import csv
+import os
+import random
+import shutil
+import subprocess
+import time
+
+from pathlib import Path
+
+import sleep_quality
+import weight_stats
+
+UPLOAD_FOLDER = Path("./project/uploaded_files")
+OUTPUT_CSV = Path("cpu_split_benchmark.csv")
+
+BINARIES = {
+    "weight_stats": Path("./tasks/weight_stats/target/release/weight_stats"),
+    "sleep_quality": Path("./tasks/sleep_quality/target/release/sleep_quality"),
+}
+
+INPUT_LENGTH = 64
+
+
+def generate_input(task_name, uid):
+    if task_name == "weight_stats":
+        weight_stats.generate_files([random.uniform(50.0, 90.0) for _ in range(INPUT_LENGTH)], uid)
+    else:
+        sleep_quality.generate_files([(random.randint(0, 5), 10 * i, 10 * i + 10) for i in range(INPUT_LENGTH)], uid)
+
+
+def clone_files(task_name, uid, job_uid):
+    """Gives each concurrent job its own copy of the key and input, so that outputs do not clash."""
+    for suffix in ["serverKey", f"{task_name}.input.fheencrypted"]:
+        shutil.copy(UPLOAD_FOLDER / f"{uid}.{suffix}", UPLOAD_FOLDER / f"{job_uid}.{suffix}")
+
+
+def run_split(task_name, uid, cores, num_threads):
+    """Runs `len(cores) // num_threads` jobs on disjoint cores; returns (latency, jobs/min)."""
+    num_jobs = len(cores) // num_threads
+    env = {**os.environ, "UPLOAD_FOLDER": str(UPLOAD_FOLDER.resolve()), "RAYON_NUM_THREADS": str(num_threads)}
+
+    start_time = time.time()
+    jobs = []
+    for j in range(num_jobs):
+        job_uid = f"{uid}_job{j}"
+        clone_files(task_name, uid, job_uid)
+        job_cores = cores[j * num_threads:(j + 1) * num_threads]
+        process = subprocess.Popen(
+            [str(BINARIES[task_name]), job_uid],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            preexec_fn=lambda job_cores=job_cores: os.sched_setaffinity(0, job_cores),
+        )
+        jobs.append((process, job_uid))
+
+    # Collect the jobs as they complete, to record the latency of each
+    latencies = []
+    pending = {process.pid: job_uid for process, job_uid in jobs}
+    while pending:
+        pid, status = os.wait()
+        if pid not in pending:
+            continue
+        job_uid = pending.pop(pid)
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise RuntimeError(f"`{task_name}` failed for {job_uid=}")
+        latencies.append(time.time() - start_time)
+        for path in UPLOAD_FOLDER.glob(f"{job_uid}.*"):
+            path.unlink()
+
+    makespan = time.time() - start_time
+    return sum(latencies) / num_jobs, 60 * num_jobs / makespan
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cores", type=int, default=None, help="Number of cores to split (all by default).")
+    args = parser.parse_args()
+
+    cores = sorted(os.sched_getaffinity(0))[: args.cores]
+    thread_counts = [t for t in (2 ** i for i in range(len(cores).bit_length())) if t <= len(cores)]
+
+    UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+    for task_name, binary in BINARIES.items():
+        if not binary.exists():
+            print(f"❌ Missing binary `{binary}`. Please run: 'make tests_build' first!")
+            exit(1)
+
+    rows = []
+    for task_name in BINARIES:
+        uid = f"bench_cpu_{task_name}"
+        generate_input(task_name, uid)
+
+        results = []
+        for num_threads in thread_counts:
+            latency, throughput = run_split(task_name, uid, cores, num_threads)
+            num_jobs = len(cores) // num_threads
+            print(f"{task_name=} | {num_jobs=} x {num_threads=} | latency={latency:.2f}s | throughput={throughput:.2f} jobs/min")
+            results.append((num_threads, latency, throughput))
+            rows.append([task_name, len(cores), num_jobs, num_threads, round(latency, 2), round(throughput, 2)])
+
+        best_throughput = max(results, key=lambda r: r[2])
+        best_latency = min(results, key=lambda r: r[1])
+        print(
+            f"➡️ {task_name}: best throughput with `{best_throughput[0]}` thread(s) per job, "
+            f"best latency with `{best_latency[0]}` thread(s) per job\n"
+        )
+
+    with open(OUTPUT_CSV, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["task_name", "cores", "num_jobs", "threads_per_job", "avg_latency(s)", "throughput(jobs/min)"])
+        writer.writerows(rows)
+    print(f"Saved results in `{OUTPUT_CSV}`.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Peak memory of the Rust task binaries as the encrypted input grows.
+
+For each task and input length, the script encrypts an input (legacy single list, then chunked)
+and runs the release binary locally, recording its peak RSS. With chunked inputs, the peak RSS
+should stay flat as the input length grows.
+
+Usage (after `make tests_build`):
+    python tests/benchmark_memory.py
+"""
+
+import csv
+import os
+import random
+import subprocess
+import time
+
+from pathlib import Path
+
+import sleep_quality
+import weight_stats
+
+UPLOAD_FOLDER = Path("./project/uploaded_files")
+OUTPUT_CSV = Path("memory_benchmark.csv")
+
+INPUT_LENGTHS = [64, 256, 1024, 4096]
+# 0 means the legacy (single list) input format
+CHUNK_SIZES = [0, 64]
+
+BINARIES = {
+    "weight_stats": Path("./tasks/weight_stats/target/release/weight_stats"),
+    "sleep_quality": Path("./tasks/sleep_quality/target/release/sleep_quality"),
+}
+
+
+def generate_input(task_name, uid, length, chunk_size):
+    if task_name == "weight_stats":
+        weights = [random.uniform(50.0, 90.0) for _ in range(length)]
+        weight_stats.generate_files(weights, uid, chunk_size)
+    else:
+        # Slots are encrypted on 10 bits
+        records = [(random.randint(0, 5), (10 * i) % 1000, (10 * i) % 1000 + 10) for i in range(length)]
+        sleep_quality.generate_files(records, uid, chunk_size)
+
+
+def run_binary(task_name, uid):
+    """Runs the binary and returns its wall-clock time (s) and peak RSS (MiB)."""
+    env = {**os.environ, "UPLOAD_FOLDER": str(UPLOAD_FOLDER.resolve())}
+    start_time = time.time()
+    process = subprocess.Popen([str(BINARIES[task_name]), uid], env=env, stdout=subprocess.DEVNULL)
+    # `wait4` returns the resource usage of this child only
+    _, status, rusage = os.wait4(process.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"`{task_name}` failed for {uid=}")
+    # `ru_maxrss` is in KiB on Linux
+    return time.time() - start_time, rusage.ru_maxrss / 1024
+
+
+def main():
+    UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
+    for task_name, binary in BINARIES.items():
+        if not binary.exists():
+            print(f"❌ Missing binary `{binary}`. Please run: 'make tests_build' first!")
+            exit(1)
+
+    rows = []
+    for task_name in BINARIES:
+        for length in INPUT_LENGTHS:
+            for chunk_size in CHUNK_SIZES:
+                uid = f"bench_memory_{task_name}_{length}_{chunk_size}"
+                generate_input(task_name, uid, length, chunk_size)
+                execution_time, peak_rss = run_binary(task_name, uid)
+                print(
+                    f"{task_name=} | {length=} | {chunk_size=} | "
+                    f"time={execution_time:.2f}s | peak RSS={peak_rss:.1f} MiB"
+                )
+                rows.append([task_name, length, chunk_size, round(execution_time, 2), round(peak_rss, 1)])
+
+                for path in UPLOAD_FOLDER.glob(f"{uid}.*"):
+                    path.unlink()
+
+    with open(OUTPUT_CSV, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["task_name", "input_length", "chunk_size", "execution_time(s)", "peak_rss(MiB)"])
+        writer.writerows(rows)
+    print(f"Saved results in `{OUTPUT_CSV}`.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,39 @@
+"""Generates the key/input pool of the stress tests (`tests/stress_runner.py`, `tests/replay_trace.py`).
+
+Keys are generated in parallel, one job per key on a pool of processes, so the build time scales
+with the cores. With `--inputs-per-key N`, each key encrypts N different inputs, to model heavy
+users who submit many tasks with the same key; the server key is then stored once for its N inputs.
+
+Files are written directly to the pool directory, flat per task, and indexed by `manifest.json`:
+
+    {"tasks": {"weight_stats": [{"key": "weight_stats/key_0.serverKey", "key_bytes": 123456,
+                                 "inputs": [{"path": "weight_stats/key_0.0.weight_stats.input.fheencrypted",
+                                             "bytes": 4567}, ...]}, ...], ...}}
+
+Paths are relative to the pool directory. Client keys are only used to encrypt, and deleted.
+
+Usage (after `make tests_build`):
+    python tests/generate_stress_data.py [--sets 20] [--inputs-per-key 1] [--workers N] [--tasks ...]
+"""
+
+import argparse
+import json
+import math
 import os
+import random
 import shutil
-import uuid
-from pathlib import Path
 import sys
-import random
+import time
 
-# Ensure the tests directory is in the Python path to find test modules
-sys.path.insert(0, str(Path(__file__).parent.resolve()))
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 
-# For ad_targeting, we'll need parts of its test setup logic
 import numpy as np
-import pickle as pkl
-import json
-import concrete_ml_extensions as fhext
-
-# For Rust tasks, import their Python modules
-import weight_stats # from tasks/weight_stats (after maturin develop)
-import sleep_quality # from tasks/sleep_quality (after maturin develop)
 
 # --- Configuration ---
-NUM_SETS_PER_TASK = 20  # Generate this many unique key/input sets per task
+NUM_SETS_PER_TASK = 20  # Generate this many key/input sets per task
 BASE_OUTPUT_DIR = Path("./project/uploaded_files/stress_data_pool")
+MANIFEST_FILE = "manifest.json"
 
 # Ad Targeting specific config
 AD_TARGETING_CRYPTO_DTYPE = np.uint64
@@ -37,157 +50,168 @@ GOOD_NIGHT_SAMPLE_DATA = [
 # Weight Stats sample data
 WEIGHT_STATS_SAMPLE_DATA = [68.0, 65.0, 69.0, 70.0, 70.5, 67.0, 71.0]
 
-def generate_fhext_params_for_ad_targeting():
-    params_json = json.loads(fhext.default_params())
-    params_json["bits_reserved_for_computation"] = AD_TARGETING_BITS_RESERVED
-    return fhext.MatmulCryptoParameters.deserialize(json.dumps(params_json))
-
-def encrypt_ad_targeting_input(clear_data, crypto_params, pkey):
-    clear_data = clear_data.astype(AD_TARGETING_CRYPTO_DTYPE)
-    return fhext.encrypt_matrix(pkey=pkey, crypto_params=crypto_params, data=clear_data)
-
-def generate_for_ad_targeting(output_dir, user_prefix):
-    task_name = "ad_targeting"
-    server_key_file = output_dir / f"{user_prefix}.serverKey"
-    input_file = output_dir / f"{user_prefix}.{task_name}.input.fheencrypted"
-
-    random_input = np.random.randint(0, 2, (1, 62))
-
-    crypto_params = generate_fhext_params_for_ad_targeting()
-    pkey, ckey = fhext.create_private_key(crypto_params) # pkey is client, ckey is server
-
-    encrypted_input_matrix = encrypt_ad_targeting_input(random_input, crypto_params, pkey)
 
-    with open(server_key_file, "wb") as f:
-        f.write(ckey.serialize())
-    with open(input_file, "wb") as f:
-        f.write(encrypted_input_matrix.serialize())
+def input_name(key_id, index, task_name):
+    return f"{key_id}.{index}.{task_name}.input.fheencrypted"
 
-    # We don't need to save the pkey for the stress test, server only needs ckey (serverKey)
-    print(f"Generated ad_targeting data for {user_prefix}")
 
-def generate_for_sleep_quality(output_dir, user_prefix):
-    task_name = "sleep_quality"
-    # sleep_quality.generate_files directly writes to UPLOAD_FOLDER with the given uid
-    # We need to adapt this to write to our target dir or move files after generation.
-    # For simplicity, we'll generate them in UPLOAD_FOLDER then move them.
-
-    temp_uid_for_generation = str(uuid.uuid4()) # Temporary UID for the library function
-
-    # Path names the library will create:
-    # <UPLOAD_FOLDER>/<temp_uid_for_generation>.serverKey
-    # <UPLOAD_FOLDER>/<temp_uid_for_generation>.sleep_quality.input.fheencrypted
-
-    # Slightly vary data (e.g., pick a sub-segment or shuffle)
+def sleep_quality_sample():
+    """A random segment of the sample night, of at least a few records."""
     sample_len = len(GOOD_NIGHT_SAMPLE_DATA)
     start_idx = random.randint(0, sample_len // 2)
-    end_idx = random.randint(start_idx + 3, sample_len) # ensure at least a few records
-    current_data = GOOD_NIGHT_SAMPLE_DATA[start_idx:end_idx]
-    if not current_data: # fallback
-        current_data = GOOD_NIGHT_SAMPLE_DATA[:5]
-
-    sleep_quality.generate_files(current_data, temp_uid_for_generation)
+    end_idx = random.randint(start_idx + 3, sample_len)
+    return GOOD_NIGHT_SAMPLE_DATA[start_idx:end_idx] or GOOD_NIGHT_SAMPLE_DATA[:5]
 
-    # Now move the generated files to our stress pool
-    generated_sk_path = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.serverKey"
-    generated_input_path = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.{task_name}.input.fheencrypted"
-    # We also need to copy the clientKey if we were to decrypt, but for server stress test it's not needed by server.
-    # generated_ck_path = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.clientKey"
 
+def weight_stats_sample():
+    """A random subset of the sample weights, with a slight random variation."""
+    num_weights = random.randint(3, len(WEIGHT_STATS_SAMPLE_DATA))
+    return [w + random.uniform(-0.5, 0.5) for w in random.sample(WEIGHT_STATS_SAMPLE_DATA, num_weights)]
 
-    target_sk_path = output_dir / f"{user_prefix}.serverKey"
-    target_input_path = output_dir / f"{user_prefix}.{task_name}.input.fheencrypted"
 
-    shutil.move(str(generated_sk_path), str(target_sk_path))
-    shutil.move(str(generated_input_path), str(target_input_path))
+def generate_for_ad_targeting(output_dir, key_id, num_inputs):
+    import concrete_ml_extensions as fhext
 
-    # Clean up clientKey if generated and not needed
-    ck_to_remove = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.clientKey"
-    if ck_to_remove.exists():
-        ck_to_remove.unlink()
+    task_name = "ad_targeting"
+    params_json = json.loads(fhext.default_params())
+    params_json["bits_reserved_for_computation"] = AD_TARGETING_BITS_RESERVED
+    crypto_params = fhext.MatmulCryptoParameters.deserialize(json.dumps(params_json))
+    pkey, ckey = fhext.create_private_key(crypto_params)  # pkey is client, ckey is server
 
-    print(f"Generated sleep_quality data for {user_prefix}")
+    (output_dir / f"{key_id}.serverKey").write_bytes(ckey.serialize())
+    for index in range(num_inputs):
+        clear_data = np.random.randint(0, 2, (1, 62)).astype(AD_TARGETING_CRYPTO_DTYPE)
+        encrypted_input = fhext.encrypt_matrix(pkey=pkey, crypto_params=crypto_params, data=clear_data)
+        (output_dir / input_name(key_id, index, task_name)).write_bytes(encrypted_input.serialize())
 
 
-def generate_for_weight_stats(output_dir, user_prefix):
-    task_name = "weight_stats"
-    # Similar to sleep_quality, adapt file locations
-    temp_uid_for_generation = str(uuid.uuid4())
+def generate_for_sleep_quality(output_dir, key_id, num_inputs):
+    import sleep_quality  # from tasks/sleep_quality (after maturin develop)
 
-    # Vary data
-    num_weights = random.randint(3, len(WEIGHT_STATS_SAMPLE_DATA))
-    current_data = random.sample(WEIGHT_STATS_SAMPLE_DATA, num_weights)
-    # Add slight random variation to weights
-    current_data = [w + random.uniform(-0.5, 0.5) for w in current_data]
+    task_name = "sleep_quality"
+    # The first input comes with new keys, the others reuse the client key
+    sleep_quality.generate_files(sleep_quality_sample(), key_id)
+    os.replace(output_dir / f"{key_id}.{task_name}.input.fheencrypted", output_dir / input_name(key_id, 0, task_name))
+    for index in range(1, num_inputs):
+        sleep_quality.generate_input(sleep_quality_sample(), key_id, f"{key_id}.{index}")
 
 
-    weight_stats.generate_files(current_data, temp_uid_for_generation)
+def generate_for_weight_stats(output_dir, key_id, num_inputs):
+    import weight_stats  # from tasks/weight_stats (after maturin develop)
 
-    generated_sk_path = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.serverKey"
-    generated_input_path = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.{task_name}.input.fheencrypted"
+    task_name = "weight_stats"
+    weight_stats.generate_files(weight_stats_sample(), key_id)
+    os.replace(output_dir / f"{key_id}.{task_name}.input.fheencrypted", output_dir / input_name(key_id, 0, task_name))
+    for index in range(1, num_inputs):
+        weight_stats.generate_input(weight_stats_sample(), key_id, f"{key_id}.{index}")
+
+
+TASK_GENERATORS = {
+    "ad_targeting": generate_for_ad_targeting,
+    "sleep_quality": generate_for_sleep_quality,
+    "weight_stats": generate_for_weight_stats,
+}
+
+
+def generate_key_set(task_name, key_id, num_inputs):
+    """Generates one key and its inputs in the pool directory of the task, and returns its manifest entry.
+
+    Runs in a worker process: the Rust generators write to `UPLOAD_FOLDER`, which is set to the pool
+    directory of the task, so that no file has to be moved.
+    """
+    output_dir = BASE_OUTPUT_DIR / task_name
+    os.environ["UPLOAD_FOLDER"] = str(output_dir)
+    random.seed()
+    np.random.seed()
+
+    TASK_GENERATORS[task_name](output_dir, key_id, num_inputs)
+
+    (output_dir / f"{key_id}.clientKey").unlink(missing_ok=True)
+    key_path = output_dir / f"{key_id}.serverKey"
+    inputs = [output_dir / input_name(key_id, index, task_name) for index in range(num_inputs)]
+    return {
+        "key": str(key_path.relative_to(BASE_OUTPUT_DIR)),
+        "key_bytes": key_path.stat().st_size,
+        "inputs": [{"path": str(path.relative_to(BASE_OUTPUT_DIR)), "bytes": path.stat().st_size} for path in inputs],
+    }
 
-    target_sk_path = output_dir / f"{user_prefix}.serverKey"
-    target_input_path = output_dir / f"{user_prefix}.{task_name}.input.fheencrypted"
 
-    shutil.move(str(generated_sk_path), str(target_sk_path))
-    shutil.move(str(generated_input_path), str(target_input_path))
+def check_requirements(task_names):
+    missing = []
+    for module in ["weight_stats", "sleep_quality"]:
+        if module in task_names:
+            try:
+                __import__(module)
+            except ImportError:
+                missing.append(f"maturin develop --release --manifest-path tasks/{module}/Cargo.toml")
+    if "ad_targeting" in task_names:
+        try:
+            import concrete_ml_extensions  # noqa: F401
+        except ImportError:
+            missing.append("pip install concrete-ml-extensions")
+        if not AD_TARGETING_DATA_PATH.exists():
+            print(f"ERROR: Ad targeting data file not found: {AD_TARGETING_DATA_PATH}")
+            sys.exit(1)
+    if missing:
+        print("ERROR: Missing generators, run:")
+        for command in missing:
+            print(f"  {command}")
+        sys.exit(1)
 
-    ck_to_remove = Path("./project/uploaded_files") / f"{temp_uid_for_generation}.clientKey"
-    if ck_to_remove.exists():
-        ck_to_remove.unlink()
 
-    print(f"Generated weight_stats data for {user_prefix}")
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sets", type=int, default=NUM_SETS_PER_TASK, help="Inputs per task.")
+    parser.add_argument("--inputs-per-key", type=int, default=1, help="Inputs encrypted with each key (heavy users).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Generator processes (default: one per core).")
+    parser.add_argument("--tasks", nargs="+", default=list(TASK_GENERATORS), choices=list(TASK_GENERATORS))
+    args = parser.parse_args()
 
+    check_requirements(args.tasks)
 
-def main():
     if BASE_OUTPUT_DIR.exists():
         print(f"Cleaning up existing stress data pool directory: {BASE_OUTPUT_DIR}")
         shutil.rmtree(BASE_OUTPUT_DIR)
-    BASE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-    # Ensure tools for Rust tasks are available
-    try:
-        import weight_stats
-        import sleep_quality
-    except ImportError:
-        print("ERROR: Could not import 'weight_stats' or 'sleep_quality'.")
-        print("Ensure you have run 'maturin develop --release' for these tasks:")
-        print("  maturin develop --release --manifest-path tasks/weight_stats/Cargo.toml")
-        print("  maturin develop --release --manifest-path tasks/sleep_quality/Cargo.toml")
-        exit(1)
-
-    # Ensure tools for ad_targeting are available
-    try:
-        import concrete_ml_extensions
-    except ImportError:
-        print("ERROR: Could not import 'concrete_ml_extensions'.")
-        print("Ensure it's installed in your environment.")
-        exit(1)
-    if not AD_TARGETING_DATA_PATH.exists():
-        print(f"ERROR: Ad targeting data file not found: {AD_TARGETING_DATA_PATH}")
-        exit(1)
-
-
-    task_generators = {
-        "ad_targeting": generate_for_ad_targeting,
-        "sleep_quality": generate_for_sleep_quality,
-        "weight_stats": generate_for_weight_stats,
-    }
-
-    for task_name, generator_func in task_generators.items():
-        task_output_dir = BASE_OUTPUT_DIR / task_name
-        task_output_dir.mkdir(exist_ok=True)
-        print(f"\nGenerating data for task: {task_name} into {task_output_dir}")
-        for i in range(NUM_SETS_PER_TASK):
-            user_prefix = f"stress_user_{i}"
+    for task_name in args.tasks:
+        (BASE_OUTPUT_DIR / task_name).mkdir(parents=True)
+
+    # One job per key, the last key of a task taking the remaining inputs
+    jobs = []
+    for task_name in args.tasks:
+        for key_index in range(math.ceil(args.sets / args.inputs_per_key)):
+            num_inputs = min(args.inputs_per_key, args.sets - key_index * args.inputs_per_key)
+            jobs.append((task_name, f"key_{key_index}", num_inputs))
+
+    print(f"Generating {len(jobs)} keys ({args.sets} inputs per task) with {args.workers} processes...")
+    start = time.monotonic()
+    manifest = {"tasks": {task_name: [] for task_name in args.tasks}}
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(generate_key_set, *job): job for job in jobs}
+        for future in as_completed(futures):
+            task_name, key_id, _ = futures[future]
             try:
-                generator_func(task_output_dir, user_prefix)
+                manifest["tasks"][task_name].append(future.result())
+                print(f"Generated {task_name} data for {key_id}")
             except Exception as e:
-                print(f"ERROR generating data for {task_name}, user {user_prefix}: {e}")
-                # Decide if you want to stop or continue
-                # raise # uncomment to stop on first error
+                failures += 1
+                print(f"ERROR generating data for {task_name}, {key_id}: {e}")
+
+    for entries in manifest["tasks"].values():
+        entries.sort(key=lambda entry: entry["key"])
+    (BASE_OUTPUT_DIR / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    total_bytes = sum(
+        entry["key_bytes"] + sum(i["bytes"] for i in entry["inputs"])
+        for entries in manifest["tasks"].values() for entry in entries
+    )
+    print(
+        f"\nGenerated the pool in {time.monotonic() - start:.0f}s: {total_bytes / 1024 ** 2:.0f}MB in {BASE_OUTPUT_DIR}, "
+        f"indexed by {MANIFEST_FILE}" + (f", {failures} keys failed" if failures else "")
+    )
+    if failures:
+        sys.exit(1)
 
-    print(f"\nGenerated {NUM_SETS_PER_TASK} unique key/input sets for each task in {BASE_OUTPUT_DIR}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,247 @@
+"""Replays a submission trace recorded by the server (`TRACE_FILE`) against a test deployment.
+
+Each anonymized key of the trace is mapped to a key/input pair of the stress data pool
+(`python tests/generate_stress_data.py`), and its events are re-driven with their original
+timing, or `--speed` times faster: `add_key` uploads the key of the pair, `start_task` its input,
+and `get_result` requests the result of the task. Keys reused across tasks in the trace are
+reused in the replay. Once its traced events are replayed, a task that has not finished is
+polled until it does.
+
+It reports, per task, the submissions rejected (429 and 422), the latency from submission to
+completion, and how late the replay ran compared with the trace. Results are appended to
+`replay_results.csv`.
+
+Usage (after `make tests_build` and `python tests/generate_stress_data.py`):
+    python tests/replay_trace.py TRACE_FILE [--speed 10] [--max-seconds 3600]
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+from collections import defaultdict
+from pathlib import Path
+
+import aiohttp
+from dotenv import load_dotenv
+
+# Ensure the tests directory is in the Python path to find utils
+sys.path.insert(0, str(Path(__file__).parent.resolve()))
+
+# Load environment configuration
+environment = os.getenv("environment", "dev")
+env_file = f".env_{environment}"
+if not os.path.exists(env_file):
+    print(f"❌ Environment file {env_file} not found!")
+    sys.exit(1)
+load_dotenv(env_file)
+
+import utils as test_utils
+
+STRESS_DATA_POOL_DIR = test_utils.STRESS_DATA_POOL_DIR
+OUTPUT_CSV = Path("replay_results.csv")
+
+POLL_INTERVAL = 2
+COMPLETION_TIMEOUT_SECONDS = 3 * 60 * 60
+
+
+def load_trace(path: Path, max_seconds: float):
+    """Returns the events of the trace, grouped by anonymized key, with times relative to the first event."""
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    events.sort(key=lambda event: event["t"])
+    if not events:
+        return {}
+    start = events[0]["t"]
+    by_key = defaultdict(list)
+    for event in events:
+        event["t"] -= start
+        if event["t"] <= max_seconds:
+            by_key[event["key"]].append(event)
+    return by_key
+
+
+def load_data_pool():
+    """Returns the (key, input) pairs of the stress data pool, per task, with each key read once."""
+    contents = {}
+
+    def read(path):
+        if path not in contents:
+            contents[path] = path.read_bytes()
+        return contents[path]
+
+    pool = {}
+    for task_name, pairs in test_utils.load_stress_data_pool(STRESS_DATA_POOL_DIR).items():
+        if pairs:
+            pool[task_name] = [(read(key_path), read(input_path)) for key_path, input_path in pairs]
+            print(f"Loaded {len(pairs)} key/input pairs for task '{task_name}'.")
+    return pool
+
+
+class Replay:
+    """State of the replay: the tasks submitted, per anonymized task ID, and the counters per task."""
+
+    def __init__(self, url: str, pool, speed: float):
+        self.url = url
+        self.pool = pool
+        self.speed = speed
+        self.start = None
+        self.tasks = {}
+        self.stats = defaultdict(lambda: defaultdict(int))
+        self.latencies = defaultdict(list)
+        self.lags = []
+
+    async def wait_until(self, trace_time: float) -> None:
+        target = self.start + trace_time / self.speed
+        delay = target - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            self.lags.append(-delay)
+
+    async def add_key(self, session, task_name: str, key: bytes) -> str:
+        data = aiohttp.FormData()
+        data.add_field("key", key, filename="serverKey")
+        data.add_field("task_name", task_name)
+        async with session.post(f"{self.url}/add_key", data=data) as response:
+            response.raise_for_status()
+            return (await response.json())["uid"]
+
+    async def start_task(self, session, uid: str, task_name: str, encrypted_input: bytes, anon_task: str) -> None:
+        data = aiohttp.FormData()
+        data.add_field("encrypted_input", encrypted_input, filename="input")
+        data.add_field("uid", uid)
+        data.add_field("task_name", task_name)
+        async with session.post(f"{self.url}/start_task", data=data) as response:
+            if response.status == 429:
+                self.stats[task_name]["overloaded"] += 1
+                return
+            if response.status == 422:
+                self.stats[task_name]["invalid"] += 1
+                return
+            response.raise_for_status()
+            task_id = (await response.json())["task_id"]
+        self.stats[task_name]["accepted"] += 1
+        if anon_task is not None:
+            self.tasks[anon_task] = {"uid": uid, "task_id": task_id, "task_name": task_name, "submitted": time.monotonic(), "done": None}
+
+    async def get_result(self, session, task) -> None:
+        params = {"task_id": task["task_id"], "uid": task["uid"], "task_name": task["task_name"]}
+        async with session.get(f"{self.url}/get_task_result", params=params) as response:
+            response.raise_for_status()
+            await response.read()
+            status = response.headers.get("status", "success")
+        self.stats[task["task_name"]]["result_requests"] += 1
+        if status in ["success", "completed"]:
+            self.complete(task)
+        else:
+            self.stats[task["task_name"]]["result_not_ready"] += 1
+
+    def complete(self, task) -> None:
+        if task["done"] is None:
+            task["done"] = time.monotonic()
+            self.stats[task["task_name"]]["completed"] += 1
+            # In trace time, to compare with the original deployment
+            self.latencies[task["task_name"]].append((task["done"] - task["submitted"]) * self.speed)
+
+    async def wait_for_completion(self, session, task) -> None:
+        deadline = time.monotonic() + COMPLETION_TIMEOUT_SECONDS
+        params = {"task_id": task["task_id"], "uid": task["uid"]}
+        while task["done"] is None and time.monotonic() < deadline:
+            async with session.get(f"{self.url}/get_task_status", params=params) as response:
+                status = (await response.json()).get("status") if response.status == 200 else None
+            if status in ["success", "completed"]:
+                self.complete(task)
+            elif status in ["failure", "error", "revoked", "timeout"]:
+                self.stats[task["task_name"]][status] += 1
+                return
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+
+    async def replay_key(self, session, events) -> None:
+        """Replays the events of one anonymized key, in order."""
+        task_name = next((event["task_name"] for event in events if "task_name" in event), None)
+        if task_name not in self.pool:
+            self.stats[task_name]["skipped_events"] += len(events)
+            return
+        key, encrypted_input = random.choice(self.pool[task_name])
+
+        uid = None
+        submitted = []
+        for event in events:
+            await self.wait_until(event["t"])
+            try:
+                if event["event"] == "add_key" or uid is None:
+                    uid = await self.add_key(session, task_name, key)
+                if event["event"] == "start_task":
+                    await self.start_task(session, uid, event["task_name"], encrypted_input, event.get("task"))
+                    if event.get("task") in self.tasks:
+                        submitted.append(self.tasks[event["task"]])
+                elif event["event"] == "get_result" and event.get("task") in self.tasks:
+                    await self.get_result(session, self.tasks[event["task"]])
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.stats[task_name]["errors"] += 1
+                print(f"⚠️ Replay of `{event['event']}` failed: {e}")
+
+        for task in submitted:
+            await self.wait_for_completion(session, task)
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def report(replay: Replay, duration: float, args) -> None:
+    print(f"\nReplayed `{args.trace}` at {args.speed}x in {duration:.0f}s.")
+    if replay.lags:
+        print(f"Replay lag behind the trace: p95 {percentile(replay.lags, 0.95):.2f}s, max {max(replay.lags):.2f}s")
+
+    new_file = not OUTPUT_CSV.exists()
+    with OUTPUT_CSV.open("a", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        if new_file:
+            writer.writerow(["date", "trace", "speed", "task_name", "accepted", "overloaded", "invalid", "completed",
+                             "result_not_ready", "latency_p50(s)", "latency_p95(s)", "latency_max(s)"])
+        for task_name, stats in sorted(replay.stats.items(), key=lambda item: str(item[0])):
+            latencies = replay.latencies[task_name]
+            p50, p95 = percentile(latencies, 0.50), percentile(latencies, 0.95)
+            latency_max = max(latencies) if latencies else float("nan")
+            print(
+                f"{task_name}: accepted {stats['accepted']}, overloaded {stats['overloaded']}, invalid {stats['invalid']}, "
+                f"completed {stats['completed']}, results not ready {stats['result_not_ready']}/{stats['result_requests']}, "
+                f"skipped events {stats['skipped_events']}, errors {stats['errors']} | "
+                f"latency p50 {p50:.1f}s, p95 {p95:.1f}s, max {latency_max:.1f}s"
+            )
+            writer.writerow([
+                datetime.date.today().isoformat(), Path(args.trace).name, args.speed, task_name, stats["accepted"],
+                stats["overloaded"], stats["invalid"], stats["completed"], stats["result_not_ready"],
+                f"{p50:.2f}", f"{p95:.2f}", f"{latency_max:.2f}",
+            ])
+    print(f"\nSaved results in `{OUTPUT_CSV}`.")
+
+
+async def main(args) -> None:
+    trace = load_trace(Path(args.trace), args.max_seconds)
+    print(f"Loaded {sum(len(events) for events in trace.values())} events of {len(trace)} keys from `{args.trace}`.")
+    replay = Replay(args.url or test_utils.URL, load_data_pool(), args.speed)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        replay.start = time.monotonic()
+        await asyncio.gather(*(replay.replay_key(session, events) for events in trace.values()))
+    report(replay, time.monotonic() - replay.start, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="Trace file recorded with `TRACE_FILE`.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up factor (1 replays in real time).")
+    parser.add_argument("--max-seconds", type=float, default=float("inf"), help="Only replay this much of the trace.")
+    parser.add_argument("--url", default=None, help="Server URL (default: from the environment file).")
+    asyncio.run(main(parser.parse_args()))
@@ -27,7 +27,7 @@ TEST_DURATION_SECONDS = 60 * 60     # How long the main test loop should run
 TASK_TYPES = ["ad_targeting", "sleep_quality", "weight_stats"]
 
 # Directory where generate_stress_data.py places the unique key/input pairs
-STRESS_DATA_POOL_DIR = Path("./project/uploaded_files/stress_data_pool")
+STRESS_DATA_POOL_DIR = test_utils.STRESS_DATA_POOL_DIR
 
 # Statistics
 stats = {
@@ -48,37 +48,22 @@ def record_error(task_name, client_uid, error_message, server_uid=None, task_id=
 available_data_files = {}
 
 def load_data_pool():
-    """Loads pre-generated server key and input data file pairs from the STRESS_DATA_POOL_DIR."""
+    """Loads the pre-generated server key and input data file pairs from the manifest of the STRESS_DATA_POOL_DIR."""
     print(f"Loading data pool from: {STRESS_DATA_POOL_DIR}")
-    if not STRESS_DATA_POOL_DIR.exists():
-        print(f"ERROR: Stress data pool directory not found: {STRESS_DATA_POOL_DIR}")
-        print("Please run 'python tests/generate_stress_data.py' first.")
+    try:
+        pool = test_utils.load_stress_data_pool(STRESS_DATA_POOL_DIR)
+    except FileNotFoundError as e:
+        print(f"ERROR: {e}")
         exit(1)
 
     for task_name in TASK_TYPES:
-        task_pool_dir = STRESS_DATA_POOL_DIR / task_name
-        if not task_pool_dir.exists():
-            print(f"Warning: No data pool found for task '{task_name}' in {task_pool_dir}")
-            available_data_files[task_name] = []
-            continue
-
-        server_keys = sorted(list(task_pool_dir.glob("*.serverKey")))
-
-        pairs = []
-        for sk_path in server_keys:
-            prefix = sk_path.name.replace(".serverKey", "")
-            expected_input_name = f"{prefix}.{task_name}.input.fheencrypted"
-            input_path_match = task_pool_dir / expected_input_name
-            if input_path_match.exists():
-                pairs.append((sk_path, input_path_match))
-            else:
-                print(f"Warning: Missing input file for server key {sk_path.name} in {task_pool_dir}")
-
+        pairs = pool.get(task_name, [])
         available_data_files[task_name] = pairs
         if not pairs:
-            print(f"Warning: No valid key/input pairs found for task '{task_name}' in {task_pool_dir}")
+            print(f"Warning: No key/input pairs found for task '{task_name}' in {STRESS_DATA_POOL_DIR}")
         else:
-            print(f"Loaded {len(pairs)} key/input pairs for task '{task_name}'.")
+            num_keys = len({sk_path for sk_path, _ in pairs})
+            print(f"Loaded {len(pairs)} key/input pairs ({num_keys} keys) for task '{task_name}'.")
 
     if not any(available_data_files.values()):
         print("ERROR: No data found in the stress data pool for any configured task type. Exiting.")
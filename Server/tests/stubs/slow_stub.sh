@@ -0,0 +1,5 @@
+#!/bin/bash
+# Stand-in for a slow FHE binary: records each execution, then outlives the visibility timeout.
+# Usage: ./slow_stub.sh <uid>
+echo "$(hostname) $$" >> "/project/uploaded_files/$1.lease_stub.executions"
+sleep "${STUB_DURATION_SECONDS:-150}"
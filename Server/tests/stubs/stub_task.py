@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Stand-in for an FHE binary, to benchmark the control plane without FHE compute.
+
+Usage: ./stub_task.py <uid> [--seconds S] [--sigma X] [--mode sleep|cpu] [--output FILENAME=BYTES ...]
+
+Each run sleeps (`sleep`) or spins on one core (`cpu`) for a duration drawn from a log-normal
+distribution of mean `--seconds` and shape `--sigma` (`0` for a fixed duration), then writes each
+`--output` file (`{uid}` is replaced) with the given number of random bytes into `SHARED_DIR`.
+The modes of the real binaries (`--validate`, `--validate-key`, `--warmup`, `--prepare`) succeed immediately.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("uid")
+parser.add_argument("--seconds", type=float, default=1.0, help="Mean duration of a run.")
+parser.add_argument("--sigma", type=float, default=0.0, help="Shape of the log-normal distribution of the duration.")
+parser.add_argument("--mode", choices=["sleep", "cpu"], default="sleep")
+parser.add_argument("--output", action="append", default=[], help="`FILENAME=BYTES`, written after the run.")
+args, extra = parser.parse_known_args()
+
+if {"--validate", "--validate-key", "--warmup", "--prepare"} & set(extra):
+    sys.exit(0)
+
+# Log-normal with a mean of `--seconds`
+duration = args.seconds
+if args.sigma > 0 and args.seconds > 0:
+    duration = random.lognormvariate(math.log(args.seconds) - args.sigma ** 2 / 2, args.sigma)
+
+if args.mode == "sleep":
+    time.sleep(duration)
+else:
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        pass
+
+shared_dir = Path(os.getenv("SHARED_DIR", "uploaded_files"))
+for output in args.output:
+    filename, size = output.rsplit("=", 1)
+    (shared_dir / filename.format(uid=args.uid)).write_bytes(os.urandom(int(size)))
+
+print(f"stub run of `{args.uid}`: {duration:.3f}s ({args.mode})")
@@ -0,0 +1,76 @@
+import asyncio
+import sys
+import uuid
+
+import pytest
+
+from utils import *
+
+# The client package lives next to the server modules
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from client import FHEClient
+
+
+@pytest.mark.parametrize("task_name,prefix,nb_tasks", [
+    ("weight_stats", "test_weight_stats", 3),
+    ("ad_targeting", "test_ad_targeting", 3),
+])
+def test_client_runs_a_batch_of_tasks(task_name, prefix, nb_tasks):
+    print(f"\nRun test_client_runs_a_batch_of_tasks for `{task_name}`.")
+
+    # Make sure to run test_<task_name>, to generate the following files
+    serverkey_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    input_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted")
+    phases = []
+
+    async def run():
+        async with FHEClient(URL, hooks=[lambda phase, seconds, info: phases.append(phase)]) as client:
+            uid = await client.add_key(task_name, serverkey_test_path)
+            tasks = await client.start_tasks([(uid, task_name, input_test_path)] * nb_tasks)
+            return await client.wait_for_results(tasks, timeout=TIME_OUT)
+
+    results = asyncio.run(run())
+
+    for result in results:
+        assert not isinstance(result, Exception), f"❌ Task failed: `{result}`"
+        assert result.status in ["success", "completed"], f"❌ Unexpected status: `{result.status}`"
+        assert result.content or result.body, "❌ Empty result"
+    assert phases.count("start_task") == nb_tasks and phases.count("get_result") == nb_tasks
+
+
+def test_retried_submissions_are_not_started_twice():
+    """A request retried with the same `Idempotency-Key` must return the response of the first one."""
+    print("\nRun test_retried_submissions_are_not_started_twice")
+
+    task_name, prefix = "weight_stats", "test_weight_stats"
+    serverkey_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    input_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted")
+
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    uids = []
+    for _ in range(2):
+        with open(serverkey_test_path, "rb") as f:
+            response = requests.post(f"{URL}/add_key", files={"key": f}, data={"task_name": task_name}, headers=headers)
+        response.raise_for_status()
+        uids.append(response.json()["uid"])
+    assert uids[0] == uids[1], f"❌ A retried key upload was stored twice: `{uids}`"
+
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    task_ids = []
+    for _ in range(2):
+        with open(input_test_path, "rb") as f:
+            response = requests.post(
+                f"{URL}/start_task", files={"encrypted_input": f}, data={"uid": uids[0], "task_name": task_name}, headers=headers,
+            )
+        response.raise_for_status()
+        task_ids.append(response.json()["task_id"])
+    assert task_ids[0] == task_ids[1], f"❌ A retried submission was started twice: `{task_ids}`"
+
+    # The same key with a different input is not a retry
+    response = requests.post(
+        f"{URL}/start_task", files={"encrypted_input": b"another input"}, data={"uid": uids[0], "task_name": task_name}, headers=headers,
+    )
+    assert response.status_code == 422, f"❌ Expected 422 for a reused `Idempotency-Key`, got: `{response.status_code}`."
+
+    cancel_tasks_and_clear_redis(uids[0], task_ids[:1])
@@ -1,5 +1,8 @@
+import hashlib
+import io
 import re
 import requests
+import tarfile
 import time 
 import pytest
 
@@ -84,6 +87,90 @@ def test_get_use_cases_endpoint():
     assert len(list(data.values())[0]) == len(TASK_CONFIG['tasks'].keys())
 
 
+def test_queue_stats_endpoint():
+    print("\nRun test queue_stats endpoint.")
+
+    response = requests.get(f"{URL}/queue_stats")
+    response.raise_for_status()
+    data = response.json()
+
+    assert data["worker_capacity"] >= 1
+    assert data["predicted_wait_seconds"] >= 0
+    for task in data["queued_tasks"]:
+        assert task["estimated_start_seconds"] <= task["estimated_finish_seconds"]
+    assert isinstance(data["cost_model"], dict)
+
+
+def test_admin_profile_task_requires_token():
+    print("\nRun test admin profile_task endpoint without a valid token.")
+
+    params = {"task_id": "unknown", "uid": "unknown"}
+    response = requests.post(f"{URL}/admin/profile_task", params=params)
+    assert response.status_code in [401, 403], f"❌ Expected 401 or 403 without a token, got: `{response.status_code}`."
+
+    response = requests.post(f"{URL}/admin/profile_task", params=params, headers={"X-Admin-Token": "wrong-token"})
+    assert response.status_code in [401, 403], f"❌ Expected 401 or 403 with a wrong token, got: `{response.status_code}`."
+
+
+@pytest.mark.parametrize("task_name,prefix,corrupt", [
+    ("weight_stats", "test_weight_stats", lambda data: data[: len(data) // 2]),
+    ("weight_stats", "test_weight_stats", lambda data: data + b"\x00"),
+    ("sleep_quality", "test_good_night", lambda data: b""),
+])
+def test_start_task_rejects_invalid_input(task_name, prefix, corrupt):
+    print(f"\nRun test start_task endpoint with an invalid input for `{task_name}`.")
+
+    # Make sure to run test_<task_name>, to generate the following files
+    serverkey_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    input_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted")
+
+    uid = add_key_api(task_name, serverkey_test_path)
+    response = requests.post(
+        f"{URL}/start_task",
+        files={"encrypted_input": corrupt(input_test_path.read_bytes())},
+        data={"uid": uid, "task_name": task_name},
+    )
+
+    assert response.status_code == 422, f"❌ Expected 422 for an invalid input, got: `{response.status_code}` ({response.text})."
+    assert not Path(f"{UPLOAD_FOLDER.name}/{uid}.{task_name}.input.fheencrypted").exists()
+
+
+def test_start_task_rejects_all_tasks_on_one_invalid_input():
+    """A request with one valid and one invalid input must start no task, and keep none of its inputs."""
+    print("\nRun test start_task endpoint with a valid and an invalid input.")
+
+    # Make sure to run test_weight_stats, to generate the following files
+    uid = add_key_api("weight_stats", Path(f"{UPLOAD_FOLDER}/test_weight_stats.serverKey"))
+    valid_input = Path(f"{UPLOAD_FOLDER}/test_weight_stats.weight_stats.input.fheencrypted").read_bytes()
+    response = requests.post(
+        f"{URL}/start_task",
+        files=[("encrypted_input", valid_input), ("encrypted_input", b"")],
+        data={"uid": uid, "task_name": ["weight_stats", "sleep_quality"]},
+    )
+
+    assert response.status_code == 422, f"❌ Expected 422 for an invalid input, got: `{response.status_code}` ({response.text})."
+    for task_name in ["weight_stats", "sleep_quality"]:
+        assert not Path(f"{UPLOAD_FOLDER.name}/{uid}.{task_name}.input.fheencrypted").exists(), f"❌ The input of `{task_name}` was kept."
+
+
+@pytest.mark.parametrize("task_name,prefix", [
+    ("weight_stats", "test_weight_stats"),
+    ("sleep_quality", "test_good_night"),
+])
+def test_add_key_rejects_invalid_key(task_name, prefix):
+    print(f"\nRun test add_key endpoint with an invalid key for `{task_name}`.")
+
+    # Make sure to run test_<task_name>, to generate the following files
+    serverkey_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    stored_keys = set(Path(UPLOAD_FOLDER.name).glob("*.serverKey"))
+
+    key = serverkey_test_path.read_bytes()
+    response = requests.post(f"{URL}/add_key", files={"key": key[: len(key) // 2]}, data={"task_name": task_name})
+
+    assert response.status_code == 422, f"❌ Expected 422 for an invalid key, got: `{response.status_code}` ({response.text})."
+    assert set(Path(UPLOAD_FOLDER.name).glob("*.serverKey")) == stored_keys, "❌ The invalid key was stored."
+
+
 # The 'ad_targeting' and 'weight_stats' tasks tend to complete quickly.
 # To avoid test failures due to early completion, a success flag is added in the expected status.
 @pytest.mark.parametrize("task_name,expected_status,expected_msg,prefix", [
@@ -256,3 +343,163 @@ def test_inspect_celery_redis(task_name, prefix, nb_tasks):
     assert_status(status, details, "queued", r"Task is in the Redis broker queue")
 
     cancel_tasks_and_clear_redis(uid, all_created_tasks)
+
+
+
+def test_list_workers_endpoint():
+    """The worker registry must list the running tasks that `celery inspect` reports, without broadcasting."""
+    print("\nRun test list_workers endpoint.")
+
+    task_name, prefix = "sleep_quality", "test_good_night"
+    # Make sure to run test_good_night, to generate the following files
+    uid = add_key_api(task_name, f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    task_id = start_task_api(uid, task_name, f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted")
+
+    for attempt in range(TIME_OUT):
+        time.sleep(POLL_INTERVAL)
+        status, _ = get_status_api(uid, task_id)
+        if status == "started":
+            break
+
+    # Workers republish their state within a fraction of a second of a task transition
+    time.sleep(1)
+    workers = requests.get(f"{URL}/list_workers").json()
+    active_tasks_registry = [task["task_id"] for worker in workers.values() for task in worker["active"]]
+    active_tasks_celery = inspect_celery(task="active")
+    print(f"[via API] Workers: `{list(workers)}`, active tasks: `{active_tasks_registry}`")
+
+    assert any("usecases" in worker["queues"] for worker in workers.values()), f"❌ No `usecases` worker registered: `{workers}`"
+    assert task_id in active_tasks_registry, f"❌ `{task_id=}` expected in the worker registry, got: `{active_tasks_registry}`"
+    assert task_id in active_tasks_celery, f"❌ `{task_id=}` expected to be running on Celery, but wasn't found in `{active_tasks_celery}`"
+
+    cancel_task_api(uid, task_id)
+
+def test_batch_status_and_result_endpoints():
+    """The batch endpoints must return, in order, the same statuses and outputs as the single-task ones."""
+    print("\nRun test get_task_status_batch and get_task_result_batch endpoints.")
+
+    tasks = []
+    for task_name, prefix in [("weight_stats", "test_weight_stats"), ("ad_targeting", "test_ad_targeting")]:
+        # Make sure to run test_<task_name>, to generate the following files
+        uid = add_key_api(task_name, Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey"))
+        for _ in range(2):
+            task_id = start_task_api(uid, task_name, Path(f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted"))
+            tasks.append({"task_id": task_id, "uid": uid, "task_name": task_name})
+
+    for task in tasks:
+        poll_task_result_until_ready(task["uid"], task["task_id"], task["task_name"])
+
+    response = requests.post(f"{URL}/get_task_status_batch", json={"tasks": tasks + [{"task_id": "Fake_Task_ID", "uid": tasks[0]["uid"]}]})
+    response.raise_for_status()
+    statuses = response.json()["tasks"]
+    assert [s["status"] for s in statuses] == ["completed"] * len(tasks) + ["unknown"], f"❌ Unexpected statuses: `{statuses}`"
+    assert [s["task_id"] for s in statuses[:-1]] == [task["task_id"] for task in tasks]
+
+    response = requests.post(f"{URL}/get_task_result_batch", json={"tasks": tasks})
+    response.raise_for_status()
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as tar:
+        manifest = json.load(tar.extractfile("manifest.json"))["tasks"]
+        for task, entry in zip(tasks, manifest):
+            expected_files = len(TASK_CONFIG["tasks"][task["task_name"]]["output_files"])
+            assert len(entry["files"]) == expected_files, f"❌ Missing outputs for `{task['task_name']}`: `{entry}`"
+            for member in entry["files"].values():
+                assert len(tar.extractfile(member).read()) > 1 * 1024, f"❌ Too small output: `{member}`"
+
+    response = requests.post(f"{URL}/get_task_status_batch", json={"tasks": []})
+    assert response.status_code == 400, f"❌ Expected 400 for an empty batch, got: `{response.status_code}`."
+
+
+@pytest.mark.parametrize("task_name,prefix", [
+    ("weight_stats", "test_weight_stats"),
+    ("ad_targeting", "test_ad_targeting"),
+])
+def test_start_task_with_inline_key(task_name, prefix):
+    """`/start_task` must store a key sent along with the input, and run the task with it."""
+    print(f"\nRun test start_task endpoint with an inline key for `{task_name}`.")
+
+    # Make sure to run test_<task_name>, to generate the following files
+    serverkey_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    input_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted")
+
+    with open(serverkey_test_path, "rb") as key, open(input_test_path, "rb") as f:
+        response = requests.post(
+            f"{URL}/start_task", files=[("key", key), ("encrypted_input", f)], data={"task_name": task_name},
+        )
+    response.raise_for_status()
+    body = response.json()
+    uid, task_ids = body["uid"], body["task_ids"]
+    assert ID_PATTERN.match(uid), f"❌ Invalid UID format, got: `{uid}`."
+    assert task_ids == [body["task_id"]], f"❌ Unexpected task IDs: `{body}`"
+    assert serverkey_test_path.read_bytes() == Path(f"{UPLOAD_FOLDER.name}/{uid}.serverKey").read_bytes(), (
+        "❌ Server key files differ in content."
+    )
+
+    poll_task_result_until_ready(uid, task_ids[0], task_name)
+
+    # The same task twice in one request would share its input file
+    with open(input_test_path, "rb") as f:
+        data = f.read()
+    response = requests.post(
+        f"{URL}/start_task", files=[("encrypted_input", data), ("encrypted_input", data)],
+        data={"uid": uid, "task_name": [task_name, task_name]},
+    )
+    assert response.status_code == 400, f"❌ Expected 400 for a repeated task, got: `{response.status_code}`."
+
+    # Exactly one of `uid` and `key` is expected
+    with open(serverkey_test_path, "rb") as key, open(input_test_path, "rb") as f:
+        response = requests.post(
+            f"{URL}/start_task", files=[("key", key), ("encrypted_input", f)], data={"uid": uid, "task_name": task_name},
+        )
+    assert response.status_code == 400, f"❌ Expected 400 for both a UID and a key, got: `{response.status_code}`."
+
+
+def test_resumable_key_upload():
+    """A key sent in chunks, with a lost chunk response, must be stored as `/add_key` does."""
+    print("\nRun test resumable key upload endpoints.")
+
+    # Make sure to run test_weight_stats, to generate the following files
+    task_name, prefix = "weight_stats", "test_weight_stats"
+    serverkey_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.serverKey")
+    input_test_path = Path(f"{UPLOAD_FOLDER}/{prefix}.{task_name}.input.fheencrypted")
+    key = serverkey_test_path.read_bytes()
+
+    response = requests.post(f"{URL}/start_key_upload", data={"task_name": task_name, "size": len(key)})
+    response.raise_for_status()
+    upload_id, chunk_bytes = response.json()["upload_id"], response.json()["chunk_bytes"]
+
+    def send_chunk(offset, chunk, checksum=None):
+        return requests.post(
+            f"{URL}/upload_key_chunk", params={"upload_id": upload_id, "offset": offset}, data=chunk,
+            headers={"X-Chunk-SHA256": checksum or hashlib.sha256(chunk).hexdigest()},
+        )
+
+    offset = 0
+    while offset < len(key):
+        chunk = key[offset:offset + chunk_bytes]
+        response = send_chunk(offset, chunk)
+        response.raise_for_status()
+        # A retry of a received chunk is rejected with the offset to resume from
+        retried = send_chunk(offset, chunk)
+        assert retried.status_code == 409, f"❌ Expected 409 for a chunk sent twice, got: `{retried.status_code}`."
+        offset = int(retried.headers["Upload-Offset"])
+        assert offset == response.json()["offset"], f"❌ Unexpected offset: `{offset}`"
+
+        status = requests.get(f"{URL}/get_key_upload_status", params={"upload_id": upload_id}).json()
+        assert status["offset"] == offset and not status["finished"], f"❌ Unexpected upload status: `{status}`"
+
+    response = requests.post(f"{URL}/finish_key_upload", data={"upload_id": upload_id})
+    response.raise_for_status()
+    uid = response.json()["uid"]
+    assert ID_PATTERN.match(uid), f"❌ Invalid UID format, got: `{uid}`."
+    assert requests.post(f"{URL}/finish_key_upload", data={"upload_id": upload_id}).json()["uid"] == uid, "❌ A retried finish stored the key twice."
+    assert Path(f"{UPLOAD_FOLDER.name}/{uid}.serverKey").read_bytes() == key, "❌ Server key files differ in content."
+
+    task_id = start_task_api(uid, task_name, input_test_path)
+    poll_task_result_until_ready(uid, task_id, task_name)
+
+    # A corrupted chunk and an incomplete key are rejected
+    upload_id = requests.post(f"{URL}/start_key_upload", data={"task_name": task_name, "size": len(key)}).json()["upload_id"]
+    response = send_chunk(0, key[:chunk_bytes], checksum=hashlib.sha256(b"").hexdigest())
+    assert response.status_code == 422, f"❌ Expected 422 for a corrupted chunk, got: `{response.status_code}`."
+    response = requests.post(f"{URL}/finish_key_upload", data={"upload_id": upload_id})
+    assert response.status_code == 409, f"❌ Expected 409 for an incomplete key, got: `{response.status_code}`."
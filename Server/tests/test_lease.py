@@ -0,0 +1,63 @@
+import subprocess
+import time
+import uuid
+
+from utils import *
+
+STUB_PATH = Path("tests/stubs/slow_stub.sh")
+STUB_BINARY = "slow_stub.sh"
+# Long enough for the broker to redeliver an unacknowledged message (visibility timeout: 60s)
+STUB_DURATION_SECONDS = 150
+
+
+def usecase_worker_containers():
+    return [f"{ENV}_service_celery_usecases_{i + 1}" for i in range(CELERY_WORKER_COUNT)]
+
+
+def submit_stub_task(uid):
+    """Submits the stub binary to the `usecases` queue, as `/start_task` does."""
+    out = subprocess.run(
+        [
+            "docker", "exec", "-i", usecase_worker_containers()[0], "python", "-c",
+            f"from task_executor import run_binary_task; print(run_binary_task.delay('{STUB_BINARY}', '{uid}', 'lease_stub').id)",
+        ],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return out.strip().splitlines()[-1]
+
+
+def task_backend_status(task_id):
+    out = subprocess.run(
+        ["docker", "exec", "-i", REDIS_CONTAINER_NAME, "redis-cli", "-n", "1", "GET", f"celery-task-meta-{task_id}"],
+        check=True, capture_output=True, text=True,
+    ).stdout.strip()
+    return json.loads(out)["status"] if out else None
+
+
+def test_long_task_is_executed_once():
+    """A task running longer than the visibility timeout must not be redelivered to another worker."""
+    print("\nRun test_long_task_is_executed_once")
+
+    assert CELERY_WORKER_COUNT * CELERY_WORKER_CONCURRENCY >= 2, "A second free worker is needed to observe a redelivery."
+
+    for container in usecase_worker_containers():
+        subprocess.run(["docker", "cp", str(STUB_PATH), f"{container}:/project/{STUB_BINARY}"], check=True)
+
+    uid = f"test_lease_{uuid.uuid4()}"
+    executions_path = Path(SHARED_DIR) / f"{uid}.lease_stub.executions"
+
+    task_id = submit_stub_task(uid)
+
+    # Wait for the task to complete, well past the visibility timeout
+    for _ in range(2 * STUB_DURATION_SECONDS // POLL_INTERVAL):
+        time.sleep(POLL_INTERVAL)
+        if task_backend_status(task_id) == "SUCCESS":
+            break
+    else:
+        raise TimeoutError(f"Stub task `{task_id}` did not complete.")
+
+    # Leave time to a redelivered copy, if any, to start
+    time.sleep(30)
+
+    executions = executions_path.read_text().splitlines()
+    assert len(executions) == 1, f"Expected a single execution of `{task_id}`, got `{len(executions)}`: {executions}"
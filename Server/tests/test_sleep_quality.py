@@ -5,7 +5,7 @@ import sleep_quality
 from utils import *
 
 
-def run_sleep_quality(night, uid):
+def run_sleep_quality(night, uid, chunk_size=0):
     """Test the sleep quality function for a good sleep scenario (score > 3)."""
 
     ck_path = f"{UPLOAD_FOLDER}/{uid}.clientKey"
@@ -14,7 +14,7 @@ def run_sleep_quality(night, uid):
 
     start_time = time.time()
 
-    sleep_quality.generate_files(night, uid)
+    sleep_quality.generate_files(night, uid, chunk_size)
     
     assert os.path.exists(serverkey_path), f"Missing file: {serverkey_path=}"
     assert os.path.exists(ck_path), f"Missing file: {ck_path=}"
@@ -34,26 +34,24 @@ def run_sleep_quality(night, uid):
     return score
 
 
+BAD_NIGHT = [
+    (0,   0, 120),
+    (3, 120, 150),
+    (0, 150, 210),
+    (4, 210, 240),
+    (0, 240, 300)
+]
+
+
 def test_bad_night():
     print("\nRun run_sleep_quality for bad sleep scenario...")
 
-    bad_night = [
-        (0,   0, 120),
-        (3, 120, 150),
-        (0, 150, 210),
-        (4, 210, 240),
-        (0, 240, 300)
-    ]
-
     uid = "test_bad_night"
-    score = run_sleep_quality(bad_night, uid)
+    score = run_sleep_quality(BAD_NIGHT, uid)
     assert score == 5, f"Expected score for a bad night is 5, but got `{score}`"
 
 
-def test_good_night():
-    print("\nRun run_sleep_quality for good sleep scenario...")
-
-    good_night = [
+GOOD_NIGHT = [
         (0, 0, 210),
         (0, 240, 570),
         (2, 0, 30),
@@ -71,7 +69,39 @@ def test_good_night():
         (4, 450, 510),
         (3, 510, 540),
         (5, 540, 570)
-]   
+]
+
+
+def test_good_night():
+    print("\nRun run_sleep_quality for good sleep scenario...")
+
     uid = "test_good_night"
-    score = run_sleep_quality(good_night, uid)
+    score = run_sleep_quality(GOOD_NIGHT, uid)
+    assert score == 1, f"Expected score for a good night is 1, but got `{score}`"
+
+
+def test_good_night_chunked():
+    print("\nRun run_sleep_quality for good sleep scenario, with a chunked input...")
+
+    uid = "test_good_night_chunked"
+    score = run_sleep_quality(GOOD_NIGHT, uid, chunk_size=4)
     assert score == 1, f"Expected score for a good night is 1, but got `{score}`"
+
+
+def test_sleep_quality_batch():
+    print("\nRun sleep_quality_batch over several nights...")
+
+    uid = "test_sleep_quality_batch"
+    ck_path = f"{UPLOAD_FOLDER}/{uid}.clientKey"
+    serverkey_path = f"{UPLOAD_FOLDER}/{uid}.serverKey"
+    input_path = f"{UPLOAD_FOLDER}/{uid}.sleep_quality_batch.input.fheencrypted"
+
+    sleep_quality.generate_batch_files([GOOD_NIGHT, BAD_NIGHT, GOOD_NIGHT], uid)
+
+    _, _, output_path = run_task_on_server("sleep_quality_batch", serverkey_path, input_path, prefix=uid)
+
+    assert output_path[0].exists(), f"Missing file: {output_path=}"
+
+    # One score per night, in the input order
+    scores = sleep_quality.decrypt_batch(str(ck_path), str(output_path[0]))
+    assert scores == [1, 5, 1], f"Expected scores `[1, 5, 1]`, but got `{scores}`"
@@ -0,0 +1,115 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+from utils import *
+
+# The storage module lives next to the server modules
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+from storage import LocalStorage, S3Storage
+
+# The smallest part S3 accepts in a multipart upload
+PART_BYTES = 5 * 1024 * 1024
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    """A local stand-in for S3, served by `moto`."""
+    server_module = pytest.importorskip("moto.server")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    server = server_module.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture(params=["local", "s3"])
+def store(request, tmp_path):
+    if request.param == "local":
+        return LocalStorage(tmp_path)
+    endpoint = request.getfixturevalue("s3_endpoint")
+    bucket = f"test-{uuid.uuid4().hex[:12]}"
+    store = S3Storage(tmp_path, bucket, endpoint_url=endpoint, chunk_bytes=PART_BYTES, max_concurrency=4)
+    store.client.create_bucket(Bucket=bucket)
+    return store
+
+
+def test_published_files_can_be_fetched_read_and_streamed(store):
+    print(f"\nRun test_published_files_can_be_fetched_read_and_streamed for `{store.name}`")
+
+    # Large enough to be transferred in several parts
+    data = os.urandom(2 * PART_BYTES + 1234)
+    path = store.root / "test_uid.weight_stats.input.fheencrypted"
+    path.write_bytes(data)
+    store.publish(path)
+    store.release(path)
+
+    assert store.exists(path), "❌ The published file is missing."
+    assert store.stat(path)[0] == len(data), f"❌ Unexpected size: `{store.stat(path)[0]}`"
+    assert store.fetch(path) == path and path.read_bytes() == data, "❌ The fetched file differs from the published one."
+    assert store.read(path) == data, "❌ The read content differs from the published one."
+    chunks = list(store.stream(path, chunk_bytes=PART_BYTES))
+    assert len(chunks) == 3 and b"".join(chunks) == data, "❌ The streamed content differs from the published one."
+
+
+def test_missing_files(store):
+    print(f"\nRun test_missing_files for `{store.name}`")
+
+    path = store.root / f"{uuid.uuid4()}.serverKey"
+    assert not store.exists(path)
+    assert store.fetch(path, missing_ok=True) is None
+    for call in [store.fetch, store.read, store.stream, store.stat]:
+        with pytest.raises(FileNotFoundError):
+            call(path)
+
+
+def test_backups_are_listed_copied_and_deleted(store):
+    print(f"\nRun test_backups_are_listed_copied_and_deleted for `{store.name}`")
+
+    uid, task_id = str(uuid.uuid4()), str(uuid.uuid4())
+    output_path = store.root / f"{uid}.sleep_quality.output.fheencrypted"
+    output_path.write_bytes(b"encrypted output")
+    store.publish(output_path)
+
+    backup_path = store.root / f"backup.{uid}.{task_id}.sleep_quality.output.fheencrypted"
+    store.copy(output_path, backup_path)
+    listed = store.list(f"backup.{uid}.", match=lambda name: name.endswith(".fheencrypted"))
+    assert [path.name for path, _ in listed] == [backup_path.name], f"❌ Unexpected backups: `{listed}`"
+    assert store.read(backup_path) == b"encrypted output"
+
+    store.delete(backup_path)
+    assert not store.exists(backup_path) and store.list(f"backup.{uid}.") == []
+
+
+def test_fetched_keys_are_cached_and_evicted(s3_endpoint, tmp_path):
+    """Each host keeps the keys it fetched, up to the size of its cache."""
+    print("\nRun test_fetched_keys_are_cached_and_evicted")
+
+    bucket = f"test-{uuid.uuid4().hex[:12]}"
+    publisher = S3Storage(tmp_path / "api", bucket, endpoint_url=s3_endpoint)
+    publisher.client.create_bucket(Bucket=bucket)
+    publisher.root.mkdir()
+    worker = S3Storage(tmp_path / "worker", bucket, endpoint_url=s3_endpoint, cache_max_bytes=1500)
+    worker.root.mkdir()
+
+    keys = []
+    for _ in range(2):
+        key_path = publisher.root / f"{uuid.uuid4()}.serverKey"
+        key_path.write_bytes(os.urandom(1000))
+        publisher.publish(key_path)
+        keys.append(worker.root / key_path.name)
+
+    worker.fetch(keys[0], cache=True)
+    # A cached key is used as is, even once deleted from the store
+    publisher.delete(publisher.root / keys[0].name)
+    assert worker.fetch(keys[0], cache=True) == keys[0], "❌ The cached key was not reused."
+
+    # Fetching the second key goes over the size of the cache, which evicts the first one
+    worker.fetch(keys[1], cache=True)
+    assert keys[1].is_file() and not keys[0].exists(), "❌ The least recently used key was not evicted."
@@ -0,0 +1,40 @@
+import subprocess
+
+from utils import *
+
+# A process group standing in for a hung binary: a shell and a child, both sleeping
+HUNG_COMMAND = "['bash', '-c', 'sleep 300 & sleep 300']"
+
+
+def run_in_worker(code):
+    return subprocess.run(
+        ["docker", "exec", "-i", f"{ENV}_service_celery_usecases_1", "python", "-c", code],
+        check=True, capture_output=True, text=True,
+    ).stdout.strip().splitlines()[-1]
+
+
+def test_hung_binary_is_stopped_with_its_process_group():
+    """A binary past its time limits must be stopped, along with the processes it spawned."""
+    print("\nRun test_hung_binary_is_stopped_with_its_process_group")
+
+    out = run_in_worker(
+        "from time_limits import TaskTimeLimitExceeded, run_with_time_limits\n"
+        "try:\n"
+        f"    run_with_time_limits({HUNG_COMMAND}, 2, 4)\n"
+        "except TaskTimeLimitExceeded as e:\n"
+        "    print(e.limit)\n"
+    )
+    assert out == "soft", f"Expected the binary to be stopped at its soft limit, got: `{out}`."
+
+    # `[0]` keeps the pattern from matching the command line of this check itself
+    survivors = run_in_worker("import subprocess; print(len(subprocess.run(['pgrep', '-f', 'sleep 30[0]'], capture_output=True, text=True).stdout.split()))")
+    assert survivors == "0", f"Expected no process left behind, got `{survivors}`."
+
+
+def test_timeouts_are_reported():
+    print("\nRun test_timeouts_are_reported")
+
+    response = requests.get(f"{URL}/queue_stats")
+    response.raise_for_status()
+    for stats in response.json()["timeouts"].values():
+        assert stats["soft"] >= 0 and stats["hard"] >= 0
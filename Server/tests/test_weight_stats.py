@@ -39,3 +39,54 @@ def test_weight_stats():
     end_time = time.time() - start_time
     print(f"Test execution time: {end_time:.2f} seconds")
 
+
+
+def test_weight_stats_chunked():
+    print("\n Run test_weight_stats_chunked")
+
+    weights_list = [68.0, 65.0, 69.0, 70.0, 70.5]
+
+    uid = "test_weight_stats_chunked"
+    ck_path = f"{UPLOAD_FOLDER}/{uid}.clientKey"
+    serverkey_path = f"{UPLOAD_FOLDER}/{uid}.serverKey"
+    input_path = f"{UPLOAD_FOLDER}/{uid}.weight_stats.input.fheencrypted"
+
+    # Encrypt the input as 3 chunks (2 + 2 + 1 ciphertexts)
+    weight_stats.generate_files(weights_list, uid, 2)
+
+    _, _, output_paths = run_task_on_server("weight_stats", serverkey_path, input_path, prefix=uid)
+
+    decrypted_avg, decrypted_min, decrypted_max = weight_stats.decrypt(str(ck_path), *(str(p) for p in output_paths))
+    assert np.mean(weights_list) * 10 == decrypted_avg, f"Expected avg: {np.mean(weights_list)}, got: {decrypted_avg}"
+    assert np.min(weights_list) * 10 == decrypted_min, f"Expected min: {np.min(weights_list)}, got: {decrypted_min}"
+    assert np.max(weights_list) * 10 == decrypted_max, f"Expected max: {np.max(weights_list)}, got: {decrypted_max}"
+
+
+def test_weight_stats_incremental():
+    print("\n Run test_weight_stats_incremental")
+
+    history = [68.0, 65.0, 69.0]
+    new_weights = [70.0, 70.5]
+
+    uid = "test_weight_stats_incremental"
+    ck_path = f"{UPLOAD_FOLDER}/{uid}.clientKey"
+    serverkey_path = f"{UPLOAD_FOLDER}/{uid}.serverKey"
+    input_path = f"{UPLOAD_FOLDER}/{uid}.weight_stats.input.fheencrypted"
+    incremental_input_path = f"{UPLOAD_FOLDER}/{uid}.weight_stats_incremental.input.fheencrypted"
+
+    # The full task initialises the running state of the server UID
+    weight_stats.generate_files(history, uid)
+    server_uid = add_key_api("weight_stats", serverkey_path)
+    task_id = start_task_api(server_uid, "weight_stats", input_path)
+    poll_task_result_until_ready(server_uid, task_id, "weight_stats", uid)
+
+    # The incremental task only receives the new weights
+    weight_stats.generate_incremental_input(new_weights, uid)
+    task_id = start_task_api(server_uid, "weight_stats_incremental", incremental_input_path)
+    output_paths = poll_task_result_until_ready(server_uid, task_id, "weight_stats_incremental", uid)
+
+    all_weights = history + new_weights
+    decrypted_avg, decrypted_min, decrypted_max = weight_stats.decrypt(str(ck_path), *(str(p) for p in output_paths))
+    assert int(np.mean(all_weights) * 10) == decrypted_avg, f"Expected avg: {np.mean(all_weights)}, got: {decrypted_avg}"
+    assert np.min(all_weights) * 10 == decrypted_min, f"Expected min: {np.min(all_weights)}, got: {decrypted_min}"
+    assert np.max(all_weights) * 10 == decrypted_max, f"Expected max: {np.max(all_weights)}, got: {decrypted_max}"
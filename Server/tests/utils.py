@@ -28,6 +28,7 @@ CELERY_WORKER_CONCURRENCY = int(os.getenv("CELERY_WORKER_CONCURRENCY_USECASE_QUE
 POLL_INTERVAL = 2
 TIME_OUT = 3 * 60 * 60
 UPLOAD_FOLDER = Path(f"./project/{SHARED_DIR}")
+STRESS_DATA_POOL_DIR = Path("./project/uploaded_files/stress_data_pool")
 
 
 def save_output_file(path, content, mode="wb"):
@@ -50,12 +51,18 @@ def inspect_celery(task="active"):
 
 
 def inspect_redis(queue="usecases"):
+    """Returns the IDs of the tasks pending in a queue, and in its per-worker queues (`<queue>.<hostname>`)."""
 
-    out = subprocess.run([
-        "docker", "exec", "-i", REDIS_CONTAINER_NAME, "redis-cli", "LRANGE", queue, "0", "-1"
+    queues = [queue] + subprocess.run([
+        "docker", "exec", "-i", REDIS_CONTAINER_NAME, "redis-cli", "--scan", "--pattern", f"{queue}.*"
     ], check=True, capture_output=True, text=True).stdout.strip().splitlines()
 
-    pending_tasks_redis = [json.loads(line)["headers"]["id"] for line in out]
+    pending_tasks_redis = []
+    for name in queues:
+        out = subprocess.run([
+            "docker", "exec", "-i", REDIS_CONTAINER_NAME, "redis-cli", "LRANGE", name, "0", "-1"
+        ], check=True, capture_output=True, text=True).stdout.strip().splitlines()
+        pending_tasks_redis += [json.loads(line)["headers"]["id"] for line in out]
 
     return pending_tasks_redis
 
@@ -78,17 +85,27 @@ def add_key_api(task_name: str, serverkey_path: str) -> str:
 
 
 def start_task_api(uid: str, task_name: str, input_path: str) -> str:
-    """Start n tasks."""
-    with open(input_path, "rb") as f:
-        response = requests.post(
-            f"{URL}/start_task",
-            files={"encrypted_input": f},
-            data={"uid": uid, "task_name": task_name}
-        )
-        task_id = response.json()["task_id"]
-        response.raise_for_status()
-        print(f"[Server side | TASK_ID={task_id}] Uploading encrypted input: `{input_path}`")
-        
+    """Start n tasks.
+
+    If the server is overloaded (HTTP 429), the submission is retried after `Retry-After` seconds.
+    """
+    while True:
+        with open(input_path, "rb") as f:
+            response = requests.post(
+                f"{URL}/start_task",
+                files={"encrypted_input": f},
+                data={"uid": uid, "task_name": task_name}
+            )
+        if response.status_code != 429:
+            break
+        retry_after = int(response.headers.get("Retry-After", POLL_INTERVAL))
+        print(f"🚦 [Server side] Overloaded, retrying `{task_name}` in {retry_after}s")
+        time.sleep(retry_after)
+
+    task_id = response.json()["task_id"]
+    response.raise_for_status()
+    print(f"[Server side | TASK_ID={task_id}] Uploading encrypted input: `{input_path}`")
+
     return task_id
 
 
@@ -170,6 +187,22 @@ def poll_task_result_until_ready(uid: str, task_id: str, task_name: str, prefix=
     raise TimeoutError("Task did not complete within timeout")
 
 
+def load_stress_data_pool(pool_dir: Path = STRESS_DATA_POOL_DIR):
+    """Returns the (server key path, input path) pairs of the stress data pool, per task.
+
+    The pool is indexed by the `manifest.json` written by `tests/generate_stress_data.py`; a key
+    reused for several inputs appears in one pair per input.
+    """
+    manifest_path = pool_dir / "manifest.json"
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"No stress data pool manifest at {manifest_path}, run `python tests/generate_stress_data.py`.")
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    return {
+        task_name: [(pool_dir / entry["key"], pool_dir / input_file["path"]) for entry in entries for input_file in entry["inputs"]]
+        for task_name, entries in manifest["tasks"].items()
+    }
+
+
 def list_current_tasks_api():
     """Get tasks list via the API."""
     response = requests.get(f"{URL}/list_current_tasks")
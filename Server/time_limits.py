@@ -0,0 +1,194 @@
+"""Soft and hard time limits of the task binaries.
+
+Each binary runs in its own process group. When it exceeds its soft limit, the whole group is
+sent `SIGTERM`; if it is still alive at its hard limit, the group is killed with `SIGKILL`. The
+limits of a task come from its `time_limit` section in `tasks.yaml`:
+
+    time_limit:
+      soft_seconds: 600      # Soft limit for an empty input
+      hard_seconds: 900      # Hard limit for an empty input
+      seconds_per_mb: 30     # Added to both limits per MB of encrypted input
+      cost_factor: 10        # The soft limit is at most `cost_factor` times the expected time
+
+Once the cost model has enough samples for the task and its input size, the soft limit tightens
+to `cost_factor` times the expected execution time (but never below `TIME_LIMIT_MIN_SECONDS`),
+so that a runaway job is stopped long before the static limit. Timeouts are counted per task.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from typing import Dict, Optional, Tuple
+
+from cost_model import BUCKET_COST_KEY_TEMPLATE, expected_execution_time, size_bucket
+from utils import format_output_filename, task_logger, use_cases
+
+TASK_SOFT_TIME_LIMIT_SECONDS = float(os.getenv("TASK_SOFT_TIME_LIMIT_SECONDS", "1800"))
+TASK_HARD_TIME_LIMIT_SECONDS = float(os.getenv("TASK_HARD_TIME_LIMIT_SECONDS", "3600"))
+TIME_LIMIT_COST_FACTOR = float(os.getenv("TIME_LIMIT_COST_FACTOR", "10"))
+# A soft limit derived from the cost model is never shorter than this
+TIME_LIMIT_MIN_SECONDS = float(os.getenv("TIME_LIMIT_MIN_SECONDS", "60"))
+# Number of executions of a task and input size before its estimate is trusted
+TIME_LIMIT_MIN_SAMPLES = 5
+
+# The Celery time limits of a task back up the limits of its binary, in case the worker hangs
+CELERY_TIME_LIMIT_MARGIN_SECONDS = 60
+
+# Redis hash of the number of timeouts per task and limit
+TIMEOUTS_KEY_TEMPLATE = "task_timeouts:{}"
+
+
+class TaskTimeLimitExceeded(subprocess.TimeoutExpired):
+    """Raised when a binary is stopped at its soft or hard time limit."""
+
+    def __init__(self, cmd, timeout: float, limit: str, output=None, stderr=None):
+        super().__init__(cmd, timeout, output=output, stderr=stderr)
+        self.limit = limit
+
+
+def task_time_limits(redis_client, task_name: str, input_size: Optional[int]) -> Tuple[float, float]:
+    """Returns the soft and hard time limits of a task, in seconds.
+
+    Args:
+        redis_client: The Redis backend data-base, holding the cost model.
+        task_name (str): The name of the task.
+        input_size (Optional[int]): The size of its encrypted input in bytes, if known.
+    """
+    config = use_cases.get(task_name, {}).get("time_limit", {})
+    extra_seconds = float(config.get("seconds_per_mb", 0)) * (input_size or 0) / 1024 ** 2
+    soft = float(config.get("soft_seconds", TASK_SOFT_TIME_LIMIT_SECONDS)) + extra_seconds
+    hard = max(soft, float(config.get("hard_seconds", TASK_HARD_TIME_LIMIT_SECONDS)) + extra_seconds)
+
+    bucket = size_bucket(input_size)
+    if redis_client is not None and bucket is not None:
+        try:
+            count = int(redis_client.hget(BUCKET_COST_KEY_TEMPLATE.format(task_name, bucket), "count") or 0)
+            if count >= TIME_LIMIT_MIN_SAMPLES:
+                expected = expected_execution_time(redis_client, task_name, input_size)
+                cost_factor = float(config.get("cost_factor", TIME_LIMIT_COST_FACTOR))
+                soft = min(soft, max(TIME_LIMIT_MIN_SECONDS, cost_factor * expected))
+        except Exception as e:
+            task_logger.warning(f"⚠️ Failed to derive the time limit of `{task_name}` from the cost model: {e}")
+
+    return soft, hard
+
+
+def celery_time_limits(redis_client, task_name: str, input_size: Optional[int]) -> Dict[str, float]:
+    """Returns the `soft_time_limit` and `time_limit` options of the Celery task running a binary."""
+    _, hard = task_time_limits(redis_client, task_name, input_size)
+    return {
+        "soft_time_limit": hard + CELERY_TIME_LIMIT_MARGIN_SECONDS,
+        "time_limit": hard + 2 * CELERY_TIME_LIMIT_MARGIN_SECONDS,
+    }
+
+
+def run_with_time_limits(commandline, soft: float, hard: float, on_start=None, **popen_kwargs) -> subprocess.CompletedProcess:
+    """Runs a command in its own process group, like `subprocess.run(..., check=True)`.
+
+    `on_start`, if given, is called with the `subprocess.Popen` of the command once it is started.
+
+    Returns:
+        subprocess.CompletedProcess: The completed command, with its resource usage as returned
+            by `wait4` in the extra `rusage` attribute.
+
+    Raises:
+        subprocess.CalledProcessError: Raised if the command fails.
+        TaskTimeLimitExceeded: Raised if the command was stopped at its soft or hard limit.
+    """
+    process = subprocess.Popen(
+        commandline, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True, **popen_kwargs
+    )
+    child = _ChildProcess(process)
+    try:
+        if on_start is not None:
+            on_start(process)
+        if not child.wait(soft):
+            limit = "soft"
+            _signal_group(process, signal.SIGTERM)
+            if not child.wait(max(0.0, hard - soft)):
+                limit = "hard"
+                _signal_group(process, signal.SIGKILL)
+                child.wait()
+            raise TaskTimeLimitExceeded(commandline, soft if limit == "soft" else hard, limit, output=child.stdout, stderr=child.stderr)
+    except TaskTimeLimitExceeded:
+        raise
+    except BaseException:
+        # E.g. the Celery task is revoked: do not leave the binary behind
+        _signal_group(process, signal.SIGKILL)
+        child.wait()
+        raise
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, commandline, output=child.stdout, stderr=child.stderr)
+    completed = subprocess.CompletedProcess(commandline, process.returncode, child.stdout, child.stderr)
+    completed.rusage = child.rusage
+    return completed
+
+
+class _ChildProcess:
+    """Drains the pipes of a child process, and reaps it with `wait4` to get its resource usage."""
+
+    def __init__(self, process: subprocess.Popen):
+        self.process = process
+        self.stdout = ""
+        self.stderr = ""
+        self.rusage = None
+        self._threads = [
+            threading.Thread(target=self._drain, args=("stdout",), daemon=True),
+            threading.Thread(target=self._drain, args=("stderr",), daemon=True),
+            threading.Thread(target=self._reap, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _drain(self, name: str) -> None:
+        setattr(self, name, getattr(self.process, name).read())
+
+    def _reap(self) -> None:
+        _, status, self.rusage = os.wait4(self.process.pid, 0)
+        # Marks the process as reaped for `subprocess`
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the process to exit and its pipes to close; returns `False` on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+
+def _signal_group(process: subprocess.Popen, sig: int) -> None:
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def remove_partial_outputs(uid: str, task_name: str) -> None:
+    """Removes the outputs a stopped task may have partially written."""
+    for output_file in use_cases.get(task_name, {}).get("output_files", []):
+        format_output_filename(output_file["filename"], uid).unlink(missing_ok=True)
+
+
+def record_timeout(redis_client, task_name: str, limit: str) -> None:
+    key = TIMEOUTS_KEY_TEMPLATE.format(task_name)
+    pipe = redis_client.pipeline()
+    pipe.hincrby(key, limit, 1)
+    pipe.hset(key, "last_timeout_at", time.time())
+    pipe.execute()
+
+
+def timeout_stats(redis_client) -> Dict[str, Dict]:
+    """Returns the number of soft and hard timeouts of each task, and the time of the last one."""
+    stats = {}
+    for key in redis_client.scan_iter(TIMEOUTS_KEY_TEMPLATE.format("*")):
+        entry = redis_client.hgetall(key)
+        stats[key.split(":", 1)[1]] = {
+            "soft": int(entry.get("soft", 0)),
+            "hard": int(entry.get("hard", 0)),
+            "last_timeout_at": float(entry["last_timeout_at"]) if "last_timeout_at" in entry else None,
+        }
+    return stats
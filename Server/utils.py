@@ -2,13 +2,14 @@
 
 import os
 import logging
+import secrets
 import yaml 
 import datetime
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Union
-from glob import glob
-from fastapi import Form, Query, Request, HTTPException
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from fastapi import Form, Header, Query, Request, HTTPException
 from dotenv import load_dotenv, dotenv_values
 from werkzeug.utils import safe_join
 
@@ -32,9 +33,38 @@ assert BACKUP_DIR, "BACKUP_DIR must be set in the environment variables."
 BACKUP_FOLDER = Path(__file__).parent / BACKUP_DIR
 BACKUP_FOLDER.mkdir(exist_ok=True)
 
+# When enabled, task binaries write a JSON profile (FHE operation counts and phase timings)
+FHE_PROFILING = os.getenv("FHE_PROFILING", "false").lower() == "true"
+
+# `/start_task` rejects new tasks (HTTP 429) whose predicted queue wait exceeds this budget, in
+# seconds. `0` disables admission control. Tasks can override it in `tasks.yaml`.
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "0"))
+
+# `/add_key` enqueues the decompression of the new key, unless the target queue already holds
+# `KEY_WARMUP_MAX_QUEUED` tasks
+KEY_WARMUP = os.getenv("KEY_WARMUP", "false").lower() == "true"
+KEY_WARMUP_MAX_QUEUED = int(os.getenv("KEY_WARMUP_MAX_QUEUED", "4"))
+
+# `/start_task` enqueues the expansion of the input of the tasks with `prepare` in `tasks.yaml` on
+# the `prepare` queue, so that it runs while the task waits for a compute slot
+INPUT_PREPARATION = os.getenv("INPUT_PREPARATION", "false").lower() == "true"
+
+# `/add_key` checks the key, and `/start_task` the encrypted input, of the tasks with `validate` in
+# `tasks.yaml`, and reject invalid ones (HTTP 422)
+INPUT_VALIDATION = os.getenv("INPUT_VALIDATION", "true").lower() == "true"
+INPUT_VALIDATION_TIMEOUT_SECONDS = float(os.getenv("INPUT_VALIDATION_TIMEOUT_SECONDS", "30"))
+
+# Token expected in the `X-Admin-Token` header of the `/admin/*` endpoints, which are disabled
+# when it is empty
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Maximum number of tasks in a request to `/get_task_status_batch` or `/get_task_result_batch`
+BATCH_MAX_TASKS = int(os.getenv("BATCH_MAX_TASKS", "100"))
+
 LOG_LEVEL = os.getenv("CELERY_LOGLEVEL", "info").upper()
 LOG_FILE = Path(__file__).parent / "server.log"
-CONFIG_FILE = Path(__file__).parent / "tasks.yaml"
+# `TASKS_CONFIG_FILE` replaces the tasks, e.g. with stub binaries for `make benchmark_control_plane`
+CONFIG_FILE = Path(os.getenv("TASKS_CONFIG_FILE") or Path(__file__).parent / "tasks.yaml")
 
 
 class TaskLogger:
@@ -87,6 +117,14 @@ async def get_uid(request: Request, uid: str = Query(None), uid_form: str = Form
     return uid or uid_form or form_data.get("uid")
 
 
+async def verify_admin_token(x_admin_token: str = Header(None)) -> None:
+    """Rejects the requests to the `/admin/*` endpoints without a valid `X-Admin-Token` header."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (`ADMIN_TOKEN` is not set).")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid or missing `X-Admin-Token` header.")
+
+
 def secure_path(base_path: Path, user_input: str) -> Path:
     """Securely handle file paths by validating user input and ensuring it stays within the base directory.
     
@@ -114,6 +152,10 @@ def format_input_filename(uid: str, task_name: str) -> Path:
     return secure_path(FILES_FOLDER, f"{uid}.{task_name}.input.fheencrypted")
 
 
+def format_prepared_filename(uid: str, task_name: str) -> Path:
+    return secure_path(FILES_FOLDER, f"{uid}.{task_name}.prepared.fheencrypted")
+
+
 def format_output_filename(template: str, uid: str) -> Path:
     return secure_path(FILES_FOLDER, template.format(uid=uid))
 
@@ -122,6 +164,14 @@ def format_backup_filename(template: str, uid: str, task_id: str) -> Path:
     return secure_path(FILES_FOLDER, f"backup.{template.format(uid=f'{uid}.{task_id}')}")
 
 
+def format_profile_filename(uid: str, task_name: str, task_id: str) -> Path:
+    return secure_path(FILES_FOLDER, f"{uid}.{task_name}.{task_id}.profile.json")
+
+
+def format_flamegraph_filename(uid: str, task_name: str, task_id: str, target: str) -> Path:
+    return secure_path(FILES_FOLDER, f"{uid}.{task_name}.{task_id}.{target}.flamegraph.svg")
+
+
 def ensure_file_exists(file_path: Path, error_message: str) -> None:
     """Ensures that the specified file exists; otherwise, logs an error and raises an exception.
 
@@ -156,33 +206,55 @@ def fetch_backup_files(task_id: str, uid: str):
         sanitized_uid = secure_path(FILES_FOLDER, uid).name
     except HTTPException:
         raise HTTPException(status_code=400, detail="Invalid characters in task_id or uid")
-        
-    pattern_str = str(FILES_FOLDER / f"backup.{sanitized_uid}.{sanitized_task_id}.*output*.fheencrypted")
-    logger.debug(f"FETCH_BACKUP_FILES: Searching for pattern '{pattern_str}' for task_id={get_id_prefix(task_id)}, uid={get_id_prefix(uid)}")
-    
-    # Use glob with sanitized inputs
-    matching_files = glob(pattern_str)
-    logger.debug(f"FETCH_BACKUP_FILES: Glob found {len(matching_files)} files: {matching_files} for task_id={get_id_prefix(task_id)}")
+
+    prefix = f"backup.{sanitized_uid}.{sanitized_task_id}."
+    logger.debug(f"FETCH_BACKUP_FILES: Searching for prefix '{prefix}' for task_id={get_id_prefix(task_id)}, uid={get_id_prefix(uid)}")
+
+    matching_files = artifact_store.list(prefix, match=lambda name: "output" in name[len(prefix):] and name.endswith(".fheencrypted"))
+    logger.debug(f"FETCH_BACKUP_FILES: Found {len(matching_files)} files: {[str(f) for f, _ in matching_files]} for task_id={get_id_prefix(task_id)}")
 
     if not matching_files:
-        logger.debug(f"🔍 [task_id=`%s`, uid=`%s`] No backup files found with pattern '{pattern_str}'.", get_id_prefix(task_id), get_id_prefix(uid))
+        logger.debug(f"🔍 [task_id=`%s`, uid=`%s`] No backup files found with prefix '{prefix}'.", get_id_prefix(task_id), get_id_prefix(uid))
         return None
 
-    file = Path(matching_files[0])
-    # Verify the file is within FILES_FOLDER
-    try:
-        file.resolve().relative_to(FILES_FOLDER.resolve())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid file path detected")
-        
-    last_mtime = file.stat().st_mtime
+    last_mtime = matching_files[0][1]
     formatted_date = datetime.datetime.fromtimestamp(last_mtime).strftime("%Y-%m-%d %H:%M:%S")
-    logger.debug(f"FETCH_BACKUP_FILES: Returning backup info for task_id={get_id_prefix(task_id)}. Files: {[str(f) for f in matching_files]}, Timestamp: {formatted_date}")
-    return {'files': [str(f) for f in matching_files], 'timestamp': formatted_date}
+    logger.debug(f"FETCH_BACKUP_FILES: Returning backup info for task_id={get_id_prefix(task_id)}. Files: {[str(f) for f, _ in matching_files]}, Timestamp: {formatted_date}")
+    return {'files': [str(f) for f, _ in matching_files], 'timestamp': formatted_date}
+
+
+def fetch_backup_files_batch(tasks: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Dict]:
+    """Retrieve the backup files of many tasks, listing the exact prefix of each task concurrently.
+
+    Each listing only covers the backups of its task, so the latency follows the size of the
+    batch (at most `BATCH_MAX_TASKS`), not the number of backups in the artifact store.
+
+    Args:
+        tasks (List[Tuple[str, str]]): The (task_id, uid) pairs of the tasks.
+
+    Returns:
+        The matching backup file paths and the last modification timestamp, as returned by
+        `fetch_backup_files`, of each (task_id, uid) pair that has backup files.
+    """
+    def fetch(task: Tuple[str, str]) -> Optional[Dict]:
+        try:
+            return fetch_backup_files(*task)
+        except HTTPException:
+            # A task ID or UID with invalid characters has no backup
+            return None
+
+    if not tasks:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(tasks), BATCH_MAX_TASKS)) as executor:
+        results = list(executor.map(fetch, tasks))
+
+    backups = {task: backup for task, backup in zip(tasks, results) if backup is not None}
+    logger.debug(f"FETCH_BACKUP_FILES_BATCH: Found backup files for {len(backups)} of {len(tasks)} tasks.")
+    return backups
 
 
 def fetch_file_content(output_file_path: Path):
-    """Reads a file and returns its content.
+    """Reads a file from the artifact store and returns its content.
 
     Args:
         output_file_path (Path): The path of the file to read.
@@ -191,17 +263,18 @@ def fetch_file_content(output_file_path: Path):
         bytes: The content of the file.
 
     Raises:
-        HTTPException: Raised with status code 500 if the file cannot be read.
+        HTTPException: Raised with status code 500 if the file does not exist or cannot be read.
     """
     logger.debug(f"FETCH_FILE_CONTENT: Attempting to read {output_file_path}")
-    ensure_file_exists(
-        output_file_path, error_message=f"❌ FETCH_FILE_CONTENT: Output file `{output_file_path}` not found."
-    )
     try:
-        data = output_file_path.read_bytes()
+        data = artifact_store.read(output_file_path)
         logger.info(
             f"📁 FETCH_FILE_CONTENT: Successfully read output file `{output_file_path}` (Size: `{len(data)}` bytes)"
         )
+    except FileNotFoundError:
+        error_message = f"❌ FETCH_FILE_CONTENT: Output file `{output_file_path}` not found."
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
     except Exception as e:
         error_message=f"❌ FETCH_FILE_CONTENT: Failed to read output file `{output_file_path}`: `{e}`."
         logger.error(error_message)
@@ -209,22 +282,46 @@ def fetch_file_content(output_file_path: Path):
     return data
 
 
-def save_backup_file(backup_path, data) -> None:
-    """Save  data to a backup file.
+def stream_file_content(output_file_path: Path) -> Tuple[Iterator[bytes], int]:
+    """Opens a file of the artifact store to be sent by chunks, without reading it in memory.
 
     Args:
-        backup_path (Path): The path where the backup file should be saved.
-        data (bytes): The binary data.
+        output_file_path (Path): The path of the file to read.
 
     Returns:
-        None
+        Tuple[Iterator[bytes], int]: The chunks of the file, and its size in bytes.
+
+    Raises:
+        HTTPException: Raised with status code 500 if the file does not exist or cannot be read.
+    """
+    logger.debug(f"STREAM_FILE_CONTENT: Attempting to open {output_file_path}")
+    try:
+        size, _ = artifact_store.stat(output_file_path)
+        chunks = artifact_store.stream(output_file_path)
+    except FileNotFoundError:
+        error_message = f"❌ STREAM_FILE_CONTENT: Output file `{output_file_path}` not found."
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+    except Exception as e:
+        error_message = f"❌ STREAM_FILE_CONTENT: Failed to open output file `{output_file_path}`: `{e}`."
+        logger.error(error_message)
+        raise HTTPException(status_code=500, detail=error_message)
+    return chunks, size
+
+
+def copy_backup_file(output_path: Path, backup_path: Path) -> None:
+    """Copies an output file to its backup, within the artifact store.
+
+    Args:
+        output_path (Path): The path of the output file.
+        backup_path (Path): The path where the backup file should be saved.
     """
-    logger.debug(f"SAVE_BACKUP_FILE: Attempting to write backup to {backup_path} (Size: {len(data)} bytes)")
+    logger.debug(f"COPY_BACKUP_FILE: Attempting to copy {output_path} to {backup_path}")
     try:
-        backup_path.write_bytes(data)
-        logger.debug(f"💾 SAVE_BACKUP_FILE: Successfully saved backup file at `{backup_path}`.")
+        artifact_store.copy(output_path, backup_path)
+        logger.debug(f"💾 COPY_BACKUP_FILE: Successfully saved backup file at `{backup_path}`.")
     except Exception as e:
-        logger.warning(f"🚨 SAVE_BACKUP_FILE: Failed to create backup `{backup_path}`: {e}.")
+        logger.warning(f"🚨 COPY_BACKUP_FILE: Failed to create backup `{backup_path}`: {e}.")
 
 
 def get_id_prefix(_id: str) -> Union[str, None]:
@@ -262,3 +359,9 @@ try:
 except Exception as e:
     logger.error("❌ Failed to load configuration file `%s`: `%s`", CONFIG_FILE, e)
     raise e
+
+# Artifact storage (see storage.py), which reads its settings from the environment loaded above
+from storage import STORAGE_BACKEND, create_storage
+
+artifact_store = create_storage(FILES_FOLDER)
+logger.debug("🗄️ Artifacts stored with the `%s` backend", STORAGE_BACKEND)
@@ -0,0 +1,192 @@
+"""Registry of the Celery workers and of the tasks they hold, published to Redis by the workers.
+
+The main process of each worker publishes its state to a Redis hash, under its node name: the
+tasks it is executing (`active`) and has prefetched (`reserved`), its queues, the keys in its key
+cache, its load and the time of the publication. It republishes as soon as its tasks change,
+which it checks every `WORKER_STATE_POLL_SECONDS`, and at least every `WORKER_STATE_HEARTBEAT_SECONDS`.
+
+The API reads the state of all the workers with one `HGETALL`, instead of broadcasting `inspect`
+commands and waiting up to their timeout for the replies. A worker that has not published for
+`WORKER_STATE_TTL_SECONDS` is considered dead.
+
+The workers also sweep the registry, one of them every `WORKER_STATE_HEARTBEAT_SECONDS`: the dead
+workers are dropped, and the tasks left in the own queue of a worker (`usecases.<hostname>`, see
+`routing.py`) that no live worker consumes are moved back to the shared `usecases` queue. Such a
+queue is swept until the messages the dead worker had not acknowledged are restored to it, after
+the visibility timeout of the broker (see `lease.py`), and is forgotten once empty.
+"""
+
+import json
+import os
+import threading
+import time
+
+from typing import Callable, Dict, Iterable, List
+
+from celery.worker import state as worker_state
+
+from lease import VISIBILITY_TIMEOUT
+from utils import logger
+
+# Redis hash of the state of each worker, by node name (`celery@<hostname>`)
+WORKER_STATES_KEY = "worker_states"
+WORKER_STATE_POLL_SECONDS = 0.2
+WORKER_STATE_HEARTBEAT_SECONDS = 5
+WORKER_STATE_TTL_SECONDS = 3 * WORKER_STATE_HEARTBEAT_SECONDS
+
+# Redis hash of the own queues of the workers, with the last time a live worker consumed them, and
+# key held by the worker sweeping the registry
+WORKER_QUEUES_KEY = "worker_queues"
+WORKER_SWEEP_KEY = "worker_registry_sweep"
+# An orphaned queue is swept for this long after its last consumer was seen, until the broker has
+# restored its unacknowledged messages (after the visibility timeout, checked periodically)
+ORPHANED_QUEUE_TTL_SECONDS = 2 * VISIBILITY_TIMEOUT + WORKER_STATE_TTL_SECONDS
+
+# Shared queue of the `usecases` workers, and own queue of each worker host
+USECASE_QUEUE = "usecases"
+WORKER_QUEUE_TEMPLATE = "usecases.{}"
+
+
+def worker_queue(hostname: str) -> str:
+    return WORKER_QUEUE_TEMPLATE.format(hostname)
+
+
+def is_worker_queue(queue: str) -> bool:
+    return queue.startswith(WORKER_QUEUE_TEMPLATE.format(""))
+
+
+def request_info(request) -> Dict:
+    return {
+        "task_id": request.id,
+        "name": request.name,
+        "started_at": request.time_start,
+        "worker_pid": request.worker_pid,
+    }
+
+
+def _copy(requests) -> List:
+    """Copies a set of requests that the main thread of the worker may be updating."""
+    while True:
+        try:
+            return list(requests)
+        except RuntimeError:
+            continue
+
+
+def worker_tasks() -> Dict[str, List[Dict]]:
+    """Returns the tasks held by this worker process, as `inspect active` and `inspect reserved` do."""
+    active = _copy(worker_state.active_requests)
+    active_ids = {request.id for request in active}
+    reserved = [request for request in _copy(worker_state.reserved_requests) if request.id not in active_ids]
+    return {"active": [request_info(r) for r in active], "reserved": [request_info(r) for r in reserved]}
+
+
+class WorkerStatePublisher:
+    """Publishes the state of a worker from a background thread of its main process.
+
+    Args:
+        redis_client: The Redis client of the registry.
+        node_name (str): The node name of the worker.
+        queues (Iterable[str]): The queues the worker consumes.
+        concurrency (int): The number of tasks the worker runs at the same time.
+        cached_keys (Callable[[], List[str]]): Returns the UIDs of the keys in the key cache.
+    """
+
+    def __init__(self, redis_client, node_name: str, queues: Iterable[str], concurrency: int, cached_keys: Callable[[], List[str]]):
+        self.redis = redis_client
+        self.node_name = node_name
+        self.queues = sorted(queues)
+        self.concurrency = concurrency
+        self.cached_keys = cached_keys
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="worker-state", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        logger.info(f"📡 Worker `{self.node_name}` publishes its state to `{WORKER_STATES_KEY}`.")
+
+    def stop(self) -> None:
+        """Stops publishing, and removes the worker from the registry."""
+        self._stop.set()
+        try:
+            self.redis.hdel(WORKER_STATES_KEY, self.node_name)
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to unregister worker `{self.node_name}`: {e}")
+
+    def publish(self, tasks: Dict[str, List[Dict]]) -> None:
+        entry = {
+            **tasks,
+            "queues": self.queues,
+            "concurrency": self.concurrency,
+            "cached_keys": self.cached_keys(),
+            "load": os.getloadavg()[0],
+            "last_seen": time.time(),
+        }
+        pipeline = self.redis.pipeline()
+        pipeline.hset(WORKER_STATES_KEY, self.node_name, json.dumps(entry))
+        worker_queues = {queue: entry["last_seen"] for queue in self.queues if is_worker_queue(queue)}
+        if worker_queues:
+            pipeline.hset(WORKER_QUEUES_KEY, mapping=worker_queues)
+        pipeline.execute()
+
+    def _run(self) -> None:
+        published_ids, published_at, swept_at = None, 0.0, 0.0
+        while not self._stop.wait(WORKER_STATE_POLL_SECONDS):
+            if time.monotonic() - swept_at >= WORKER_STATE_HEARTBEAT_SECONDS:
+                swept_at = time.monotonic()
+                try:
+                    # One worker sweeps per heartbeat
+                    if self.redis.set(WORKER_SWEEP_KEY, self.node_name, nx=True, ex=WORKER_STATE_HEARTBEAT_SECONDS):
+                        sweep_registry(self.redis)
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to sweep the worker registry: {e}")
+            tasks = worker_tasks()
+            task_ids = {state: [task["task_id"] for task in entries] for state, entries in tasks.items()}
+            if task_ids == published_ids and time.monotonic() - published_at < WORKER_STATE_HEARTBEAT_SECONDS:
+                continue
+            try:
+                self.publish(tasks)
+                published_ids, published_at = task_ids, time.monotonic()
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to publish the state of worker `{self.node_name}`: {e}")
+                self._stop.wait(WORKER_STATE_HEARTBEAT_SECONDS)
+
+
+def registered_workers(redis_client) -> Dict[str, Dict]:
+    """Returns the state of all the registered workers, by node name, with an `alive` flag."""
+    now = time.time()
+    workers = {}
+    for node_name, raw in redis_client.hgetall(WORKER_STATES_KEY).items():
+        entry = json.loads(raw)
+        entry["alive"] = now - entry["last_seen"] <= WORKER_STATE_TTL_SECONDS
+        workers[node_name] = entry
+    return workers
+
+
+def sweep_registry(redis_client) -> None:
+    """Drops the dead workers from the registry, and moves the tasks of the own queues that no live
+    worker consumes back to the shared queue."""
+    workers = registered_workers(redis_client)
+    for node_name, entry in workers.items():
+        if not entry["alive"]:
+            redis_client.hdel(WORKER_STATES_KEY, node_name)
+            logger.warning(f"📡 Worker `{node_name}` stopped publishing its state, and was dropped from the registry.")
+
+    live_queues = {queue for entry in workers.values() if entry["alive"] for queue in entry["queues"]}
+    now = time.time()
+    for queue, last_seen in redis_client.hgetall(WORKER_QUEUES_KEY).items():
+        if queue in live_queues:
+            continue
+        moved = 0
+        # Oldest tasks first: they are consumed after the tasks already waiting in the shared queue
+        while redis_client.rpoplpush(queue, USECASE_QUEUE) is not None:
+            moved += 1
+        if moved:
+            logger.warning(f"📡 `{moved}` task(s) of `{queue}`, which no live worker consumes, moved back to the shared queue.")
+        if now - float(last_seen) > ORPHANED_QUEUE_TTL_SECONDS:
+            redis_client.hdel(WORKER_QUEUES_KEY, queue)
+
+
+def worker_states(redis_client) -> Dict[str, Dict]:
+    """Returns the state of the live workers, by node name."""
+    return {node_name: entry for node_name, entry in registered_workers(redis_client).items() if entry.pop("alive")}